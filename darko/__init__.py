@@ -1,4 +1,5 @@
 import logging.config
+import multiprocessing
 import os
 
 # Importing common functions and version tags
@@ -6,24 +7,28 @@ from .common import commons, get_git_revision_tag
 from ._version import __version__
 
 # Importing the main DARKO preprocessing functions so that they can be called with "dk.function"
-from .preprocessing.data_handler import load_config_excel
-from .preprocessing.preprocessing import build_simulation
+from .preprocessing.data_handler import load_config, load_config_excel, load_config_yaml, export_config
+from .preprocessing.preprocessing import build_simulation, build_many
 from .postprocessing.postprocessing import plot_net_positions, get_net_position_plot_data, plot_market_clearing_price, \
     get_marginal_price_plot_data
 
 # Importing the main DARKO solve functions
-from .solve import solve_GAMS
+from .solve import solve_GAMS, solve_simdata
+from .native import solve_native, solve_whatif
 
 # Importing the main postprocessing functions
-from .postprocessing.data_handler import get_sim_results, dk_to_df
+from .postprocessing.data_handler import get_sim_results, dk_to_df, format_inputs, format_results, SimResults, \
+    load_many
+from .pipeline import run_pipeline
 from .cli import *
 
-# Remove old log file:
-for filename in (f for f in os.listdir('.') if f.endswith('.darko.log')):
-    try:
-        os.remove(filename)
-    except OSError:
-        print('Could not erase previous log file ' + filename)
+# Remove old log file (not in the worker processes of build_many, which would erase the log of the parent process):
+if multiprocessing.current_process().name == 'MainProcess':
+    for filename in (f for f in os.listdir('.') if f.endswith('.darko.log')):
+        try:
+            os.remove(filename)
+        except OSError:
+            print('Could not erase previous log file ' + filename)
 
 # Logging: # TODO: Parametrize in darko cli or external config
 _LOGCONFIG = {
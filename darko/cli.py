@@ -2,7 +2,7 @@ import sys
 import logging
 import click
 
-from .preprocessing.data_handler import load_config
+from .preprocessing.data_handler import load_config, export_config
 from .preprocessing.preprocessing import build_simulation
 from .solve import solve_GAMS
 from . import __version__
@@ -16,22 +16,64 @@ from . import __version__
 def cli(ctx, config):
     """Build and run the DARKO model according to a config file.
      E.g. darko -c ./ConfigFiles/ConfigTest.xlsx build simulate
+     or darko -c ./ConfigFiles/ConfigTest.xlsx config export ./ConfigFiles/ConfigTest.yml
     """
-    ctx.obj = {'conf': load_config(config)}
+    ctx.obj = {'conf': load_config(config), 'config_file': config}
 
 
 @cli.command()
+@click.option('--relaxed', type=click.Choice(['lp', 'round']), default=None,
+              help='Screening mode: solve the LP relaxation (lp), or fix the rounded block and flexible orders and '
+                   'solve the LP again for the prices (round)')
+@click.option('--gap-sample', type=int, default=0,
+              help='Relaxed mode: solve the MIP as well every N horizons to report the welfare gap')
+@click.option('--preselect', type=float, default=None,
+              help='Fix the block orders that are clearly in or out of the money in the LP relaxation, with the given '
+                   'margin on the zonal prices (e.g. 0.1)')
+@click.option('--aggregate', is_flag=True,
+              help='Merge the equivalent simple and demand orders (same zone, technology, ramping limits and prices) '
+                   'into aggregate orders')
 @click.pass_context
-def build(ctx):
+def build(ctx, relaxed, gap_sample, preselect, aggregate):
     """Build simulation files"""
     conf = ctx.obj['conf']
+    if relaxed is not None:
+        conf['RelaxedMode'] = {'lp': 1, 'round': 2}[relaxed]
+        conf['RelaxedGapSample'] = gap_sample
+    if preselect is not None:
+        conf['BlockPreselection'] = preselect
+    if aggregate:
+        conf['OrderAggregation'] = 1
     __ = build_simulation(ctx.obj['conf'])
 
 
 @cli.command()
+@click.option('--backend', type=click.Choice(['gams', 'native']), default='gams',
+              help='Solve with GAMS (default) or with the native open-source backend (HiGHS)')
+@click.option('--parallel', is_flag=True,
+              help='Native backend: solve the horizons in parallel, with the storage levels of a coarse pre-pass')
 @click.pass_context
-def simulate(ctx):
-    """Run GAMS for simulation"""
+def simulate(ctx, backend, parallel):
+    """Run GAMS (or the native backend) for simulation"""
     conf = ctx.obj['conf']
 
-    r = solve_GAMS(conf['SimulationDirectory'], conf['GAMS_folder'])
+    if backend == 'native':
+        import os
+        import pandas as pd
+        from .native import solve_native, write_raw_results
+        SimData = pd.read_pickle(os.path.join(conf['SimulationDirectory'], 'Inputs.p'))
+        raw = solve_native(SimData, parallel=parallel)
+        write_raw_results(raw, SimData, os.path.join(conf['SimulationDirectory'], 'Results.gdx'),
+                          gams_dir=conf['GAMS_folder'])
+    else:
+        r = solve_GAMS(conf['SimulationDirectory'], conf['GAMS_folder'])
+
+
+@cli.command('config')
+@click.argument('action', type=click.Choice(['export']))
+@click.argument('output', type=click.Path())
+@click.pass_context
+def config_cmd(ctx, action, output):
+    """Export the config file to yaml or json (eg config export ConfigFiles/Config.yml)"""
+    if action == 'export':
+        export_config(ctx.obj['config_file'], output)
@@ -2,9 +2,12 @@
 """
 This file defines a dictionary with global variables to be used in DARKO such as fluids, technologies, etc.
 """
+import contextlib
 import datetime
+import logging
 import os
 import shutil
+import threading
 
 commons = {}
 # Timestep
@@ -47,7 +50,11 @@ commons['hatches'] = {'LIG': '', 'PEA': '', 'HRD': '', 'OIL': '',
                       'WST': '', 'OTH': ''
                       }
 
-commons['logfile'] = str(datetime.datetime.now()).replace(':', '-').replace(' ', '_') + '.darko.log'
+commons['logfile'] = str(datetime.datetime.now()).replace(':', '-').replace(' ', '_') + '_' + str(os.getpid()) + \
+                     '.darko.log'
+# Folder in which the parsed csv files are cached. It is shared between builds and can be overwritten with the
+# DARKO_CACHE environment variable or with the 'CacheFolder' field of the config:
+commons['CacheFolder'] = os.environ.get('DARKO_CACHE', os.path.join(os.path.expanduser('~'), '.darko', 'cache'))
 
 
 def get_git_revision_tag():
@@ -68,3 +75,39 @@ def set_log_name(sim_folder, name):
     """
     if os.path.isfile(commons['logfile']):
         shutil.copy(commons['logfile'], os.path.join(sim_folder, name + '.log'))
+
+
+class _ThreadFilter(logging.Filter):
+    """
+    Logging filter that only lets through the records emitted by the thread that created it
+    """
+
+    def __init__(self):
+        super(_ThreadFilter, self).__init__()
+        self.thread = threading.get_ident()
+
+    def filter(self, record):
+        return record.thread == self.thread
+
+
+@contextlib.contextmanager
+def log_to_folder(sim_folder, name):
+    """
+    Context manager writing the log records of the current thread directly to a log file in the simulation folder.
+    Contrary to set_log_name, which copies the global log file, it is safe when several simulations are built or
+    solved at the same time.
+
+    :param sim_folder:  sim folder
+    :param name:        can be warn_preprocessing, warn_solve....
+    """
+    handler = logging.FileHandler(os.path.join(sim_folder, name + '.log'), mode='w', encoding='utf8')
+    handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)-8s] (%(funcName)s): %(message)s',
+                                           datefmt='%y/%m/%d %H:%M:%S'))
+    handler.addFilter(_ThreadFilter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        yield handler
+    finally:
+        root.removeHandler(handler)
+        handler.close()
@@ -0,0 +1,91 @@
+"""
+Collector for the repetitive messages emitted while building a DARKO simulation.
+
+The data loading functions (UnitBasedTable, select_units, interconnections, ...) used to send one log record per
+unit, table or line to the console and file handlers. Instead, the events are now counted and grouped by table and
+reason. A compact summary is logged once and the full list of events can be written to a machine-readable report.
+
+Example::
+
+    diag = Diagnostics()
+    diag.add('PriceSimpleOrder', 'Using default value 0', 'Z1_HOBO_GAS', level=logging.INFO)
+    diag.summary()
+    diag.write('Simulations/simulationTest/Diagnostics.json')
+
+@author: Matija Pavičević
+"""
+
+import json
+import logging
+from collections import OrderedDict
+
+
+class Diagnostics(object):
+    """
+    Structured collector of build events, grouped by table and reason
+
+    :param max_examples:    Number of items quoted as examples in the summary of each group
+    """
+
+    def __init__(self, max_examples=5):
+        self.max_examples = max_examples
+        self.groups = OrderedDict()
+
+    def add(self, table, reason, item=None, level=logging.WARNING):
+        """
+        Record a single event
+
+        :param table:   Name of the table (or processing step) in which the event occurred
+        :param reason:  Short description of the event, shared by all the items of the group
+        :param item:    Unit, demand, line or zone concerned by the event (optional)
+        :param level:   Logging level used when the group is summarized
+        """
+        key = (table, reason)
+        if key not in self.groups:
+            self.groups[key] = {'level': level, 'count': 0, 'items': []}
+        group = self.groups[key]
+        group['count'] += 1
+        group['level'] = max(group['level'], level)
+        if item is not None:
+            group['items'].append(str(item))
+
+    def __len__(self):
+        return sum(group['count'] for group in self.groups.values())
+
+    def summary(self):
+        """
+        Log one line per (table, reason) group with the number of occurrences and a few examples
+        """
+        for (table, reason), group in self.groups.items():
+            msg = reason
+            if table:
+                msg = 'Table ' + table + ': ' + msg
+            items = group['items']
+            if len(items) == 1:
+                msg += ' (' + items[0] + ')'
+            elif len(items) > 1:
+                msg += ' (' + str(group['count']) + ' occurrences, e.g. ' + ', '.join(items[:self.max_examples])
+                if len(items) > self.max_examples:
+                    msg += ', ...'
+                msg += ')'
+            logging.log(group['level'], msg)
+
+    def to_dict(self):
+        """
+        Machine-readable version of the collected events
+
+        :returns:   List of dictionaries, one per (table, reason) group
+        """
+        return [{'table': table, 'reason': reason, 'level': logging.getLevelName(group['level']),
+                 'count': group['count'], 'items': group['items']}
+                for (table, reason), group in self.groups.items()]
+
+    def write(self, path):
+        """
+        Write the collected events to a json report
+
+        :param path:    Path to the report file (e.g. Diagnostics.json in the simulation folder)
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        logging.debug('Diagnostics report written to ' + path)
@@ -5,11 +5,11 @@ with one excel file per parameter.
 Example:
     read gdx file::
 
-        data = GdxToList(gams_dir,'Results.gdx',varname='all',verbose=True)
+        data = gdx_to_arrays(gams_dir,'Results.gdx',varname='all',verbose=True)
 
     write it to a dictionary of dataframes::
 
-        dataframes = GdxToDataframe(data,fixindex=True,verbose=True)
+        dataframes = gdx_to_dataframe(data,fixindex=True,verbose=True)
 
 @author: Matija Pavičević
 
@@ -89,35 +89,100 @@ else:
         import gdxcc
 
 
+def _register_uels(gdxHandle, sets):
+    """
+    Register all the set elements (UELs) once, in the order in which the sets are defined, so that the symbols can
+    then be written with integer (raw) keys.
+
+    :param gdxHandle:   gdx handle opened for writing
+    :param sets:        dictionary with all the sets
+    :returns:           dictionary with, for each set, the array of the raw UEL numbers of its elements
+    """
+    uels = {}
+    set_uels = {}
+    gdxcc.gdxUELRegisterRawStart(gdxHandle)
+    for s in sets:
+        # Reduce the size if bigger than 64 characters:
+        keys = shrink_to_64([str(ss) for ss in sets[s]])
+        codes = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            if key not in uels:
+                uels[key] = len(uels) + 1  # raw UEL numbers start at 1
+                if not gdxcc.gdxUELRegisterRaw(gdxHandle, key):
+                    logging.error('Key ' + key + ' of set ' + s + ' could not be registered')
+            codes[i] = uels[key]
+        set_uels[s] = codes
+    gdxcc.gdxUELRegisterDone(gdxHandle)
+    return set_uels
+
+
+def _write_raw(gdxHandle, name, symbol_type, keys, values):
+    """
+    Write one symbol from arrays of raw UEL numbers and values. Records must be sorted by raw key for the raw
+    writing mode, hence the lexicographic sort of the keys.
+
+    :param name:        Name of the symbol
+    :param symbol_type: gdxcc.GMS_DT_SET or gdxcc.GMS_DT_PAR
+    :param keys:        Integer array (records x dimensions) with the raw UEL numbers
+    :param values:      Float array with the value of each record
+    :returns:           Number of records that could not be written
+    """
+    dims = keys.shape[1]
+    gdxcc.gdxDataWriteRawStart(gdxHandle, name, "", dims, symbol_type, 0)
+    order = np.lexsort(keys.T[::-1])
+    keys = keys[order]
+    values = values[order].astype(float)
+    gdxKeys = gdxcc.intArray(gdxcc.GMS_MAX_INDEX_DIM)
+    gdxValues = gdxcc.doubleArray(gdxcc.GMS_VAL_MAX)
+    level = gdxcc.GMS_VAL_LEVEL
+    write = gdxcc.gdxDataWriteRaw
+    errors = 0
+    if dims == 0:
+        for value in values.tolist():
+            gdxValues[level] = value
+            errors += not write(gdxHandle, gdxKeys, gdxValues)
+    else:
+        # The leading keys only change between blocks of records sharing the same prefix (e.g. the same unit), so
+        # that only the last key is updated for each record. Python lists are much faster to iterate than numpy
+        # scalars.
+        last = dims - 1
+        starts = np.flatnonzero(np.any(keys[1:, :last] != keys[:-1, :last], axis=1)) + 1
+        bounds = [0] + starts.tolist() + [len(keys)]
+        prefixes = keys[bounds[:-1], :last].tolist() if len(keys) else []
+        last_keys = keys[:, last].tolist()
+        values = values.tolist()
+        for start, stop, prefix in zip(bounds[:-1], bounds[1:], prefixes):
+            for i in range(last):
+                gdxKeys[i] = prefix[i]
+            for key, value in zip(last_keys[start:stop], values[start:stop]):
+                gdxKeys[last] = key
+                gdxValues[level] = value
+                errors += not write(gdxHandle, gdxKeys, gdxValues)
+    gdxcc.gdxDataWriteDone(gdxHandle)
+    return errors
+
+
 def _insert_symbols(gdxHandle, sets, parameters):
     """
     Function that writes all sets and parameters to the gdxHandle
 
+    The set elements are registered once as UELs. The nonzero cells of each parameter are located with np.nonzero
+    and written in bulk with their integer keys, instead of looping over all the cells with string keys.
+
     :param sets: dictionary with all the sets
     :param parameters: dictionary with all the parameters
     """
 
-    # It is essential to write the sets first, otherwise h might be written in the wrong order
-    for s in sets:
-        gdxSymbolType = gdxcc.GMS_DT_SET
-        dims = 1
-
-        gdxcc.gdxDataWriteStrStart(gdxHandle, s, "", dims, gdxSymbolType, 0)
-        gdxValues = gdxcc.doubleArray(5)
-        gdxValues[gdxcc.GMS_VAL_LEVEL] = 0.0  # 0.0 == Y (explanatory text of set in gdx)
-
-        Nrows = len(sets[s])
+    # It is essential to register the sets first, otherwise h might be written in the wrong order
+    set_uels = _register_uels(gdxHandle, sets)
 
-        for row in range(Nrows):
-            gdxKeys = [str(ss) for ss in shrink_to_64([sets[s][row]])]  # Reduce the size if bigger than 64 characters
-            try:
-                success = gdxcc.gdxDataWriteStr(gdxHandle, gdxKeys, gdxValues)
-            except:
-                success = False
-            if not success:
-                logging.error('Key ' + gdxKeys[0] + ' of set ' + s + ' could not be written')
-
-        gdxcc.gdxDataWriteDone(gdxHandle)
+    for s in sets:
+        # Duplicate elements are only written once:
+        keys = np.unique(set_uels[s]).reshape(-1, 1)
+        errors = _write_raw(gdxHandle, s, gdxcc.GMS_DT_SET, keys, np.zeros(len(keys)))
+        if errors:
+            logging.error(str(errors) + ' keys of set ' + s + ' could not be written')
+        logging.debug('Set ' + s + ' successfully written')
 
     # Check array sizes for parameters:
     for p in parameters:
@@ -125,13 +190,8 @@ def _insert_symbols(gdxHandle, sets, parameters):
 
         # Check that the required fields are present:
         dims = len(variable['sets'])
-        shape = variable['val'].shape
-        Nrows = variable['val'].shape[0]
-        gdxSymbolType = gdxcc.GMS_DT_PAR
-
-        gdxcc.gdxDataWriteStrStart(gdxHandle, p, "", dims, gdxSymbolType, 0)
-        gdxValues = gdxcc.doubleArray(5)
-        gdxValues[gdxcc.GMS_VAL_LEVEL] = 0.0  # 0.0 == Y (explanatory text of set in gdx)
+        val = np.asarray(variable['val'])
+        shape = val.shape
 
         if len(shape) != dims:
             logging.error('Variable ' + p + ': The \'val\' data matrix has ' + str(
@@ -145,28 +205,19 @@ def _insert_symbols(gdxHandle, sets, parameters):
                     ' while there are ' + str(len(variable['sets'])) + ' set values')
                 sys.exit(1)
 
-        for index, value in np.ndenumerate(variable['val']):
-            # Write line by line if value is non null
-            if value != 0 and not pd.isnull(value):
-                gdxKeys = []  # All the set values for this line
-                for i in range(dims):
-                    key = sets[variable['sets'][i]][
-                        index[i]]  # Get the string value of the set by using the indice in the val matrix
-                    gdxKeys.append(str(key))
-                gdxKeys = shrink_to_64(gdxKeys)  # Reduce the size if bigger than 64 characters
-                gdxValues[gdxcc.GMS_VAL_LEVEL] = float(value)
-                try:
-                    success = gdxcc.gdxDataWriteStr(gdxHandle, gdxKeys, gdxValues)
-                except:
-                    logging.error("Didn't work")
-                    success = False
-                if not success:
-                    logging.error('Key ' + gdxKeys[0] + ' of parameter ' + p + ' could not be written')
-        gdxcc.gdxDataWriteDone(gdxHandle)
+        # Only the non null values are written:
+        if val.dtype == object:
+            val = pd.to_numeric(val.ravel(), errors='coerce').reshape(shape)
+        val = val.astype(float)
+        index = np.nonzero((val != 0) & ~np.isnan(val))
+        keys = np.empty((len(index[0]), dims), dtype=np.int64)
+        for i in range(dims):
+            keys[:, i] = set_uels[variable['sets'][i]][index[i]]
+        errors = _write_raw(gdxHandle, p, gdxcc.GMS_DT_PAR, keys, val[index])
+        if errors:
+            logging.error(str(errors) + ' keys of parameter ' + p + ' could not be written')
         logging.debug('Parameter ' + p + ' successfully written')
 
-    logging.debug('Set ' + s + ' successfully written')
-
 
 def write_variables(gams_dir, gdx_out, list_vars):
     """
@@ -265,61 +316,183 @@ def gdx_to_list(gams_dir, filename, varname='all', verbose=False):
     return out
 
 
+class GdxReader(object):
+    """
+    Handle on a gdx file opened for reading. The unique elements (UELs) and the list of symbols are read when the
+    file is opened, the records of each symbol are read on request with their raw integer keys::
+
+        with GdxReader(gams_dir, 'Results.gdx') as gdx:
+            prices = gdx.read('OutputMarginalPrice')
+
+    :param gams_dir:    Gams working directory
+    :param filename:    Path to the gdx file to be read
+    """
+
+    def __init__(self, gams_dir, filename):
+        # make sure the file path is properly formatted:
+        filename = filename.replace('/', os.path.sep).replace('\\\\', os.path.sep).replace('\\', os.path.sep)
+        self.filename = str(filename)  # removing possible unicode formatting
+
+        if not os.path.isfile(self.filename):
+            logging.critical('Gdx file "' + self.filename + '" does not exist')
+            sys.exit(1)
+
+        self.handle = gdxcc.new_gdxHandle_tp()
+        gdxcc.gdxCreateD(self.handle, force_str(gams_dir), gdxcc.GMS_SSSIZE)
+        gdxcc.gdxOpenRead(self.handle, self.filename)
+
+        # Unique elements, read once (UEL numbers start at 1):
+        NrUels = gdxcc.gdxUMUelInfo(self.handle)[1]
+        self.uels = np.array([''] + [gdxcc.gdxUMUelGet(self.handle, i)[1] for i in range(1, NrUels + 1)],
+                             dtype=object)
+
+        # Symbols: name -> (number, dimension, number of records)
+        self.symbols = {}
+        for symNr in range(gdxcc.gdxSystemInfo(self.handle)[1] + 1):
+            ret, name, dims, typ = gdxcc.gdxSymbolInfo(self.handle, symNr)
+            self.symbols[name] = (symNr, dims, gdxcc.gdxSymbolInfoX(self.handle, symNr)[1])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the gdx file
+        """
+        if self.handle is not None:
+            gdxcc.gdxClose(self.handle)
+            gdxcc.gdxFree(self.handle)
+            self.handle = None
+
+    def read(self, name):
+        """
+        Read all the records of a symbol
+
+        :param name:    Name of the symbol
+        :returns:       Dictionary with the fields 'keys' (integer array records x dimensions with the UEL numbers),
+                        'values' (float array with the level of each record) and 'uels' (array with the name of each
+                        UEL number)
+        """
+        if name not in self.symbols:
+            logging.critical('Symbol ' + name + ' not found in ' + self.filename)
+            sys.exit(1)
+        symNr, dims, __ = self.symbols[name]
+        ret, nrRecs = gdxcc.gdxDataReadRawStart(self.handle, symNr)
+        assert ret, "Error in gdx data string" + \
+                    gdxcc.gdxErrorStr(self.handle, gdxcc.gdxGetLastError(self.handle))[1]
+        keys = np.empty((nrRecs, dims), dtype=np.int64)
+        values = np.empty(nrRecs)
+        read = gdxcc.gdxDataReadRaw
+        level = gdxcc.GMS_VAL_LEVEL
+        for i in range(nrRecs):
+            ret, k, v, afdim = read(self.handle)
+            keys[i] = k[:dims]
+            values[i] = v[level]
+        gdxcc.gdxDataReadDone(self.handle)
+        return {'keys': keys, 'values': values, 'uels': self.uels}
+
+
+def gdx_to_arrays(gams_dir, filename, varname='all', verbose=False):
+    """
+    This function loads the gdx with the results of the simulation into integer-coded numpy arrays.
+    The unique elements (UELs) are read once and the records are read with their raw integer keys, which avoids the
+    conversion of every key to a string.
+
+    :param gams_dir:    Gams working directory
+    :param filename:    Path to the gdx file to be read
+    :param varname:     Name (or list of names) of the symbols to be read (otherwise specify 'all')
+    :param verbose:     If True, the loading time is logged
+    :returns:           Dictionary with, for each symbol, the arrays returned by GdxReader.read
+    """
+    tgdx = tm.time()
+    with GdxReader(gams_dir, filename) as gdx:
+        if varname == 'all':
+            names = list(gdx.symbols)
+        else:
+            names = [varname] if isinstance(varname, str) else varname
+        out = {name: gdx.read(name) for name in names}
+    if verbose:
+        logging.info("Loading gdx file " + filename + " took {}s".format(tm.time() - tgdx))
+    return out
+
+
+def _list_to_arrays(records):
+    """
+    Convert the records of one symbol as returned by gdx_to_list (list of [key1, ..., keyN, value]) into the array
+    format of gdx_to_arrays
+    """
+    dims = len(records[0]) - 1
+    uels, keys = np.unique(np.array([r[:dims] for r in records], dtype=object).astype(str).reshape(-1, dims),
+                           return_inverse=True)
+    return {'keys': keys.reshape(-1, dims) + 1, 'values': np.array([r[-1] for r in records], dtype=float),
+            'uels': np.concatenate([[''], uels]).astype(object)}
+
+
+def _arrays_to_frame(keys, values, uels):
+    """
+    Vectorized pivot of the records of one symbol: the last dimension is used as index and the other dimensions as
+    columns (MultiIndex for symbols with more than two dimensions). Missing combinations are set to zero.
+    """
+    dims = keys.shape[1]
+    if dims == 1:
+        return pd.Series(values, index=pd.Index(uels[keys[:, 0]]))
+    rows, row_codes = np.unique(keys[:, -1], return_inverse=True)
+    cols, col_codes = np.unique(keys[:, :-1], axis=0, return_inverse=True)
+    data = np.zeros((len(rows), len(cols)))
+    data[row_codes.ravel(), col_codes.ravel()] = values
+    if dims == 2:
+        columns = pd.Index(uels[cols[:, 0]])
+    else:
+        columns = pd.MultiIndex.from_arrays([uels[cols[:, i]] for i in range(dims - 1)])
+    return pd.DataFrame(data, index=pd.Index(uels[rows]), columns=columns)
+
+
+def symbol_to_dataframe(symbol, records, fixindex=False):
+    """
+    Structure the records of a single symbol as a pandas dataframe (or series)
+
+    :param symbol:      Name of the symbol (for the log messages)
+    :param records:     Records, as returned by gdx_to_arrays/GdxReader.read (or the list format of gdx_to_list)
+    :param fixindex:    This flag allows converting string index into integers and sort the data
+    :returns:           Dataframe or series, None if the symbol is empty
+    """
+    if len(records) == 0 or (isinstance(records, dict) and len(records['values']) == 0):
+        logging.debug('Variable ' + symbol + ' is empty. Skipping')
+        return None
+    if (records['keys'].shape[1] if isinstance(records, dict) else len(records[0]) - 1) == 0:
+        logging.warning('Variable ' + symbol + ' has dimension 0, which should not occur. Skipping')
+        return None
+    arrays = records if isinstance(records, dict) else _list_to_arrays(records)
+    out = _arrays_to_frame(arrays['keys'], arrays['values'], arrays['uels'])
+    if fixindex:
+        try:
+            out.index = out.index.astype(int)
+            out.sort_index(inplace=True)
+        except (TypeError, ValueError):
+            pass
+    logging.debug('Successfully loaded variable ' + symbol)
+    return out
+
+
 def gdx_to_dataframe(data, fixindex=False, verbose=False):
     """
-    This function structures the raw data extracted from a gdx file (using the function GdxToList)
-    and outputs it as a dictionary of pandas dataframes (or series)
+    This function structures the raw data extracted from a gdx file (using the functions gdx_to_arrays or
+    gdx_to_list) and outputs it as a dictionary of pandas dataframes (or series). The last dimension of each symbol
+    is used as index and the other ones as columns.
 
-    :param data:        Dictionary with all the collected values (within lists), from GdxToList function
+    :param data:        Dictionary with all the collected values, from the gdx_to_arrays or gdx_to_list functions
     :param fixindex:    This flag allows converting string index into integers and sort the data
     :returns:        dictionary of dataframes
     """
     out = {}
     tc = tm.time()
     for symbol in data:
-        if len(data[symbol]) > 0:
-            dim = len(data[symbol][0])
-            if dim == 3:
-                vars1 = set()
-                for element in data[symbol]:
-                    if not element[0] in vars1:
-                        vars1.add(element[0])
-                vals = {}
-                while vars1:
-                    vars2 = {}
-                    var1 = vars1.pop()
-                    for element in data[symbol]:
-                        if var1 == element[0]:
-                            vars2[element[1]] = element[2]
-                    vals[var1] = vars2
-                out[symbol] = pd.DataFrame(vals)
-                logging.debug('Successfully loaded variable ' + symbol)
-            elif dim == 2:
-                vals = {}
-                for element in data[symbol]:
-                    vals[element[0]] = element[1]
-                out[symbol] = pd.Series(vals)
-                logging.debug('Successfully loaded variable ' + symbol)
-            elif dim == 1:
-                logging.warning('Variable ' + symbol + ' has dimension 0, which should not occur. Skipping')
-            elif dim > 3:
-                logging.warning('Variable ' + symbol + ' has more than 2 dimensions, which is very tiring. Skipping')
-        else:
-            logging.debug('Variable ' + symbol + ' is empty. Skipping')
-    for symbol in out:
-        try:
-            out[symbol].fillna(value=0, inplace=True)
-        except:
-            logging.error('Error while trying to remove nan')
-            pass
-    if fixindex:
-        for symbol in out:
-            try:
-                index_int = [int(idx) for idx in out[symbol].index]
-                out[symbol].index = index_int
-                out[symbol].sort_index(inplace=True)
-            except:
-                pass
+        df = symbol_to_dataframe(symbol, data[symbol], fixindex=fixindex)
+        if df is not None:
+            out[symbol] = df
     if verbose:
         logging.info("Time to convert to dataframes: {}s".format(tm.time() - tc))
     return out
@@ -327,14 +500,14 @@ def gdx_to_dataframe(data, fixindex=False, verbose=False):
 
 def get_gdx(gams_dir, resultfile):
     """
-    Short wrapper of the two gdx reading functions (GdxToDataframe and GdxToList)
+    Short wrapper of the two gdx reading functions (gdx_to_arrays and gdx_to_dataframe)
 
     :param gams_dir:    Gams working directory
     :param resultfile:  Path to the gdx file to be read
     :returns:           dictionary of dataframes
     """
-    return gdx_to_dataframe(gdx_to_list(gams_dir, resultfile,
-                                        varname='all', verbose=True),
+    return gdx_to_dataframe(gdx_to_arrays(gams_dir, resultfile,
+                                          varname='all', verbose=True),
                             fixindex=True, verbose=True)
 
 
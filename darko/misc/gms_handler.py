@@ -14,8 +14,9 @@ def solve_high_level(gams_folder, sim_folder, gams_file='DARKO.gms', result_file
         from gams import GamsWorkspace
         ws = GamsWorkspace(system_directory=str(gams_folder), debug=3)
         shutil.copy(os.path.join(sim_folder, gams_file), ws.working_directory)
-        shutil.copy(os.path.join(sim_folder, 'Inputs.gdx'), ws.working_directory)
-        shutil.copy(os.path.join(sim_folder, 'cplex.opt'), ws.working_directory)
+        for filename in ['Inputs.gdx', 'InputsDelta.gdx', 'InputsDelta.gms', 'cplex.opt']:
+            if os.path.isfile(os.path.join(sim_folder, filename)):
+                shutil.copy(os.path.join(sim_folder, filename), ws.working_directory)
         t1 = ws.add_job_from_file(gams_file)
         opt = ws.add_options()
         # Do not create .lst file
@@ -0,0 +1,144 @@
+"""
+Compact, array-backed registry of the players (supply side units and demand side orders) of a DARKO simulation.
+
+The players are stored as column arrays. The categorical fields (zone, technology, fuel, order type, sector) are
+encoded as integer codes referring to the corresponding DARKO set, and the positions of the players of each zone,
+technology and order type are indexed once when the registry is built. Per-player lookups therefore do not go through
+pandas row selections anymore::
+
+    reg = PlayerRegistry(plants, demands, sets)
+    reg.units.get('Z1_HOBO_GAS', 'Zone')            # single value, O(1)
+    reg.units.names_where('Zone', 'Z1')             # all the units of zone Z1
+    reg.units.one_hot('OrderType')                  # boolean (u, o) matrix, as used in the gdx parameters
+
+@author: Matija Pavičević
+"""
+
+import logging
+import sys
+
+import numpy as np
+
+from ..common import commons
+
+
+class PlayerTable(object):
+    """
+    Column-oriented table of players (units or demands)
+
+    :param data:        Dataframe with one row per player and a 'Unit' column with the player names
+    :param levels:      Dictionary {column: list of levels} of the categorical columns to be encoded. The position of
+                        each level in the list is used as integer code (-1 if the value is not in the list)
+    """
+
+    def __init__(self, data, levels):
+        self.names = np.asarray(data['Unit'], dtype=object) if 'Unit' in data else np.array([], dtype=object)
+        self.position = {name: i for i, name in enumerate(self.names)}
+        self.columns = {col: data[col].to_numpy() for col in data.columns}
+        self.levels = {}
+        self.codes = {}
+        self.index = {}
+        for col, lev in levels.items():
+            if col not in self.columns:
+                continue
+            lev = list(lev)
+            lookup = {level: code for code, level in enumerate(lev)}
+            codes = np.array([lookup.get(value, -1) for value in self.columns[col]], dtype=int)
+            self.levels[col] = lev
+            self.codes[col] = codes
+            # Positions of the players of each level (stable order):
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(lev) + 1))
+            self.index[col] = {level: order[bounds[k]:bounds[k + 1]] for k, level in enumerate(lev)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.position
+
+    def column(self, col):
+        """
+        Array with the values of a column for all players
+        """
+        return self.columns[col]
+
+    def get(self, name, col):
+        """
+        Value of a column for a given player
+
+        :param name:    Player name
+        :param col:     Column name (e.g. 'Zone')
+        """
+        return self.columns[col][self.position[name]]
+
+    def select(self, col, value):
+        """
+        Positions of the players for which column col is equal to value (prebuilt index for encoded columns)
+        """
+        if col in self.index:
+            return self.index[col].get(value, np.array([], dtype=int))
+        return np.flatnonzero(self.columns[col] == value)
+
+    def names_where(self, col, value):
+        """
+        List of the names of the players for which column col is equal to value
+        """
+        return self.names[self.select(col, value)].tolist()
+
+    def one_hot(self, col):
+        """
+        Boolean matrix (players x levels) with True at the level of each player
+
+        :param col:     Encoded column (e.g. 'Technology')
+        """
+        codes = self.codes[col]
+        if (codes < 0).any():
+            unknown = sorted(set(str(v) for v in self.columns[col][codes < 0]))
+            logging.critical('Column ' + col + ': the following values are not recognized: ' + ', '.join(unknown))
+            sys.exit(1)
+        val = np.zeros((len(codes), len(self.levels[col])), dtype='bool')
+        val[np.arange(len(codes)), codes] = True
+        return val
+
+
+class PlayerRegistry(object):
+    """
+    Registry of the supply side (units) and demand side players of a DARKO simulation
+
+    :param units:       Dataframe with the supply side players (as loaded in build_simulation)
+    :param demands:     Dataframe with the demand side players
+    :param sets:        DARKO sets, used to encode the categorical fields consistently with the gdx parameters. If not
+                        provided, the lists in commons are used
+    """
+
+    def __init__(self, units, demands, sets=None):
+        if sets is None:
+            sets = {}
+        zones = sets.get('n')
+        if zones is None:
+            zones = sorted(set(units.get('Zone', [])) | set(demands.get('Zone', [])))
+        self.units = PlayerTable(units, {'Zone': zones,
+                                         'Technology': sets.get('t', commons['Technologies']),
+                                         'Fuel': sets.get('f', commons['Fuels']),
+                                         'OrderType': sets.get('o', ['Simple', 'Block', 'Flexible', 'Storage'])})
+        self.demands = PlayerTable(demands, {'Zone': zones,
+                                             'Sector': sets.get('sk', commons['Sectors'])})
+
+    @classmethod
+    def from_inputs(cls, inputs):
+        """
+        Build the registry from DARKO inputs (SimData dictionary or content of Inputs.p)
+        """
+        return cls(inputs['units'], inputs['demands'], inputs['sets'])
+
+
+def get_registry(inputs):
+    """
+    Return the player registry of the DARKO inputs, building it if not present (e.g. older Inputs.p files)
+
+    :param inputs:  DARKO inputs
+    """
+    if 'registry' not in inputs:
+        inputs['registry'] = PlayerRegistry.from_inputs(inputs)
+    return inputs['registry']
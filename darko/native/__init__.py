@@ -0,0 +1,9 @@
+"""
+Native DARKO backend: the DARKO model (DARKO.gms) is built from SimData as sparse matrices and solved with the
+open-source HiGHS solver (scipy.optimize.milp), without GAMS and without writing gdx files.
+"""
+
+from .model import HorizonModel, ModelData
+from .rolling import solve_native, solve_horizon, solve_relaxed, write_raw_results
+from .decomposition import solve_decomposed
+from .whatif import affected_horizons, solve_whatif
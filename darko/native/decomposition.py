@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Zonal decomposition of the native DARKO backend.
+
+The MILP of a horizon is split by bidding zone (node, or cluster of nodes): each zone keeps its own orders, storage
+units and net positions, and a copy of the flows of its cross-border lines. The copies are coordinated with a
+Lagrangian scheme: the multipliers of the consensus constraints (same flow in both zones) act as cross-border prices
+and are updated by subgradient steps, while the zonal subproblems are solved in parallel worker processes. At each
+iteration, a feasible solution is recovered by fixing the cross-border flows to the average of their copies (or to
+the copy of one of the zones if the average is not feasible).
+
+The iterations stop when the gap between the Lagrangian bound and the best recovered welfare is below the tolerance.
+The integer variables of the best solution are then fixed in the complete model to compute the marginals (prices),
+as in the monolithic solve. If the decomposition does not converge, the horizon is solved as one MILP::
+
+    x, duals, status, telemetry = solve_decomposed(model, clusters={'Z1': 'North', 'Z2': 'North', 'Z3': 'South'})
+
+@author: Matija Pavičević
+"""
+
+import logging
+import time as tm
+
+import numpy as np
+import pandas as pd
+
+from .model import WATERSLACK_PENALTY
+from .rolling import _milp_scipy, fixed_integer_lp, solve_horizon
+
+# Set of the first dimension of each variable (None for the system wide variables, defining the objective):
+COLUMN_SETS = {'AcceptanceRatioOfDemandOrders': 'd', 'AcceptanceRatioOfSimpleOrders': 'u',
+               'AcceptanceRatioOfBlockOrders': 'u', 'Flow': 'l', 'StorageInput': 's', 'StorageOutput': 's',
+               'StorageLevel': 's', 'spillage': 's', 'WaterSlack': 's', 'SystemCost': None,
+               'ClearingStatusOfBlockOrder': 'u', 'ClearingStatusOfFlexibleOrder': 'u', 'TotalWelfare': None,
+               'NetPositionOfBiddingArea': 'n', 'TemporaryNetPositionOfBiddingArea': 'n',
+               'DailyNetPositionOfBiddingArea': 'n'}
+
+# Equations defining the objective, replaced by the welfare of each zone:
+OBJECTIVE_ROWS = ['EQ_SystemCost', 'EQ_Welfare']
+
+
+class _Subproblem(object):
+    """
+    MILP of one zone (same attributes as HorizonModel, as used by the solver functions)
+    """
+
+    def __init__(self, model, cols, rows_eq, rows_ub, c):
+        self.first, self.last = model.first, model.last
+        self.cols = cols
+        self.c = c[cols]
+        self.A_eq, self.b_eq = model.A_eq[rows_eq][:, cols], model.b_eq[rows_eq]
+        self.A_ub, self.b_ub = model.A_ub[rows_ub][:, cols], model.b_ub[rows_ub]
+        self.lb, self.ub = model.lb[cols], model.ub[cols]
+        self.integrality = model.integrality[cols]
+
+
+class ZonalDecomposition(object):
+    """
+    Partition of the MILP of a horizon by zone
+
+    :param model:       HorizonModel
+    :param clusters:    Dictionary {node: zone} to group several nodes in the same subproblem. Each node is a zone by
+                        default
+    """
+
+    def __init__(self, model, clusters=None):
+        data = model.data
+        nodes = list(data.sets['n'])
+        labels = [clusters.get(n, n) for n in nodes] if clusters else nodes
+        zone_of_node = pd.factorize(pd.Series(labels, dtype=object))[0]
+        self.zones = list(pd.unique(pd.Series(labels, dtype=object)))
+        node = {'d': data.loc_demand.argmax(axis=1), 'u': data.loc_supply.argmax(axis=1),
+                's': data.loc_supply[data.storage_units].argmax(axis=1), 'n': np.arange(len(nodes))}
+
+        # Zone of each column (-1 for the flows, -2 for the objective variables):
+        n_cols = len(model.c)
+        zone = np.full(n_cols, -2)
+        for name, cols in model.columns.items():
+            dim = COLUMN_SETS[name]
+            if dim in node:
+                z = zone_of_node[node[dim]]
+                zone[cols] = z[:, None] if cols.ndim == 2 else z
+        # Lines between two zones are shared, the others belong to the zone of their nodes:
+        flows = model.columns['Flow']
+        line_zones = [np.unique(zone_of_node[np.flatnonzero(data.line_node[l])]) for l in range(flows.shape[0])]
+        shared_lines = [l for l, z in enumerate(line_zones) if len(z) > 1]
+        for l, z in enumerate(line_zones):
+            zone[flows[l]] = z[0] if len(z) == 1 else -1
+        line_of_col = np.full(n_cols, -1)
+        line_of_col[flows] = np.arange(flows.shape[0])[:, None]
+
+        # Objective: minimize - sum(SystemCost) + penalty * sum(WaterSlack), with SystemCost expressed with the
+        # welfare of the orders (EQ_SystemCost: SystemCost + r * x = 0)
+        c = np.asarray(model.A_eq[model.rows['EQ_SystemCost'][1]].sum(axis=0)).ravel()
+        c[model.columns['SystemCost']] = 0
+        c[model.columns['WaterSlack']] += WATERSLACK_PENALTY
+        self.c = c
+
+        # Zone of each row, flow-only rows (line ramping limits) are added to the zones of their line:
+        rows = {}
+        for sense, A in [('E', model.A_eq.tocsr()), ('L', model.A_ub.tocsr())]:
+            row_id = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+            z = zone[A.indices]
+            own = z >= 0
+            zmin = np.full(A.shape[0], np.iinfo(int).max)
+            zmax = np.full(A.shape[0], -1)
+            np.minimum.at(zmin, row_id[own], z[own])
+            np.maximum.at(zmax, row_id[own], z[own])
+            skip = np.zeros(A.shape[0], dtype=bool)
+            for name in OBJECTIVE_ROWS:
+                if model.rows[name][0] == sense:
+                    skip[model.rows[name][1]] = True
+            if ((zmax >= 0) & (zmin != zmax) & ~skip).any():
+                raise ValueError('Some constraints link the orders of several zones')
+            line = np.full(A.shape[0], -1)
+            is_flow = z == -1
+            line[row_id[is_flow]] = line_of_col[A.indices[is_flow]]
+            rows[sense] = (zmax, line, skip)
+
+        self.subproblems = []
+        for k in range(len(self.zones)):
+            lines = [l for l in shared_lines if k in line_zones[l]]
+            cols = np.sort(np.concatenate([np.flatnonzero(zone == k)] + [flows[l] for l in lines]))
+            selected = {}
+            for sense, (zmax, line, skip) in rows.items():
+                flow_only = (zmax < 0) & np.isin(line, lines)
+                selected[sense] = np.flatnonzero(((zmax == k) | flow_only) & ~skip)
+            self.subproblems.append(_Subproblem(model, cols, selected['E'], selected['L'], c))
+
+        # Copies of the shared flows (a: first zone, b: second zone of the line) and their position in the subproblems
+        self.shared = np.concatenate([flows[l] for l in shared_lines]) if shared_lines else np.zeros(0, dtype=int)
+        shared_zones = np.concatenate([np.repeat(line_zones[l][None, :2], flows.shape[1], axis=0)
+                                       for l in shared_lines]) if shared_lines else np.zeros((0, 2), dtype=int)
+        self.copies = []
+        for k, sub in enumerate(self.subproblems):
+            index = np.flatnonzero((shared_zones == k).any(axis=1))
+            position = np.searchsorted(sub.cols, self.shared[index])
+            sign = np.where(shared_zones[index, 0] == k, 1.0, -1.0)
+            self.copies.append((index, position, sign))
+
+    def assemble(self, solutions, n_cols):
+        """
+        Solution vector of the complete model from the solutions of the subproblems (the objective variables are
+        left to 0, they are recomputed by the fixed-integer LP)
+        """
+        x = np.zeros(n_cols)
+        for sub, xk in zip(self.subproblems, solutions):
+            x[sub.cols] = xk
+        return x
+
+
+# Subproblems and solver options of the worker processes:
+_WORKER = {}
+
+
+def _init_worker(subproblems, copies, options):
+    _WORKER.update(subproblems=subproblems, copies=copies, options=options)
+
+
+def _subproblem_worker(k, prices, fixed=None):
+    """
+    Solve the subproblem of zone k with the cross-border prices (Lagrange multipliers) of its shared flows, or with
+    the shared flows fixed to the given values
+
+    :returns:   Tuple (x, objective) with the solution of the subproblem (None if infeasible)
+    """
+    sub = _WORKER['subproblems'][k]
+    index, position, sign = _WORKER['copies'][k]
+    c = sub.c.copy()
+    c[position] += sign * prices[index]
+    lb, ub = sub.lb, sub.ub
+    if fixed is not None:
+        sub.lb, sub.ub = lb.copy(), ub.copy()
+        sub.lb[position] = sub.ub[position] = fixed[index]
+    c, sub.c = sub.c, c
+    try:
+        x, status = _milp_scipy(sub, _WORKER['options'])
+    finally:
+        sub.c, sub.lb, sub.ub = c, lb, ub
+    if x is None:
+        return None, np.nan
+    return x, float(sub.c @ x + (sign * prices[index]) @ x[position])
+
+
+def solve_decomposed(model, options=None, clusters=None, max_iter=50, tol=1e-3, workers=None, fallback=True):
+    """
+    Solve one horizon with the zonal decomposition
+
+    :param model:       HorizonModel
+    :param options:     Options passed to scipy.optimize.milp for each subproblem
+    :param clusters:    Dictionary {node: zone} to group nodes in the same subproblem (one subproblem per node if None)
+    :param max_iter:    Maximum number of iterations
+    :param tol:         Relative tolerance on the gap between the Lagrangian bound and the best recovered welfare
+    :param workers:     Number of worker processes (number of cores of the machine if None, 1 to solve the subproblems
+                        in the main process)
+    :param fallback:    If True, solve the complete MILP if the decomposition does not converge
+    :returns:           Tuple (x, duals, status, telemetry) as returned by solve_horizon, and a dataframe with the
+                        welfare bound, best welfare, gap and flow residual of each iteration
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    options = options or {}
+    telemetry = pd.DataFrame(columns=['welfare_bound', 'welfare', 'gap', 'residual', 'time'])
+    telemetry.index.name = 'iteration'
+    try:
+        dec = ZonalDecomposition(model, clusters)
+    except ValueError as err:
+        logging.warning('Horizon ' + str(model.first) + '-' + str(model.last) + ': the zonal decomposition cannot be '
+                        'used (' + str(err) + '), the horizon is solved as one MILP')
+        return solve_horizon(model, options) + (telemetry,)
+    n_zones = len(dec.subproblems)
+
+    pool = None
+    if workers == 1 or n_zones == 1:
+        _init_worker(dec.subproblems, dec.copies, options)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(dec.subproblems, dec.copies, options))
+
+    def run(*args):
+        return list(pool.map(_subproblem_worker, *args) if pool is not None else map(_subproblem_worker, *args))
+
+    t0 = tm.time()
+    prices = np.zeros(len(dec.shared))
+    zones = list(range(n_zones))
+    bound, best, best_solutions = -np.inf, np.inf, None
+    theta, stalled = 1.0, 0
+    try:
+        for it in range(1, max_iter + 1):
+            out = run(zones, [prices] * n_zones)
+            if any(x is None for x, __ in out):
+                logging.warning('Horizon ' + str(model.first) + '-' + str(model.last) + ': a zonal subproblem is '
+                                'infeasible')
+                break
+            # Lagrangian bound (of the minimization of - welfare) and flow residual between the two copies:
+            value = sum(obj for __, obj in out)
+            copies = np.zeros((len(dec.shared), 2))
+            for (x, __), (index, position, sign) in zip(out, dec.copies):
+                copies[index, (sign < 0).astype(int)] = x[position]
+            residual = copies[:, 0] - copies[:, 1]
+            if not np.isfinite(bound) or value > bound + 1e-9 * max(1, abs(bound)):
+                bound, stalled = value, 0
+            else:
+                stalled += 1
+                if stalled >= 3:
+                    theta, stalled = theta / 2, 0
+            # Primal recovery, with the shared flows fixed to the average of their copies, or else to the copy of
+            # one of the two zones:
+            for fixed in [copies.mean(axis=1), copies[:, 0], copies[:, 1]]:
+                recovered = run(zones, [prices] * n_zones, [fixed] * n_zones)
+                if all(x is not None for x, __ in recovered):
+                    upper = sum(float(sub.c @ x) for sub, (x, __) in zip(dec.subproblems, recovered))
+                    if upper < best:
+                        best, best_solutions = upper, [x for x, __ in recovered]
+                    break
+            gap = (best - bound) / max(1, abs(best)) if np.isfinite(best) else np.inf
+            telemetry.loc[it] = [-bound, -best, gap, np.abs(residual).max() if len(residual) else 0, tm.time() - t0]
+            logging.debug('Zonal decomposition, iteration ' + str(it) + ': ' + str(telemetry.loc[it].to_dict()))
+            if gap <= tol or len(residual) == 0 or not residual.any():
+                break
+            # Subgradient step on the cross-border prices:
+            scale = best - bound if np.isfinite(best) else np.abs(dec.c).max()
+            prices = prices + theta * scale / max(residual @ residual, 1e-9) * residual
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    converged = len(telemetry) > 0 and telemetry['gap'].iloc[-1] <= tol
+    if best_solutions is None or (not converged and fallback):
+        logging.warning('Horizon ' + str(model.first) + '-' + str(model.last) + ': the zonal decomposition did not '
+                        'converge in ' + str(len(telemetry)) + ' iterations' +
+                        (', the horizon is solved as one MILP' if fallback else ''))
+        if fallback or best_solutions is None:
+            return solve_horizon(model, options) + (telemetry,)
+    x, duals = fixed_integer_lp(model, dec.assemble(best_solutions, len(model.c)))
+    return x, duals, 0 if converged else 1, telemetry
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse matrix formulation of the DARKO model (DARKO.gms) for one optimization horizon.
+
+The variables and equations have the same names and definitions as in the GAMS model. Each equation block is stored
+with the row numbers of its instances, so that the marginals of the power and storage balances can be mapped back to
+(node, hour) and (storage, hour). The single-variable equations (flow and storage limits) are passed to the solver
+as variable bounds.
+
+@author: Matija Pavičević
+"""
+
+import logging
+import sys
+
+import numpy as np
+
+from ..preprocessing.utils import active_entities, rolling_horizons
+
+# Penalty on the unsatisfied storage level at the end of the horizon (EQ_Welfare):
+WATERSLACK_PENALTY = 1000
+
+
+class ModelData(object):
+    """
+    Parameters of a DARKO simulation as numpy arrays, extracted once from SimData for all the horizons
+
+    :param SimData:     DARKO simulation data (as returned by build_simulation or read from Inputs.p)
+    """
+
+    def __init__(self, SimData):
+        sets, param = SimData['sets'], SimData['parameters']
+        self.sets = sets
+        self.hours = list(sets['h'])
+
+        def val(name, dtype=float):
+            return np.asarray(param[name]['val'], dtype=dtype)
+
+        order_type = val('OrderType', bool)
+        for o in ['Simple', 'Block', 'Flexible', 'Storage']:
+            setattr(self, o.lower(), order_type[:, list(sets['o']).index(o)].astype(float) if o in sets['o']
+                    else np.zeros(len(sets['u'])))
+        self.capacity = val('PowerCapacity')
+        self.max_demand = val('MaxDemand')
+        self.loc_supply = val('LocationSupplySide')
+        self.loc_demand = val('LocationDemandSide')
+        self.line_node = val('LineNode')
+        technology = val('Technology', bool)
+        renewable = [list(sets['t']).index(t) for t in sets['tr'] if t in sets['t']]
+        self.ramping = ~technology[:, renewable].any(axis=1)  # EQ_Unit_Ramp_Up/Down exclude the renewable units
+
+        for name in ['AccaptanceBlockOrdersMin', 'AvailabilityFactorFlexibleOrder', 'PriceBlockOrder',
+                     'PriceFlexibleOrder', 'UnitRampUp', 'UnitRampDown', 'AvailabilityFactorDemandOrder',
+                     'AvailabilityFactorSimpleOrder', 'AvailabilityFactorBlockOrder', 'PriceDemandOrder',
+                     'PriceSimpleOrder', 'FlowMaximum', 'FlowMinimum', 'LineHourlyRampUp', 'LineHourlyRampDown',
+                     'LineDailyRampUp', 'LineDailyRampDown', 'LineInitial', 'NodeHourlyRampUp', 'NodeHourlyRampDown',
+                     'NodeDailyRampUp', 'NodeDailyRampDown', 'StorageCapacity', 'StorageChargingCapacity',
+                     'StorageChargingEfficiency', 'StorageDischargeEfficiency', 'StorageInflow', 'StorageOutflow',
+                     'StorageInitial', 'StorageMinimum', 'StorageProfile']:
+            setattr(self, name, val(name))
+
+        # Block orders fixed by the pre-selection (1: accepted, -1: rejected, 0: free), one column per horizon:
+        self.BlockOrderFixed = val('BlockOrderFixed') if 'BlockOrderFixed' in param else None
+        # Units, demands and lines active in each horizon, computed if the simulation was built without them:
+        if 'ActiveUnit' in param:
+            active = {name: val(name) for name in ['ActiveUnit', 'ActiveDemand', 'ActiveLine']}
+        else:
+            config = SimData['config']
+            active = active_entities(param, sets, rolling_horizons(len(self.hours), int(config['HorizonLength']),
+                                                                   int(config['LookAhead'])))
+        for name, value in active.items():
+            setattr(self, name, value > 0)
+
+        # Storage units (subset s of u):
+        self.storage_units = np.array([list(sets['u']).index(s) for s in sets['s']], dtype=int)
+
+    @property
+    def sizes(self):
+        return {k: len(self.sets[k]) for k in ['u', 'd', 'n', 'l', 's']}
+
+
+class _Columns(object):
+    """
+    Allocation of the variable blocks of the model (columns of the constraint matrix)
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.blocks = {}
+        self.lb, self.ub, self.integrality = [], [], []
+
+    def add(self, name, shape, lb=0, ub=np.inf, integer=False):
+        size = int(np.prod(shape))
+        cols = np.arange(self.n, self.n + size).reshape(shape)
+        self.n += size
+        self.blocks[name] = cols
+        self.lb.append(np.broadcast_to(np.asarray(lb, dtype=float), shape).ravel())
+        self.ub.append(np.broadcast_to(np.asarray(ub, dtype=float), shape).ravel())
+        self.integrality.append(np.full(size, 1 if integer else 0))
+        return cols
+
+
+class _Rows(object):
+    """
+    Triplets of the equality (=E=) and inequality (=L=) constraints, by equation block
+
+    :param pattern:     Sparsity pattern of a previous horizon of the same length (see _Rows.matrix). If provided,
+                        only the coefficients are computed, the row and column numbers are re-used
+    """
+
+    def __init__(self, pattern=None):
+        self.pattern = pattern
+        self.n = {'E': 0, 'L': 0}
+        self.blocks = {}
+        self.triplets = {'E': ([], [], []), 'L': ([], [], [])}
+        self.rhs = {'E': [], 'L': []}
+
+    def add(self, name, sense, shape, rhs, terms):
+        """
+        Add an equation block
+
+        :param name:    Name of the equation (as in DARKO.gms)
+        :param sense:   'E' for =E=, 'L' for =L=
+        :param shape:   Shape of the equation block (e.g. (N, T))
+        :param rhs:     Constant terms, moved to the right hand side (broadcast to shape)
+        :param terms:   List of (coefficients, columns) pairs. Each pair is broadcast to shape + extra summation
+                        dimensions: the trailing dimensions of the coefficients beyond len(shape) are summed over
+        """
+        size = int(np.prod(shape))
+        rows = np.arange(self.n[sense], self.n[sense] + size).reshape(shape)
+        self.n[sense] += size
+        self.blocks[name] = (sense, rows)
+        self.rhs[sense].append(np.broadcast_to(np.asarray(rhs, dtype=float), shape).ravel())
+        r, c, v = self.triplets[sense]
+        for coef, cols in terms:
+            # All the entries are kept (including the zeros), so that the structure only depends on the shapes:
+            coef = np.asarray(coef, dtype=float)
+            full = np.broadcast_shapes(coef.shape, np.shape(cols))
+            v.append(np.broadcast_to(coef, full).ravel())
+            if self.pattern is None:
+                r.append(np.broadcast_to(rows.reshape(rows.shape + (1,) * (len(full) - rows.ndim)), full).ravel())
+                c.append(np.broadcast_to(cols, full).ravel())
+
+    def matrix(self, sense, ncols):
+        """
+        Constraint matrix and right hand side of the equality ('E') or inequality ('L') constraints
+
+        :returns:   Tuple (A, rhs, pattern). The pattern maps each triplet to its position in A.data and is re-used by
+                    the following horizons of the same length: the matrix is then filled without sorting the entries
+        """
+        from scipy import sparse
+        r, c, v = self.triplets[sense]
+        rhs = np.concatenate(self.rhs[sense]) if len(self.rhs[sense]) > 0 else np.zeros(0)
+        if len(v) == 0:
+            return sparse.csr_matrix((self.n[sense], ncols)), rhs, None
+        values = np.concatenate(v)
+        if self.pattern is None or self.pattern[sense] is None:
+            keys = np.concatenate(r).astype(np.int64) * ncols + np.concatenate(c)
+            unique, slots = np.unique(keys, return_inverse=True)
+            indptr = np.searchsorted(unique // ncols, np.arange(self.n[sense] + 1))
+            pattern = (slots.ravel(), indptr, (unique % ncols).astype(np.int32))
+        else:
+            pattern = self.pattern[sense]
+        slots, indptr, indices = pattern
+        data = np.bincount(slots, weights=values, minlength=len(indices))  # duplicates are summed
+        A = sparse.csr_matrix((data, indices.copy(), indptr.copy()), shape=(self.n[sense], ncols))
+        A.eliminate_zeros()  # on copies of the pattern arrays, modified in place
+        return A, rhs, pattern
+
+
+class HorizonModel(object):
+    """
+    DARKO MILP for one optimization horizon, in sparse matrix form::
+
+        maximize TotalWelfare  s.t.  A_eq x = b_eq,  A_ub x <= b_ub,  lb <= x <= ub,  x integer for the binaries
+
+    :param data:                ModelData of the simulation
+    :param first:               First hour of the horizon (1-based, FirstHour in DARKO.gms)
+    :param last:                Last hour of the horizon (LastHour)
+    :param storage_initial:     Storage levels before the first hour (StorageInitial)
+    :param template:            Model of a previous horizon with the same number of hours. The constraint structure
+                                is identical for all horizons of the same length: the sparsity pattern of the template
+                                is re-used and only the coefficients, bounds and right hand sides are updated
+    :param loop:                Index of the horizon in the rolling horizon loop (0-based), used to apply the block
+                                orders fixed by the pre-selection (BlockOrderFixed). No block order is fixed if None
+    """
+
+    def __init__(self, data, first, last, storage_initial, template=None, loop=None):
+        self.data = data
+        self.first, self.last = first, last
+        self.loop = loop
+        self.hours = np.arange(first - 1, last)
+        self.storage_initial = np.asarray(storage_initial, dtype=float)
+        if template is not None and len(template.hours) != len(self.hours):
+            template = None
+        self._build(template.pattern if template is not None else None)
+
+    def _build(self, pattern=None):
+        data, h = self.data, self.hours
+        size = data.sizes
+        U, D, N, L, S, T = size['u'], size['d'], size['n'], size['l'], size['s'], len(h)
+        s_u = data.storage_units
+
+        col = _Columns()
+        AD = col.add('AcceptanceRatioOfDemandOrders', (D, T), 0, 1)
+        AS = col.add('AcceptanceRatioOfSimpleOrders', (U, T), 0, 1)
+        AB = col.add('AcceptanceRatioOfBlockOrders', (U,), 0, 1)
+        # EQ_Flow_limits_lb/ub as bounds of the (positive) flows:
+        F = col.add('Flow', (L, T), np.maximum(data.FlowMinimum[:, h], 0), data.FlowMaximum[:, h])
+        # EQ_Storage_input, EQ_Storage_output, EQ_Storage_minimum and EQ_Storage_level as bounds:
+        SI = col.add('StorageInput', (S, T), 0, data.StorageChargingCapacity[:, None])
+        SO = col.add('StorageOutput', (S, T), 0, data.capacity[s_u][:, None])
+        SL = col.add('StorageLevel', (S, T), np.maximum(data.StorageMinimum, 0)[:, None],
+                     data.StorageCapacity[:, None])
+        SP = col.add('spillage', (S, T))
+        WS = col.add('WaterSlack', (S,))
+        SC = col.add('SystemCost', (T,))
+        fix = np.zeros(U)
+        if self.loop is not None and data.BlockOrderFixed is not None and self.loop < data.BlockOrderFixed.shape[1]:
+            fix = data.BlockOrderFixed[:, self.loop]
+        CB = col.add('ClearingStatusOfBlockOrder', (U,), (fix > 0).astype(float), (fix >= 0).astype(float),
+                     integer=True)
+        CF = col.add('ClearingStatusOfFlexibleOrder', (U, T), 0, 1, integer=True)
+        TW = col.add('TotalWelfare', (1,), -np.inf, np.inf)
+        NP = col.add('NetPositionOfBiddingArea', (N, T), -np.inf, np.inf)
+        TNP = col.add('TemporaryNetPositionOfBiddingArea', (N, T), -np.inf, np.inf)
+        DNP = col.add('DailyNetPositionOfBiddingArea', (N,), -np.inf, np.inf)
+
+        # Cleared quantities per unit of acceptance ratio / clearing status:
+        qd = data.AvailabilityFactorDemandOrder[:, h] * data.max_demand[:, None]                    # (D, T)
+        qs = data.AvailabilityFactorSimpleOrder[:, h] * data.capacity[:, None]                      # (U, T)
+        qb = data.AvailabilityFactorBlockOrder[:, h] * data.capacity[:, None]                       # (U, T)
+        qf = data.AvailabilityFactorFlexibleOrder * data.capacity                                   # (U,)
+        de = 1 / np.maximum(data.StorageDischargeEfficiency, 0.0001)
+        ce = data.StorageChargingEfficiency
+        first = np.arange(T) == 0
+        prev = np.maximum(np.arange(T) - 1, 0)  # column of the previous hour (masked for the first hour)
+        later = (~first).astype(float)
+
+        row = _Rows(pattern)
+        # EQ_SystemCost(i): SystemCost - welfare of the cleared orders = 0
+        row.add('EQ_SystemCost', 'E', (T,), 0, [
+            (1, SC),
+            (-(qd * data.PriceDemandOrder[:, h]).T, AD.T),
+            ((qs * data.PriceSimpleOrder[:, h] * data.simple[:, None]).T, AS.T),
+            ((qb * data.PriceBlockOrder[:, None]).T, np.broadcast_to(AB, (T, U))),
+            (np.broadcast_to(qf * data.PriceFlexibleOrder, (T, U)), CF.T)])
+        # EQ_Welfare: TotalWelfare - sum(SystemCost) + 1000 * sum(WaterSlack) = 0
+        row.add('EQ_Welfare', 'E', (1,), 0, [(1, TW), (-np.ones((1, T)), SC[None, :]),
+                                             (WATERSLACK_PENALTY * np.ones((1, S)), WS[None, :])])
+        # EQ_PowerBalance_1(n,i): net position = supply - demand - storage input + storage output
+        loc_s = data.loc_supply.T[:, None, :]                                                       # (N, 1, U)
+        loc_st = (data.loc_supply[s_u] * data.storage[s_u][:, None]).T[:, None, :]                  # (N, 1, S)
+        row.add('EQ_PowerBalance_1', 'E', (N, T), 0, [
+            (1, NP),
+            (-loc_s * (qs * data.simple[:, None]).T[None], AS.T[None]),
+            (-loc_s * qb.T[None], np.broadcast_to(AB, (1, T, U))),
+            (-loc_s * qf[None, None, :], CF.T[None]),
+            (data.loc_demand.T[:, None, :] * qd.T[None], AD.T[None]),
+            (loc_st, SI.T[None]),
+            (-loc_st, SO.T[None])])
+        # EQ_PowerBalance_2(n,i): temporary net position = - sum(l, Flow * LineNode)
+        flow_terms = (data.line_node.T[:, None, :], F.T[None])                                       # (N, T, L)
+        row.add('EQ_PowerBalance_2', 'E', (N, T), 0, [(1, TNP), flow_terms])
+        # EQ_PowerBalance_3(n,i): net position - temporary net position = - sum(l, Flow * LineNode)
+        row.add('EQ_PowerBalance_3', 'E', (N, T), 0, [(1, NP), (-1, TNP), flow_terms])
+        # EQ_Blockorder_lb/ub(u)
+        block = data.block
+        row.add('EQ_Blockorder_lb', 'L', (U,), 0, [(data.AccaptanceBlockOrdersMin * block, CB), (-1, AB)])
+        row.add('EQ_Blockorder_ub', 'L', (U,), 0, [(1, AB), (-block, CB)])
+        # EQ_Flexibleorder(u): at most one accepted hour per flexible order
+        row.add('EQ_Flexibleorder', 'L', (U,), 1, [(np.broadcast_to(data.flexible[:, None], (U, T)), CF)])
+        # EQ_Flow_hourly_ramp_up/down(l,i), with the initial flow for the first hour
+        row.add('EQ_Flow_hourly_ramp_up', 'L', (L, T),
+                data.LineHourlyRampUp[:, h] + data.LineInitial[:, None] * first, [(1, F), (-later, F[:, prev])])
+        row.add('EQ_Flow_hourly_ramp_down', 'L', (L, T),
+                data.LineHourlyRampDown[:, h] - data.LineInitial[:, None] * first, [(-1, F), (later, F[:, prev])])
+        # EQ_Flow_daily_ramp_up/down(l)
+        row.add('EQ_Flow_daily_ramp_up', 'L', (L,), data.LineDailyRampUp, [(np.ones((L, T)), F)])
+        row.add('EQ_Flow_daily_ramp_down', 'L', (L,), data.LineDailyRampDown, [(-np.ones((L, T)), F)])
+        # EQ_Node_hourly_ramp_up/down(n,i)
+        row.add('EQ_Node_hourly_ramp_up', 'L', (N, T), data.NodeHourlyRampUp[:, h],
+                [(1, NP), (-later, NP[:, prev])])
+        row.add('EQ_Node_hourly_ramp_down', 'L', (N, T), data.NodeHourlyRampDown[:, h],
+                [(-1, NP), (later, NP[:, prev])])
+        # EQ_Node_daily_ramp_up/down(n) and EQ_DailyNetPositionOfBiddingArea(n)
+        row.add('EQ_Node_daily_ramp_up', 'L', (N,), data.NodeDailyRampUp, [(np.ones((N, T)), NP)])
+        row.add('EQ_Node_daily_ramp_down', 'L', (N,), data.NodeDailyRampDown, [(-np.ones((N, T)), NP)])
+        row.add('EQ_DailyNetPositionOfBiddingArea', 'E', (N,), 0, [(1, DNP), (-np.ones((N, T)), NP)])
+        # EQ_Unit_Ramp_Up/Down(u,i), only for the non-renewable units
+        ramping = np.flatnonzero(data.ramping)
+        qr = qs[ramping]
+        cap = data.capacity[ramping]
+        row.add('EQ_Unit_Ramp_Up', 'L', (len(ramping), T), (data.UnitRampUp[ramping] * cap)[:, None],
+                [(qr, AS[ramping]), (-later * qr[:, prev], AS[ramping][:, prev])])
+        row.add('EQ_Unit_Ramp_Down', 'L', (len(ramping), T), (data.UnitRampDown[ramping] * cap)[:, None],
+                [(-qr, AS[ramping]), (later * qr[:, prev], AS[ramping][:, prev])])
+        # EQ_Storage_MaxDischarge/MaxCharge(s,i), for the storage units with more energy than power capacity
+        large = np.flatnonzero(data.StorageCapacity > data.capacity[s_u])
+        init = self.storage_initial[large][:, None] * first
+        row.add('EQ_Storage_MaxDischarge', 'L', (len(large), T), init + data.StorageInflow[large][:, h],
+                [(de[large][:, None], SO[large]), (-later, SL[large][:, prev])])
+        row.add('EQ_Storage_MaxCharge', 'L', (len(large), T),
+                data.StorageCapacity[large][:, None] - init + data.StorageOutflow[large][:, h],
+                [(ce[large][:, None], SI[large]), (later, SL[large][:, prev])])
+        # EQ_Storage_balance(s,i)
+        row.add('EQ_Storage_balance', 'E', (S, T),
+                data.StorageOutflow[:, h] - data.StorageInflow[:, h] - self.storage_initial[:, None] * first,
+                [(later, SL[:, prev]), (ce[:, None], SI), (-1, SL), (-1, SP), (-de[:, None], SO)])
+        # EQ_Storage_boundaries(s): minimum level at the end of the horizon (StorageFinalMin), or water slack
+        final_min = data.StorageProfile[:, h[-1]] * data.StorageCapacity
+        row.add('EQ_Storage_boundaries', 'L', (S,), -final_min, [(-1, SL[:, -1]), (-1, WS)])
+
+        self.columns = col.blocks
+        self.rows = row.blocks
+        self.lb, self.ub = np.concatenate(col.lb), np.concatenate(col.ub)
+        self.integrality = np.concatenate(col.integrality)
+        self.c = np.zeros(col.n)
+        self.c[TW] = -1  # maximize TotalWelfare
+        self.A_eq, self.b_eq, pattern_eq = row.matrix('E', col.n)
+        self.A_ub, self.b_ub, pattern_ub = row.matrix('L', col.n)
+        self.pattern = {'E': pattern_eq, 'L': pattern_ub}
+        # Columns of the units, demands and lines inactive in the horizon (ActiveUnit, ActiveDemand, ActiveLine): fixed
+        # to zero and removed from the matrices passed to the solvers (see ReducedModel):
+        self.pruned = np.zeros(col.n, dtype=bool)
+        if self.loop is not None and self.loop < data.ActiveUnit.shape[1]:
+            units = ~data.ActiveUnit[:, self.loop]
+            for cols in [AS[units], AB[units], CB[units], CF[units], AD[~data.ActiveDemand[:, self.loop]],
+                         F[~data.ActiveLine[:, self.loop]]]:
+                self.pruned[cols.ravel()] = True
+            self.lb[self.pruned] = self.ub[self.pruned] = 0
+        self._reduced = None
+        if (self.lb > self.ub).any():
+            wrong = [name for name, cols in self.columns.items()
+                     if (self.lb[cols.ravel()] > self.ub[cols.ravel()]).any()]
+            logging.error('Horizon ' + str(self.first) + '-' + str(self.last) + ': the lower bounds of the following '
+                          'variables are higher than their upper bounds: ' + ', '.join(wrong))
+
+    def reduced(self):
+        """
+        Matrices of the horizon without the columns of the inactive units, demands and lines (ReducedModel)
+        """
+        if self._reduced is None:
+            self._reduced = ReducedModel(self)
+        return self._reduced
+
+    def value(self, x, name):
+        """
+        Values of a variable block in the solution vector x (shape of the block)
+        """
+        return x[self.columns[name]]
+
+    def marginal(self, duals, name):
+        """
+        Marginals of an equation block, with the sign convention of GAMS for a maximization
+
+        :param duals:   Dictionary {'E': marginals of the equality rows, 'L': marginals of the inequality rows}, as
+                        returned by scipy.optimize.linprog for the minimization of -TotalWelfare
+        :param name:    Equation name
+        """
+        sense, rows = self.rows[name]
+        return -duals[sense][rows]
+
+
+class ReducedModel(object):
+    """
+    Horizon model restricted to the active units, demands and lines: the pruned columns (fixed to zero) and the rows
+    left without any coefficient are removed. The solutions of the reduced model are expanded back to the columns and
+    rows of the full model (zero values and marginals for the removed ones)
+
+    :param model:   HorizonModel
+    """
+
+    def __init__(self, model):
+        self.n = len(model.c)
+        self.cols = np.flatnonzero(~model.pruned)
+        self.c, self.lb, self.ub = model.c[self.cols], model.lb[self.cols], model.ub[self.cols]
+        self.integrality = model.integrality[self.cols]
+        A_eq, A_ub = model.A_eq[:, self.cols], model.A_ub[:, self.cols]
+        # The empty rows are kept if they are not satisfied, so that the reduced model is infeasible as the full one:
+        self.rows = {'E': np.flatnonzero((A_eq.getnnz(axis=1) > 0) | (model.b_eq != 0)),
+                     'L': np.flatnonzero((A_ub.getnnz(axis=1) > 0) | (model.b_ub < 0))}
+        self.n_rows = {'E': A_eq.shape[0], 'L': A_ub.shape[0]}
+        self.A_eq, self.b_eq = A_eq[self.rows['E']], model.b_eq[self.rows['E']]
+        self.A_ub, self.b_ub = A_ub[self.rows['L']], model.b_ub[self.rows['L']]
+        self.position = np.full(self.n, -1)
+        self.position[self.cols] = np.arange(len(self.cols))
+
+    def solution(self, x):
+        """
+        Solution vector of the full model
+        """
+        full = np.zeros(self.n)
+        full[self.cols] = x
+        return full
+
+    def duals(self, duals):
+        """
+        Marginals of the rows of the full model ({'E': ..., 'L': ...})
+        """
+        full = {sense: np.zeros(n) for sense, n in self.n_rows.items()}
+        for sense in full:
+            full[sense][self.rows[sense]] = duals[sense]
+        return full
+
+    def start(self, start):
+        """
+        MIP start (index, value) of the full model, restricted to the columns of the reduced model
+        """
+        index, value = np.asarray(start[0], dtype=int), np.asarray(start[1], dtype=float)
+        kept = self.position[index] >= 0
+        return self.position[index[kept]], value[kept]
+
+
+def check_solver():
+    """
+    Check that the open-source MILP solver (HiGHS through scipy.optimize.milp) is available
+    """
+    try:
+        from scipy.optimize import milp
+    except ImportError:
+        logging.critical('The native DARKO backend requires scipy >= 1.9 (scipy.optimize.milp, HiGHS solver)')
+        sys.exit(1)
@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling horizon loop of the native DARKO backend.
+
+The loop of DARKO.gms is reproduced: each horizon is solved as a MILP with HiGHS (scipy.optimize.milp), the integer
+variables are then fixed to compute the marginals (prices) with the corresponding LP, and the storage levels at the
+last kept hour are carried forward to the next horizon. The values of each hour are taken from the last horizon in
+which it was optimized, as with the levels and marginals of GAMS.
+
+If the HiGHS python interface (highspy) is installed, each horizon is warm-started (MIP start) with the solution of
+the previous horizon in the overlapping hours, or with the solution of a base scenario (start argument of
+solve_native), which is usually close for the variants of a sweep.
+
+The raw results have the same structure as those read from Results.gdx (get_gdx): dataframes indexed by the hour
+(or iteration) number, which can be formatted with format_results::
+
+    SimData = dk.build_simulation(config, write=False)
+    raw = dk.solve_native(SimData)
+    results, status = dk.format_results(dk.format_inputs(SimData), raw)
+
+@author: Matija Pavičević
+"""
+
+import logging
+import time as tm
+
+import numpy as np
+import pandas as pd
+
+from .model import HorizonModel, ModelData, check_solver
+from ..preprocessing.utils import rolling_horizons
+
+# GAMS model and solver status codes corresponding to the scipy.optimize.milp status
+# (0: optimal, 1: iteration or time limit, 2: infeasible, 3: unbounded, 4: other)
+MODEL_STATUS = {0: 1, 1: 8, 2: 10, 3: 18, 4: 13}
+SOLVER_STATUS = {0: 1, 1: 3, 2: 1, 3: 1, 4: 13}
+
+# scipy.optimize.milp options and corresponding HiGHS options, and milp status of the HiGHS model status:
+HIGHS_OPTIONS = {'time_limit': 'time_limit', 'mip_rel_gap': 'mip_rel_gap', 'node_limit': 'mip_max_nodes'}
+HIGHS_STATUS = {'kOptimal': 0, 'kTimeLimit': 1, 'kIterationLimit': 1, 'kSolutionLimit': 1, 'kInterrupt': 1,
+                'kInfeasible': 2, 'kUnbounded': 3, 'kUnboundedOrInfeasible': 3}
+# Relative and absolute tolerance on the storage levels carried between horizons in the repair pass of the parallel mode
+REPAIR_TOLERANCE = 1e-4
+
+
+def _milp_scipy(model, options):
+    """
+    Solve the MILP of a horizon with scipy.optimize.milp. Returns (x, status), x is None if no solution was found
+    """
+    from scipy.optimize import Bounds, LinearConstraint, milp
+
+    constraints = []
+    if model.A_eq.shape[0] > 0:
+        constraints.append(LinearConstraint(model.A_eq, model.b_eq, model.b_eq))
+    if model.A_ub.shape[0] > 0:
+        constraints.append(LinearConstraint(model.A_ub, -np.inf, model.b_ub))
+    res = milp(model.c, constraints=constraints, bounds=Bounds(model.lb, model.ub), integrality=model.integrality,
+               options=options)
+    return res.x, res.status
+
+
+def _milp_highspy(model, options, start):
+    """
+    Solve the MILP of a horizon with the HiGHS python interface, with a (possibly partial) MIP start. The integer
+    variables of a partial start are fixed by HiGHS to complete it into a feasible solution
+
+    :param start:   Tuple (index, value) with the columns and values of the start
+    """
+    import highspy
+    import scipy.sparse as sp
+
+    A = sp.vstack([model.A_eq, model.A_ub]).tocsr()
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = A.shape[1], A.shape[0]
+    lp.col_cost_ = model.c
+    lp.col_lower_, lp.col_upper_ = model.lb, model.ub
+    lp.row_lower_ = np.concatenate([model.b_eq, np.full(model.A_ub.shape[0], -np.inf)])
+    lp.row_upper_ = np.concatenate([model.b_eq, model.b_ub])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = A.indptr, A.indices, A.data
+    lp.integrality_ = [highspy.HighsVarType.kInteger if i else highspy.HighsVarType.kContinuous
+                       for i in model.integrality]
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', bool(options.get('disp', False)))
+    for key, name in HIGHS_OPTIONS.items():
+        if key in options:
+            h.setOptionValue(name, options[key])
+    h.passModel(lp)
+    index, value = start
+    h.setSolution(len(index), np.asarray(index, dtype=np.int32), np.asarray(value, dtype=np.float64))
+    h.run()
+    status = HIGHS_STATUS.get(h.getModelStatus().name, 4)
+    if h.getInfo().primal_solution_status != 2:  # no feasible solution
+        return None, status
+    return np.array(h.getSolution().col_value), status
+
+
+def solve_horizon(model, options=None, start=None):
+    """
+    Solve one horizon: MILP, then LP with the integer variables fixed to their optimal values for the marginals
+
+    :param model:       HorizonModel
+    :param options:     Options passed to scipy.optimize.milp (e.g. {'time_limit': 60, 'mip_rel_gap': 1e-4})
+    :param start:       MIP start, tuple (index, value) with the columns and values of a (possibly partial) solution.
+                        Only used if the HiGHS python interface (highspy) is installed
+    :returns:           Tuple (x, duals, status) with the solution vector (None if no solution was found), the
+                        marginals of the rows ({'E': ..., 'L': ...}) and the milp status code
+    """
+    options = options or {}
+    reduced = model.reduced()
+    if start is not None and len(start[0]) > 0 and _has_highspy():
+        x, status = _milp_highspy(reduced, options, reduced.start(start))
+    else:
+        x, status = _milp_scipy(reduced, options)
+    if x is None:
+        return None, None, status
+    x, duals = fixed_integer_lp(model, reduced.solution(x))
+    return x, duals, status
+
+
+def _solve_lp(model, lb, ub):
+    """
+    Solve the LP of a horizon with the given bounds. Returns (x, duals, status), x and duals are None if the LP could
+    not be solved
+    """
+    from scipy.optimize import linprog
+
+    reduced = model.reduced()
+    lp = linprog(reduced.c, A_ub=reduced.A_ub if reduced.A_ub.shape[0] > 0 else None,
+                 b_ub=reduced.b_ub if reduced.A_ub.shape[0] > 0 else None,
+                 A_eq=reduced.A_eq if reduced.A_eq.shape[0] > 0 else None,
+                 b_eq=reduced.b_eq if reduced.A_eq.shape[0] > 0 else None,
+                 bounds=np.column_stack([lb[reduced.cols], ub[reduced.cols]]), method='highs')
+    if lp.status != 0:
+        return None, None, lp.status
+    duals = {'E': lp.eqlin.marginals if reduced.A_eq.shape[0] > 0 else np.zeros(0),
+             'L': lp.ineqlin.marginals if reduced.A_ub.shape[0] > 0 else np.zeros(0)}
+    return reduced.solution(lp.x), reduced.duals(duals), lp.status
+
+
+def fixed_integer_lp(model, x):
+    """
+    LP of a horizon with the integer variables fixed to their values in x, as done by GAMS to report the marginals
+    of a MIP
+
+    :param model:       HorizonModel
+    :param x:           Solution vector of the MILP
+    :returns:           Tuple (x, duals) with the solution of the LP (x if the LP could not be solved) and the
+                        marginals of the rows ({'E': ..., 'L': ...})
+    """
+    lb, ub = model.lb.copy(), model.ub.copy()
+    integer = model.integrality > 0
+    lb[integer] = ub[integer] = np.round(x[integer])
+    x_lp, duals, status = _solve_lp(model, lb, ub)
+    if x_lp is None:
+        logging.warning('Horizon ' + str(model.first) + '-' + str(model.last) + ': the marginals could not be '
+                        'computed (fixed-integer LP status ' + str(status) + ')')
+        return x, {'E': np.zeros(model.A_eq.shape[0]), 'L': np.zeros(model.A_ub.shape[0])}
+    return x_lp, duals
+
+
+def solve_relaxed(model, mode=1):
+    """
+    Solve the LP relaxation of a horizon (screening mode, RelaxedMode in the config)
+
+    :param model:       HorizonModel
+    :param mode:        1: LP relaxation (prices of the relaxation), 2: the block orders accepted at 50 % or more and
+                        the flexible orders accepted at more than 50 % in the relaxation are fixed as accepted (the
+                        others as rejected) and the LP is solved again for the prices, as in DARKO.gms
+    :returns:           Tuple (x, duals, status), as returned by solve_horizon (linprog status)
+    """
+    x, duals, status = _solve_lp(model, model.lb, model.ub)
+    if x is None or mode != 2:
+        return x, duals, status
+    integer = model.integrality > 0
+    rounded = x.copy()
+    rounded[integer] = x[integer] > 0.5
+    block = model.columns['ClearingStatusOfBlockOrder']
+    rounded[block] = x[block] >= 0.5
+    lb, ub = model.lb.copy(), model.ub.copy()
+    lb[integer] = ub[integer] = rounded[integer]
+    x_fixed, duals_fixed, status_fixed = _solve_lp(model, lb, ub)
+    if x_fixed is None:
+        logging.warning('Horizon ' + str(model.first) + '-' + str(model.last) + ': the LP with the rounded orders '
+                        'is infeasible (linprog status ' + str(status_fixed) + '), the prices of the relaxation '
+                        'are used')
+        return x, duals, status
+    return x_fixed, duals_fixed, status_fixed
+
+
+def _solve(model, loop, settings, start=None):
+    """
+    Solve one horizon as one MILP, with the zonal decomposition (see darko.native.decomposition) or in relaxed mode
+
+    :param settings:    Dictionary with the solver options, the decomposition argument of solve_native, the relaxed
+                        mode and the sampling interval of the gap to the MILP (see solve_native)
+    :returns:           Tuple (x, duals, status, gap), with the relative welfare gap between the relaxed solve and the
+                        MILP for the sampled horizons (nan otherwise)
+    """
+    options, relaxed, sample = settings['options'], settings['relaxed'], settings['gap_sample']
+    if relaxed:
+        mip_welfare = np.nan
+        if sample > 0 and loop % sample == 0:
+            x_mip = solve_horizon(model, options)[0]
+            if x_mip is not None:
+                mip_welfare = model.value(x_mip, 'TotalWelfare')[0]
+        x, duals, status = solve_relaxed(model, relaxed)
+        if x is None or mip_welfare == 0:
+            return x, duals, status, np.nan
+        return x, duals, status, (model.value(x, 'TotalWelfare')[0] - mip_welfare) / abs(mip_welfare)
+    return _solve_mip(model, options, start, settings['decomposition']) + (np.nan,)
+
+
+def _solve_mip(model, options, start, decomposition):
+    if not decomposition:
+        return solve_horizon(model, options, start=start)
+    from .decomposition import solve_decomposed
+    x, duals, status, telemetry = solve_decomposed(model, options,
+                                                   **(decomposition if isinstance(decomposition, dict) else {}))
+    if len(telemetry) > 0:
+        last = telemetry.iloc[-1]
+        logging.info('Horizon ' + str(model.first) + '-' + str(model.last) + ': zonal decomposition, ' +
+                     str(len(telemetry)) + ' iterations, gap {0:.2e}, flow residual {1:.2e}'.format(last['gap'],
+                                                                                                   last['residual']))
+    return x, duals, status
+
+
+def _has_highspy():
+    try:
+        import highspy
+        return True
+    except ImportError:
+        return False
+
+
+class _Recorder(object):
+    """
+    Hourly and per-iteration outputs of the rolling horizon loop, in the structure of the DARKO.gms results
+    """
+
+    # (output name, variable or equation, set of the first dimension, marginal):
+    HOURLY = [('OutputAcceptanceRatioOfDemandOrders', 'AcceptanceRatioOfDemandOrders', 'd', False),
+              ('OutputAcceptanceRatioOfSimpleOrders', 'AcceptanceRatioOfSimpleOrders', 'u', False),
+              ('OutputClearingStatusOfFlexibleOrder', 'ClearingStatusOfFlexibleOrder', 'u', False),
+              ('OutputFlow', 'Flow', 'l', False),
+              ('OutputMarginalPrice', 'EQ_PowerBalance_1', 'n', True),
+              ('OutputMarginalPrice_2', 'EQ_PowerBalance_2', 'n', True),
+              ('OutputMarginalPrice_3', 'EQ_PowerBalance_3', 'n', True),
+              ('OutputNetPositionOfBiddingArea', 'NetPositionOfBiddingArea', 'n', False),
+              ('OutputTempNetPositionOfBiddingArea', 'TemporaryNetPositionOfBiddingArea', 'n', False),
+              ('OutputSystemCost', 'SystemCost', None, False),
+              ('OutputStorageMarginalPrice', 'EQ_Storage_balance', 's', True),
+              ('OutputStorageInput', 'StorageInput', 's', False),
+              ('OutputStorageOutput', 'StorageOutput', 's', False),
+              ('OutputStorageLevel', 'StorageLevel', 's', False),
+              ('OutputSpillage', 'spillage', 's', False)]
+
+    ITERATION = [('OutputAcceptanceRatioOfBlockOrders', 'AcceptanceRatioOfBlockOrders', 'u'),
+                 ('OutputClearingStatusOfBlockOrder', 'ClearingStatusOfBlockOrder', 'u'),
+                 ('OutputTotalWelfare', 'TotalWelfare', None),
+                 ('OutputDailyNetPositionOfBiddingArea', 'DailyNetPositionOfBiddingArea', 'n'),
+                 ('OutputWaterslack', 'WaterSlack', 's')]
+
+    def __init__(self, data, n_loops):
+        self.data = data
+        n_hours = len(data.hours)
+        size = data.sizes
+        self.hourly = {name: np.zeros((size[dim], n_hours) if dim else n_hours) for name, __, dim, __ in self.HOURLY}
+        self.iteration = {name: np.zeros((size[dim], n_loops) if dim else n_loops) for name, __, dim in self.ITERATION}
+        self.status = np.full((n_hours, 2), np.nan)
+        self.known = np.zeros(n_hours, dtype=bool)  # hours with recorded values
+        self.block = None
+        self.gap = np.full(n_loops, np.nan)  # relative welfare gap of the relaxed mode to the MILP
+
+    @classmethod
+    def extract(cls, model, x, duals):
+        """
+        Values of the outputs in the solution of a horizon (None if no solution was found)
+        """
+        if x is None:
+            return None
+        values = {name: model.marginal(duals, source) if marginal else model.value(x, source)
+                  for name, source, __, marginal in cls.HOURLY}
+        values.update({name: model.value(x, source) for name, source, __ in cls.ITERATION})
+        return values
+
+    def store(self, loop, hours, values, status, gap=np.nan):
+        """
+        Store the output values of a horizon (as returned by extract). The horizons must be stored in order, the
+        values of each hour are those of the last horizon in which it was optimized
+        """
+        self.status[hours] = [MODEL_STATUS.get(status, 13), SOLVER_STATUS.get(status, 13)]
+        self.gap[loop] = gap
+        if values is None:
+            return
+        for name, __, __, __ in self.HOURLY:
+            self.hourly[name][..., hours] = values[name]
+        for name, __, dim in self.ITERATION:
+            self.iteration[name][..., loop] = values[name] if dim else values[name][0]
+        self.known[hours] = True
+        self.block = values['OutputAcceptanceRatioOfBlockOrders']
+
+    def record(self, loop, model, x, duals, status, gap=np.nan):
+        self.store(loop, model.hours, self.extract(model, x, duals), status, gap)
+
+    def load(self, raw, marginals=False):
+        """
+        Load the raw results of another simulation with the same sets (e.g. the base scenario of a variant), to be
+        used as MIP start
+
+        :param raw:         Raw results (as returned by solve_native or get_gdx)
+        :param marginals:   If True, the marginals, the relaxation gaps and the solver status are loaded as well, so
+                            that the results can be re-used as they are (see darko.native.whatif)
+        """
+        sets = self.data.sets
+        for name, __, dim, marginal in self.HOURLY:
+            if (marginal and not marginals) or name not in raw:
+                continue
+            data = raw[name]
+            if dim is not None:
+                data = data.reindex(columns=list(sets[dim]), fill_value=0)
+            h = np.asarray(data.index, dtype=int) - 1
+            self.hourly[name][..., h] = data.values.T
+            self.known[h] = True
+        for name, __, dim in self.ITERATION:
+            if name not in raw:
+                continue
+            data = raw[name]
+            if dim is not None:
+                data = data.reindex(columns=list(sets[dim]), fill_value=0)
+            n = min(len(data), self.iteration[name].shape[-1])
+            self.iteration[name][..., :n] = data.values.T[..., :n]
+        if not marginals:
+            return
+        if 'OutputRelaxationGap' in raw:
+            gap = raw['OutputRelaxationGap']
+            loops = np.asarray(gap.index, dtype=int) - 1
+            self.gap[loops[loops < len(self.gap)]] = gap.values[loops < len(self.gap)]
+        if 'status' in raw:
+            status = raw['status'].reindex(columns=['model', 'solver'])
+            h = np.asarray(status.index, dtype=int) - 1
+            self.status[h] = status.values
+        self.block = self.iteration['OutputAcceptanceRatioOfBlockOrders'][:, -1].copy()
+
+    def start(self, model, loop=None):
+        """
+        MIP start of a horizon from the recorded values: all the variables of the horizon hours with recorded values
+        and, if loop is provided, the per-iteration variables (block orders, storage slack) of that iteration
+
+        :returns:   Tuple (index, value) with the columns of the start and their values
+        """
+        keep = self.known[model.hours]
+        index, value = [], []
+        for name, source, __, marginal in self.HOURLY:
+            if not marginal:
+                index.append(model.columns[source][..., keep].ravel())
+                value.append(self.hourly[name][..., model.hours[keep]].ravel())
+        if loop is not None and loop < self.iteration['OutputTotalWelfare'].shape[-1]:
+            for name, source, __ in self.ITERATION:
+                index.append(model.columns[source].ravel())
+                value.append(np.atleast_1d(self.iteration[name][..., loop]).ravel())
+        return np.concatenate(index), np.concatenate(value)
+
+    def raw_results(self):
+        """
+        Raw results, in the format of get_gdx (only the hours of the subset z are exported, as in DARKO.gms)
+        """
+        data = self.data
+        sets = data.sets
+        z = np.array([data.hours.index(hour) for hour in sets['z']], dtype=int)
+        hours = z + 1
+        out = {}
+        for name, __, dim, __ in self.HOURLY:
+            values = self.hourly[name][..., z]
+            if dim is None:
+                out[name] = pd.Series(values, index=hours)
+            else:
+                out[name] = pd.DataFrame(values.T, index=hours, columns=list(sets[dim]))
+        loops = np.arange(1, self.iteration['OutputTotalWelfare'].shape[-1] + 1)
+        for name, __, dim in self.ITERATION:
+            if dim is None:
+                out[name] = pd.Series(self.iteration[name], index=loops)
+            else:
+                out[name] = pd.DataFrame(self.iteration[name].T, index=loops, columns=list(sets[dim]))
+
+        # Cleared quantities:
+        out['OutputClearedDemand'] = out['OutputAcceptanceRatioOfDemandOrders'] * \
+            (data.AvailabilityFactorDemandOrder[:, z] * data.max_demand[:, None]).T
+        out['OutputClearedSimple'] = out['OutputAcceptanceRatioOfSimpleOrders'] * \
+            (data.AvailabilityFactorSimpleOrder[:, z] * data.capacity[:, None]).T
+        out['OutputClearedFlexible'] = out['OutputClearingStatusOfFlexibleOrder'] * \
+            (data.AvailabilityFactorFlexibleOrder * data.capacity)[None, :]
+        # As in DARKO.gms, the cleared block orders are computed with the acceptance ratios of the last horizon:
+        block = self.block if self.block is not None else np.zeros(len(sets['u']))
+        out['OutputClearedBlock'] = pd.DataFrame((block[:, None] * data.AvailabilityFactorBlockOrder[:, z] *
+                                                  data.capacity[:, None]).T, index=hours, columns=list(sets['u']))
+
+        sampled = ~np.isnan(self.gap)
+        if sampled.any():
+            out['OutputRelaxationGap'] = pd.Series(self.gap[sampled], index=loops[sampled])
+
+        solved = ~np.isnan(self.status[:, 0])
+        out['status'] = pd.DataFrame(self.status[solved], index=np.flatnonzero(solved) + 1,
+                                     columns=['model', 'solver'])
+        universe = [str(e) for k in ['u', 'd', 'n', 'l'] for e in sets[k]] + ['model', 'solver']
+        out['*'] = pd.Series(np.zeros(len(universe)), index=universe)
+        return out
+
+
+def storage_boundaries(data, horizons):
+    """
+    Coarse pre-pass of the parallel mode: LP relaxation of the model over the whole simulated period, which fixes the
+    storage levels at the boundaries of the horizons. The daily flow and net position ramping limits are applied to
+    the whole period (scaled by its number of days)
+
+    :param data:        ModelData of the simulation
+    :param horizons:    List of the horizons (first, last, last kept hour), as returned by rolling_horizons
+    :returns:           Array (s, horizons) with the initial storage levels of each horizon
+    """
+    from scipy.optimize import linprog
+
+    boundaries = np.tile(data.StorageInitial[:, None], (1, len(horizons)))
+    if data.sizes['s'] == 0 or len(horizons) == 1:
+        return boundaries
+    model = HorizonModel(data, 1, len(data.hours), data.StorageInitial)
+    for name in ['EQ_Flow_daily_ramp_up', 'EQ_Flow_daily_ramp_down', 'EQ_Node_daily_ramp_up',
+                 'EQ_Node_daily_ramp_down']:
+        model.b_ub[model.rows[name][1]] *= len(data.hours) / 24
+    lp = linprog(model.c, A_ub=model.A_ub, b_ub=model.b_ub, A_eq=model.A_eq, b_eq=model.b_eq,
+                 bounds=np.column_stack([model.lb, model.ub]), method='highs')
+    if lp.status != 0:
+        logging.warning('The storage pre-pass could not be solved (linprog status ' + str(lp.status) + '), the '
+                        'initial storage levels are used for all the horizons')
+        return boundaries
+    level = model.value(lp.x, 'StorageLevel')
+    for loop, (first, __, __) in enumerate(horizons[1:], start=1):
+        boundaries[:, loop] = level[:, first - 2]  # level at the end of the hour preceding the horizon
+    return boundaries
+
+
+# Model data, MIP start, solve settings and horizon structures of the worker processes of the parallel mode:
+_WORKER = {}
+
+
+def _init_worker(data, base, settings):
+    _WORKER.update(data=data, base=base, settings=settings, templates={})
+
+
+def _horizon_worker(loop, first, last, storage_initial):
+    """
+    Solve one horizon in a worker process of the parallel mode (see _init_worker)
+
+    :returns:   Tuple (values, status, gap) with the output values of the horizon (see _Recorder.extract)
+    """
+    data, base, templates = _WORKER['data'], _WORKER['base'], _WORKER['templates']
+    model = HorizonModel(data, first, last, storage_initial, template=templates.get(last - first), loop=loop)
+    templates.setdefault(last - first, model)
+    start = base.start(model, loop) if base is not None else None
+    x, duals, status, gap = _solve(model, loop, _WORKER['settings'], start)
+    if x is None:
+        logging.error('Horizon ' + str(loop + 1) + ' (hours ' + str(first) + ' to ' + str(last) + ') could not be '
+                      'solved (milp status ' + str(status) + ')')
+    return _Recorder.extract(model, x, duals), status, gap
+
+
+def _solve_parallel(data, horizons, recorder, base, settings, workers, repair):
+    """
+    Two-phase rolling horizon: storage boundaries from the coarse pre-pass, then all the horizons solved in parallel.
+    With repair, the horizons whose initial storage levels differ from the final levels of the previous horizon are
+    solved again in sequence, with the carried levels as in the sequential loop
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    t0 = tm.time()
+    boundaries = storage_boundaries(data, horizons)
+    logging.info('Storage boundaries of the {0} horizons computed in {1:.2f}s'.format(len(horizons), tm.time() - t0))
+    tasks = [(loop, first, last, boundaries[:, loop]) for loop, (first, last, __) in enumerate(horizons)]
+    if workers == 1:
+        _init_worker(data, base, settings)
+        solutions = [_horizon_worker(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(data, base, settings)) as pool:
+            solutions = list(pool.map(_horizon_worker, *zip(*tasks)))
+
+    if repair:
+        _init_worker(data, base, settings)
+        repaired = 0
+        for loop in range(1, len(horizons)):
+            values = solutions[loop - 1][0]
+            if values is None:
+                continue
+            first, last_kept = horizons[loop - 1][0], horizons[loop - 1][2]
+            carried = values['OutputStorageLevel'][:, last_kept - first]
+            if np.allclose(carried, boundaries[:, loop], rtol=REPAIR_TOLERANCE, atol=REPAIR_TOLERANCE):
+                continue
+            boundaries[:, loop] = carried
+            solutions[loop] = _horizon_worker(loop, horizons[loop][0], horizons[loop][1], carried)
+            repaired += 1
+        logging.info(str(repaired) + ' horizons solved again with the carried storage levels')
+
+    for loop, ((first, last, __), (values, status, gap)) in enumerate(zip(horizons, solutions)):
+        recorder.store(loop, np.arange(first - 1, last), values, status, gap)
+
+
+def solve_native(SimData, options=None, start=None, parallel=False, workers=None, repair=True, decomposition=None):
+    """
+    Solve a DARKO simulation with the native backend (open-source HiGHS solver, no GAMS required)
+
+    Each horizon is warm-started with the solution of the previous horizon in the overlapping (look-ahead) hours, or
+    with the solution of the same horizon in the start results if provided (e.g. the base scenario of a sweep). The
+    MIP starts require the HiGHS python interface (highspy) and are ignored otherwise
+
+    In relaxed mode (RelaxedMode in the config, see solve_relaxed), the LP relaxation of each horizon is solved
+    instead of the MILP, and the welfare gap to the MILP is computed every RelaxedGapSample horizons
+    (OutputRelaxationGap)
+
+    In parallel mode, the storage levels at the boundaries of the horizons are first fixed by a coarse LP over the
+    whole period, and all the horizons are then solved independently in a process pool. Simulations without storage
+    units are therefore solved fully in parallel
+
+    :param SimData:     DARKO simulation data (dictionary with sets, parameters, config, ...)
+    :param options:     Options passed to scipy.optimize.milp for each horizon (e.g. {'time_limit': 60})
+    :param start:       Raw results of a simulation with the same sets (e.g. the base scenario), used as MIP start
+    :param parallel:    If True, solve the horizons in parallel (two-phase mode) instead of in sequence
+    :param workers:     Number of worker processes in parallel mode (number of cores of the machine if None)
+    :param repair:      In parallel mode, solve again (in sequence) the horizons whose initial storage levels differ
+                        from the levels reached by the previous horizon
+    :param decomposition:   If True (or a dictionary with the arguments of solve_decomposed, e.g. {'clusters': ...}),
+                            solve each horizon with the zonal decomposition (see darko.native.decomposition)
+    :returns:           Dictionary with the raw results (dataframes indexed by hour number), as returned by get_gdx
+    """
+    check_solver()
+    data = ModelData(SimData)
+    horizons = rolling_horizons(len(data.hours), int(SimData['config']['HorizonLength']),
+                                int(SimData['config']['LookAhead']))
+    recorder = _Recorder(data, len(horizons))
+    settings = {'options': options, 'decomposition': decomposition,
+                'relaxed': int(SimData['config'].get('RelaxedMode', 0)),
+                'gap_sample': int(SimData['config'].get('RelaxedGapSample', 0))}
+    base = None
+    if start is not None:
+        base = _Recorder(data, len(horizons))
+        base.load(start)
+    t0 = tm.time()
+    if parallel:
+        _solve_parallel(data, horizons, recorder, base, settings, workers, repair)
+        logging.info('Native DARKO simulation solved in parallel in {0:.2f}s'.format(tm.time() - t0))
+        return recorder.raw_results()
+
+    storage_initial = data.StorageInitial.copy()
+    templates = {}  # one model structure per horizon length
+    for loop, (first, last, last_kept) in enumerate(horizons):
+        model = HorizonModel(data, first, last, storage_initial, template=templates.get(last - first), loop=loop)
+        templates.setdefault(last - first, model)
+        if base is not None:
+            x0 = base.start(model, loop)
+        else:
+            x0 = recorder.start(model)
+        x, duals, status, gap = _solve(model, loop, settings, x0)
+        recorder.record(loop, model, x, duals, status, gap)
+        if x is None:
+            logging.error('Horizon ' + str(loop + 1) + ' (hours ' + str(first) + ' to ' + str(last) + ') could not '
+                          'be solved (milp status ' + str(status) + ')')
+        else:
+            # Storage level at the last kept hour, used as initial level of the next horizon:
+            storage_initial = model.value(x, 'StorageLevel')[:, last_kept - first]
+        logging.info('Horizon ' + str(loop + 1) + '/' + str(len(horizons)) + ' solved')
+    logging.info('Native DARKO simulation solved in {0:.2f}s'.format(tm.time() - t0))
+    return recorder.raw_results()
+
+
+def write_raw_results(raw, SimData, filename, gams_dir=None):
+    """
+    Write the raw results of the native backend to a gdx file with the same symbols as the Results.gdx written by
+    DARKO.gms, so that the simulation folder can be post-processed with get_sim_results
+
+    :param raw:         Raw results, as returned by solve_native
+    :param SimData:     DARKO simulation data
+    :param filename:    Path to the gdx file (e.g. Results.gdx in the simulation folder)
+    :param gams_dir:    Path to the gams folder, as in the config (only the gdx library is used, no GAMS licence is
+                        required). Located automatically if not provided
+    """
+    from ..misc.gdx_handler import write_variables
+
+    sets = {k: list(SimData['sets'][k]) for k in ['u', 'd', 'n', 'l', 's']}
+    n_hours = len(SimData['sets']['h'])
+    n_loops = len(raw['OutputTotalWelfare'])
+    sets['h'] = [str(i) for i in range(1, n_hours + 1)]
+    sets['nlp'] = [str(i) for i in range(1, n_loops + 1)]
+    sets['tmp'] = ['model', 'solver']
+    parameters = {}
+    for name, data in raw.items():
+        if name == '*':
+            continue
+        last = 'nlp' if name in [it[0] for it in _Recorder.ITERATION] + ['OutputRelaxationGap'] else 'h'
+        data = data.reindex(range(1, len(sets[last]) + 1), fill_value=0)
+        if isinstance(data, pd.Series):
+            parameters[name] = {'sets': [last], 'val': data.values}
+            continue
+        first = [k for k in ['u', 'd', 'n', 'l', 's', 'tmp'] if list(data.columns) == sets[k]]
+        parameters[name] = {'sets': [first[0], last], 'val': data.values.T}
+    if gams_dir is None:
+        gams_dir = SimData['config'].get('GAMS_folder', '')
+    write_variables(gams_dir, filename, [sets, parameters])
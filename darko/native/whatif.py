@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental what-if analysis with the native backend.
+
+A variant of a solved simulation (e.g. a price series changed for one week, or a line derated) is compared with the
+base simulation, parameter by parameter. Only the horizons of the rolling horizon loop whose hours are affected by a
+difference are solved again. The following horizons are solved again as well as long as the storage levels carried
+from one horizon to the next differ from those of the base. The results of the other horizons are taken from the base
+results as they are::
+
+    raw = solve_whatif(SimData, 'Simulations/base')     # solved base simulation folder
+    raw = solve_whatif(SimData, base_SimData, base_raw)  # or base inputs and raw results in memory
+
+The base results can come from GAMS (Results.gdx) or from the native backend (solve_native).
+
+@author: Matija Pavičević
+"""
+
+import logging
+import os
+import time as tm
+
+import numpy as np
+import pandas as pd
+
+from .model import HorizonModel, ModelData, check_solver
+from .rolling import REPAIR_TOLERANCE, _Recorder, _solve, solve_native
+from ..preprocessing.utils import rolling_horizons
+
+# Parameters without time dimension which only affect the first horizon:
+FIRST_HORIZON = ['StorageInitial']
+
+
+def affected_horizons(base, SimData):
+    """
+    Horizons of the rolling horizon loop affected by the differences between the inputs of a variant and those of
+    its base simulation
+
+    :param base:        DARKO simulation data of the base simulation
+    :param SimData:     DARKO simulation data of the variant
+    :returns:           Boolean array with one value per horizon (all True if the two simulations do not have the same
+                        sets or if a parameter without time dimension differs)
+    """
+    sets = SimData['sets']
+    horizons = rolling_horizons(len(sets['h']), int(SimData['config']['HorizonLength']),
+                                int(SimData['config']['LookAhead']))
+    affected = np.zeros(len(horizons), dtype=bool)
+    different = [k for k in set(sets) | set(base['sets']) if list(sets.get(k, [])) != list(base['sets'].get(k, []))]
+    if len(different) > 0:
+        logging.info('The sets of the variant differ from those of the base (' + ', '.join(sorted(different)) + '), '
+                     'all the horizons are affected')
+        return ~affected
+
+    hours = np.zeros(len(sets['h']), dtype=bool)
+    for name, param in SimData['parameters'].items():
+        if name not in base['parameters']:
+            logging.info('Parameter ' + name + ' is not defined in the base, all the horizons are affected')
+            return ~affected
+        new, old = np.asarray(param['val'], dtype=float), np.asarray(base['parameters'][name]['val'], dtype=float)
+        if new.shape != old.shape:
+            logging.info('Parameter ' + name + ' does not have the same shape in the base, all the horizons are '
+                         'affected')
+            return ~affected
+        diff = (new != old) & ~(np.isnan(new) & np.isnan(old))
+        if not diff.any():
+            continue
+        last = param['sets'][-1] if len(param['sets']) > 0 else None
+        if last == 'h':
+            hours |= diff.reshape(-1, diff.shape[-1]).any(axis=0)
+        elif last == 'rh':
+            affected |= diff.reshape(-1, diff.shape[-1]).any(axis=0)
+        elif name in FIRST_HORIZON:
+            affected[0] = True
+        else:
+            logging.info('Parameter ' + name + ' differs from the base, all the horizons are affected')
+            return ~affected
+    for loop, (first, last, __) in enumerate(horizons):
+        affected[loop] |= hours[first - 1:last].any()
+    return affected
+
+
+def _kept(values, n):
+    """
+    Output values of a horizon (see _Recorder.extract) restricted to its first n hours
+    """
+    hourly = [name for name, __, __, __ in _Recorder.HOURLY]
+    return {name: value[..., :n] if name in hourly else value for name, value in values.items()}
+
+
+def solve_whatif(SimData, base, base_raw=None, options=None):
+    """
+    Solve a variant of a solved simulation, re-using the results of the base for the horizons which are not affected
+    by the differences between the two simulations
+
+    :param SimData:     DARKO simulation data of the variant
+    :param base:        Solved base simulation: path to its simulation folder (Inputs.p and Results.gdx) or its
+                        simulation data (with base_raw)
+    :param base_raw:    Raw results of the base simulation (as returned by solve_native or get_gdx). Read from the
+                        Results.gdx file of the base simulation folder if not provided
+    :param options:     Options passed to scipy.optimize.milp for each horizon (e.g. {'time_limit': 60})
+    :returns:           Dictionary with the raw results of the variant, as returned by solve_native
+    """
+    if isinstance(base, str):
+        if base_raw is None:
+            from ..misc.gdx_handler import get_gams_path, get_gdx
+            gams_dir = get_gams_path(gams_dir=SimData['config'].get('GAMS_folder', '').encode())
+            base_raw = get_gdx(gams_dir, os.path.join(base, 'Results.gdx'))
+        base = pd.read_pickle(os.path.join(base, 'Inputs.p'))
+    if base_raw is None:
+        logging.error('The raw results of the base simulation must be provided with its simulation data')
+        return False
+
+    affected = affected_horizons(base, SimData)
+    if affected.all():
+        logging.info('All the horizons are affected: the variant is solved completely, warm-started with the base')
+        return solve_native(SimData, options=options, start=base_raw)
+    if not affected.any():
+        logging.info('The variant does not differ from the base, the base results are re-used')
+        return base_raw
+
+    check_solver()
+    data = ModelData(SimData)
+    horizons = rolling_horizons(len(data.hours), int(SimData['config']['HorizonLength']),
+                                int(SimData['config']['LookAhead']))
+    recorder = _Recorder(data, len(horizons))
+    recorder.load(base_raw, marginals=True)
+    settings = {'options': options, 'decomposition': None,
+                'relaxed': int(SimData['config'].get('RelaxedMode', 0)),
+                'gap_sample': int(SimData['config'].get('RelaxedGapSample', 0))}
+
+    t0 = tm.time()
+    solved, carry, templates = [], False, {}
+    for loop, (first, last, last_kept) in enumerate(horizons):
+        if not (affected[loop] or carry):
+            continue
+        # Initial storage levels: level at the last kept hour of the previous horizon (base or solved again)
+        if loop == 0:
+            storage_initial = data.StorageInitial
+        else:
+            storage_initial = recorder.hourly['OutputStorageLevel'][:, horizons[loop - 1][2] - 1]
+        model = HorizonModel(data, first, last, storage_initial, template=templates.get(last - first), loop=loop)
+        templates.setdefault(last - first, model)
+        base_level = recorder.hourly['OutputStorageLevel'][:, last_kept - 1].copy()
+        x, duals, status, gap = _solve(model, loop, settings, recorder.start(model, loop))
+        values = _Recorder.extract(model, x, duals)
+        if x is None:
+            logging.error('Horizon ' + str(loop + 1) + ' (hours ' + str(first) + ' to ' + str(last) + ') could not '
+                          'be solved (milp status ' + str(status) + ')')
+            carry = True
+        else:
+            # The next horizon is solved again if the carried storage levels differ from those of the base:
+            level = model.value(x, 'StorageLevel')[:, last_kept - first]
+            carry = not np.allclose(level, base_level, rtol=REPAIR_TOLERANCE, atol=REPAIR_TOLERANCE)
+        hours = model.hours
+        if values is not None and loop + 1 < len(horizons) and not (affected[loop + 1] or carry):
+            # The look-ahead hours keep the values of the next horizon of the base, which is re-used:
+            hours = hours[:last_kept - first + 1]
+            values = _kept(values, len(hours))
+        recorder.store(loop, hours, values, status, gap)
+        solved.append(loop + 1)
+    logging.info('What-if variant solved in {0:.2f}s: {1} of {2} horizons solved again ({3})'.format(
+        tm.time() - t0, len(solved), len(horizons), ', '.join(str(loop) for loop in solved)))
+    return recorder.raw_results()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory DARKO pipeline: build -> solve -> results.
+
+The standard workflow writes the inputs to a simulation folder (Inputs.gdx, Inputs.p, ...), solves the model from
+that folder and reads everything back from disk in get_sim_results. run_pipeline chains the three steps and keeps the
+simulation data in memory: the intermediate files are only written when explicitly requested (artifacts=True). Only
+the gdx and gms files required by GAMS go through a temporary scratch folder. With backend='native', the model is
+solved in Python (HiGHS, see darko.native) and no file is written at all.
+
+Example::
+
+    config = dk.load_config('ConfigFiles/ConfigTest.xlsx')
+    inputs, results = dk.run_pipeline(config)
+    inputs, results = dk.run_pipeline(config, backend='native')
+
+@author: Matija Pavičević
+"""
+
+import logging
+
+from .preprocessing.preprocessing import build_simulation
+from .postprocessing.data_handler import disaggregate_results, format_inputs, format_results
+from .native import solve_native
+from .solve import solve_simdata
+
+
+def run_pipeline(config, artifacts=False, return_status=False, backend='gams'):
+    """
+    Build, solve and post-process a DARKO simulation without the intermediate disk round-trips.
+
+    :param config:          DARKO config dictionary (as returned by load_config)
+    :param artifacts:       If True, the simulation environment (Inputs.gdx, Inputs.p, DARKO.gms, ...) and the raw
+                            results are written to config['SimulationDirectory'], as with the standard workflow
+    :param return_status:   If True, the status dictionary is returned as third element
+    :param backend:         'gams' to solve DARKO.gms with GAMS, 'native' to solve the same model with the open-source
+                            HiGHS solver (darko.native)
+    :returns inputs,results:    Two dictionaries with all the input and outputs (or False if the solve failed)
+    """
+    SimData = build_simulation(config, write=artifacts)
+    sim_folder = config['SimulationDirectory'] if artifacts else None
+    if backend == 'native':
+        raw = solve_native(SimData)
+    elif backend == 'gams':
+        raw = solve_simdata(SimData, sim_folder=sim_folder, gams_folder=config.get('GAMS_folder'))
+    else:
+        logging.error('Unknown DARKO backend: ' + str(backend) + ". Available backends: 'gams', 'native'")
+        return False
+    if raw is False:
+        logging.error('The DARKO pipeline stopped because the simulation could not be solved')
+        return False
+
+    inputs = format_inputs(SimData)
+    results, status = format_results(inputs, raw)
+    results = disaggregate_results(inputs, results)
+    if return_status:
+        return inputs, results, status
+    return inputs, results
@@ -1,13 +1,19 @@
 import datetime as dt
+import hashlib
+import json
 import logging
+import os
+import shutil
 import sys
+import time as tm
 
 import numpy as np
 import pandas as pd
-import re
+from collections.abc import Mapping
 
-from ..misc.gdx_handler import get_gams_path, gdx_to_dataframe, gdx_to_list
+from ..misc.gdx_handler import GdxReader, get_gams_path, gdx_to_arrays, symbol_to_dataframe
 from ..misc.str_handler import clean_strings
+from .export import export_results
 
 
 def GAMSstatus(statustype, num):  # TODO: Check if this is ok
@@ -59,140 +65,737 @@ def GAMSstatus(statustype, num):  # TODO: Check if this is ok
 
 
 def get_sim_results(path='.', cache=None, temp_path=None, return_xarray=False,
-                    return_status=False, write_excel = True):  # TODO: Check if it works
+                    return_status=False, write_excel = True, lazy=False, export=None,
+                    disaggregate=True):  # TODO: Check if it works
     """
     This function reads the simulation environment folder once it has been solved and loads
     the input variables together with the results.
 
     :param path:                Relative path to the simulation environment folder (current path by default)
-    :param return_xarray:       If true the results are returned as a multidimensional xarray.
-                                Otherwise a dict of dataframes will be returned.
+    :param cache:               If true, the formatted results are stored in a cache folder and re-used as long as
+                                Results.gdx and Inputs.p are not modified
+    :param temp_path:           Cache folder (ResultsCache within the simulation folder by default)
+    :param return_xarray:       If true the results are returned as an xarray Dataset with named dimensions (unit,
+                                demand, node, line, hour, horizon), read lazily from the Results.nc store of the
+                                simulation folder (written on the first call). Otherwise a dict of dataframes will be
+                                returned.
     :param return_status:       IF true the output of this function is a tuple containng the following:
                                 (inputs, results, status). The latter is a dictionary with diagnostic messages.
+    :param lazy:                If true, the results are returned as a SimResults mapping which reads and formats
+                                each result on first access (write_excel is ignored in that case, only the formats
+                                listed in export are written)
+    :param export:              List of additional export formats ('parquet', 'csv', 'excel', see
+                                postprocessing.export). write_excel=True is equivalent to export=['excel']. The
+                                results are exported on every call, also when they are read from the cache
+    :param disaggregate:        If true (default) and the simulation was built with aggregate orders, the results of
+                                the aggregates are split between their members (see disaggregate_results). The
+                                xarray dataset always contains the results of the aggregates
     :returns inputs,results:    Two dictionaries with all the input and outputs
     """
 
     inputfile = path + '/Inputs.p'
     resultfile = path + '/Results.gdx'
-    if cache is not None or temp_path is not None:
-        logging.warning(
-            'Caching option has been removed. Try to save manually the results, e.g. results.to_netcdf("res.nc")')
 
-    inputs = pd.read_pickle(inputfile)
+    inputs = format_inputs(pd.read_pickle(inputfile))
+
+    if return_xarray:
+        return _get_sim_dataset(path, inputs, return_status)
+
+    formats = list(export) if export is not None else []
+    if write_excel is True and 'excel' not in formats and not lazy:
+        formats.append('excel')
+    elif write_excel is True and 'excel' not in formats:
+        logging.info('The results are read lazily: the excel file is not written (use export=[\'excel\'])')
+
+    if cache and not lazy:
+        cache_folder = temp_path if temp_path is not None else os.path.join(path, 'ResultsCache')
+        key = results_cache_key(path)
+        cached = read_results_cache(cache_folder, key)
+        if cached is not None:
+            results, status = cached
+            if disaggregate:
+                results = disaggregate_results(inputs, results)
+            if len(formats) > 0:
+                export_results(results, inputs['config']['SimulationDirectory'], formats=formats)
+            if return_status:
+                return inputs, results, status
+            return inputs, results
+
+    # We need to pass the dir in config if we run it in clusters. PBS script fail to autolocate
+    gams_dir = get_gams_path(gams_dir=inputs['config']['GAMS_folder'].encode())
+    if not gams_dir:  # couldn't locate
+        logging.error('GAMS path cannot be located. Cannot parse gdx files')
+        return False
+
+    if lazy:
+        results = SimResults(path, inputs, gams_dir=gams_dir, disaggregate=disaggregate)
+        if len(formats) > 0:
+            export_results(results, inputs['config']['SimulationDirectory'], formats=formats)
+        if return_status:
+            return inputs, results, results.status
+        return inputs, results
+
+    results, status = format_raw_results(inputs, gdx_to_arrays(gams_dir, resultfile, varname='all', verbose=True))
+    if cache and not lazy:
+        write_results_cache(cache_folder, key, results, status)
+    if disaggregate:
+        results = disaggregate_results(inputs, results)
+
+    out = (inputs, results)
+
+    if len(formats) > 0:
+        export_results(results, inputs['config']['SimulationDirectory'], formats=formats)
+
+    if return_status:
+        return out + (status,)
+    else:
+        return out
+
+
+def _get_sim_dataset(path, inputs, return_status=False):
+    """
+    Results of a simulation as an xarray Dataset. The dataset is read lazily from the Results.nc store of the
+    simulation folder, which is (re)built from Results.gdx if missing or outdated.
+
+    :param path:            Path to the simulation environment folder
+    :param inputs:          Formatted DARKO inputs
+    :param return_status:   If true, the status dictionary is returned as well
+    """
+    from .dataset import open_dataset, results_to_dataset, write_dataset
+    store = os.path.join(path, 'Results.nc')
+    key = results_cache_key(path)
+    dataset = open_dataset(store, key)
+    gams_dir = None
+    if dataset is None or return_status:
+        gams_dir = get_gams_path(gams_dir=inputs['config']['GAMS_folder'].encode())
+        if not gams_dir:  # couldn't locate
+            logging.error('GAMS path cannot be located. Cannot parse gdx files')
+            return False
+    status = None
+    if dataset is None:
+        results, status = format_raw_results(inputs, gdx_to_arrays(gams_dir, os.path.join(path, 'Results.gdx'),
+                                                                   varname='all', verbose=True))
+        write_dataset(results_to_dataset(inputs, results), store, source=key)
+        dataset = open_dataset(store)
+    if return_status:
+        if status is None:
+            lazy_results = SimResults(path, inputs, gams_dir=gams_dir)
+            status = lazy_results.status
+            lazy_results.close()
+        return inputs, dataset, status
+    return inputs, dataset
+
+
+def _load_worker(path, symbols, gams_dir, disaggregate=True):
+    """
+    Read and format a selection of results of one simulation folder (run in the worker processes of load_many)
+    """
+    inputs = pd.read_pickle(os.path.join(path, 'Inputs.p'))
+    indexes = result_indexes(inputs)
+    out = {}
+    with GdxReader(gams_dir, os.path.join(path, 'Results.gdx')) as gdx:
+        for key in symbols:
+            records = gdx.read(key) if key in gdx.symbols else None
+            out[key] = align_symbol(key, records, indexes)
+    if disaggregate:
+        out = disaggregate_results(inputs, out)
+    return out
+
+
+def load_many(paths, symbols=None, workers=None, disaggregate=True):
+    """
+    Load the same results from several simulation folders in parallel (one process per folder) and stack them
+    along a scenario dimension, for the comparison of scenarios::
+
+        prices = load_many(['Simulations/base', 'Simulations/high_demand'], ['OutputMarginalPrice'])
+        prices['OutputMarginalPrice']['high_demand']
+
+    :param paths:           List of simulation folders (the folder names are used as scenario names, or their paths
+                            relative to their common parent folder if several folders have the same name) or
+                            dictionary {scenario name: simulation folder}
+    :param symbols:         List of result symbols to be loaded (all the results with an hourly or iteration index if
+                            None)
+    :param workers:         Number of worker processes (number of cores of the machine if None). With workers=1 the
+                            folders are read one after the other in the calling process
+    :param disaggregate:    If true (default), the results of the aggregate orders are split between their members,
+                            as in get_sim_results
+    :returns:               Dictionary with, for each symbol, a dataframe whose first column level is the scenario.
+                            The time and entity indexes are aligned over all scenarios (missing values are set to 0)
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if not isinstance(paths, dict):
+        names = [os.path.basename(os.path.normpath(path)) for path in paths]
+        if len(set(names)) < len(paths):
+            # Folders with the same name: named by their path relative to the common parent folder
+            folders = [os.path.abspath(path) for path in paths]
+            common = os.path.commonpath(folders)
+            names = [os.path.relpath(folder, common).replace(os.sep, '/') for folder in folders]
+            if len(set(names)) < len(paths):
+                logging.critical('The same simulation folder is listed several times. Provide the scenario names '
+                                 'as a dictionary {name: folder}')
+                sys.exit(1)
+        paths = dict(zip(names, paths))
+    if symbols is None:
+        symbols = RESULTS_KEYS + RESULTS_KEYS_SPARSE + RESULTS_KEYS_ITERATION
+    elif isinstance(symbols, str):
+        symbols = [symbols]
+    names = list(paths)
+    folders = [os.path.abspath(paths[name]) for name in names]
+
+    # The GAMS path is located once for all the runs:
+    gams_dir = get_gams_path(gams_dir=pd.read_pickle(os.path.join(folders[0], 'Inputs.p'))['config'][
+        'GAMS_folder'].encode()) if len(folders) > 0 else None
+    if len(folders) > 0 and not gams_dir:
+        logging.error('GAMS path cannot be located. Cannot parse gdx files')
+        return False
+
+    t0 = tm.time()
+    if workers == 1:
+        runs = [_load_worker(folder, symbols, gams_dir, disaggregate) for folder in folders]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            runs = list(pool.map(_load_worker, folders, [symbols] * len(folders), [gams_dir] * len(folders),
+                                 [disaggregate] * len(folders)))
+    logging.info('Results of ' + str(len(folders)) + ' simulations loaded in {0:.2f}s'.format(tm.time() - t0))
+
+    out = {}
+    for key in symbols:
+        data = []
+        for run in runs:
+            df = run[key]
+            if isinstance(df, pd.Series):
+                df = df.to_frame(name=key)
+            elif not isinstance(df, pd.DataFrame):  # result not present in the gdx file
+                df = pd.DataFrame()
+            data.append(df)
+        # Same entities (columns) for all the scenarios:
+        columns = data[0].columns
+        for df in data[1:]:
+            columns = columns.union(df.columns, sort=False)
+        data = [df.reindex(columns=columns, fill_value=0) for df in data]
+        out[key] = pd.concat(data, axis=1, keys=names, names=['scenario']).fillna(0)
+    return out
+
 
+def _file_hash(filename, blocksize=2 ** 20):
+    """
+    md5 hash of the content of a file
+    """
+    m = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            m.update(block)
+    return m.hexdigest()
+
+
+def results_cache_key(path):
+    """
+    Key of the results cache of a simulation folder, based on the content of Results.gdx and Inputs.p
+
+    :param path:    Path to the simulation environment folder
+    """
+    return _file_hash(os.path.join(path, 'Results.gdx')) + _file_hash(os.path.join(path, 'Inputs.p'))
+
+
+def _cache_format():
+    """
+    Parquet is used for the results cache if pyarrow is available, pickle otherwise
+    """
+    try:
+        import pyarrow
+        return 'parquet'
+    except ImportError:
+        return 'pickle'
+
+
+def write_results_cache(folder, key, results, status):
+    """
+    Store the formatted results in a cache folder. The dataframes are written in a columnar format (one parquet
+    file per result, or pickle if pyarrow is not installed) and the index of the cache is written last, so that an
+    interrupted write leaves an invalid cache.
+
+    :param folder:      Cache folder (its previous content is removed)
+    :param key:         Cache key, as returned by results_cache_key
+    :param results:     Formatted results
+    :param status:      Status dictionary
+    """
+    fmt = _cache_format()
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    manifest = {'key': key, 'format': fmt, 'symbols': {}}
+    for name, data in results.items():
+        if isinstance(data, (pd.DataFrame, pd.Series)):
+            kind = 'series' if isinstance(data, pd.Series) else 'frame'
+            filename = name + '.' + fmt
+            frame = data.to_frame(name='__value__') if kind == 'series' else data
+            if fmt == 'parquet':
+                frame.to_parquet(os.path.join(folder, filename))
+            else:
+                frame.to_pickle(os.path.join(folder, filename))
+            manifest['symbols'][name] = {'type': kind, 'file': filename}
+        else:
+            manifest['symbols'][name] = {'type': 'scalar', 'value': data}
+    pd.to_pickle(status, os.path.join(folder, 'status.p'))
+    with open(os.path.join(folder, 'cache.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    logging.info('Results cached in ' + folder)
+
+
+def read_results_cache(folder, key):
+    """
+    Read the formatted results from a cache folder
+
+    :param folder:      Cache folder
+    :param key:         Expected cache key, as returned by results_cache_key
+    :returns:           Tuple (results, status), None if the cache does not exist or is outdated
+    """
+    manifest_file = os.path.join(folder, 'cache.json')
+    if not os.path.isfile(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    if manifest['key'] != key:
+        logging.info('The results cache in ' + folder + ' is outdated and will be rebuilt')
+        return None
+    results = {}
+    for name, entry in manifest['symbols'].items():
+        if entry['type'] == 'scalar':
+            results[name] = entry['value']
+            continue
+        filename = os.path.join(folder, entry['file'])
+        data = pd.read_parquet(filename) if manifest['format'] == 'parquet' else pd.read_pickle(filename)
+        results[name] = data['__value__'].rename(None) if entry['type'] == 'series' else data
+    status = pd.read_pickle(os.path.join(folder, 'status.p'))
+    logging.info('Results loaded from the cache in ' + folder)
+    return results, status
+
+
+def format_inputs(inputs):
+    """
+    Prepare the simulation inputs (SimData dictionary, as returned by build_simulation or read from Inputs.p) for
+    the post-processing: cleans the unit names and adds the formatted parameters if not already present.
+
+    :param inputs:  DARKO inputs (modified in place)
+    :returns:       DARKO inputs
+    """
     # Clean power plant names:
     inputs['sets']['u'] = clean_strings(inputs['sets']['u'])
     inputs['sets']['d'] = clean_strings(inputs['sets']['d'])
     inputs['units'].index = clean_strings(inputs['units'].index.tolist())
     inputs['demands'].index = clean_strings(inputs['demands'].index.tolist())
 
-
     # Add the formated parameters in the inputs variable if not already present:
     if not 'param_df' in inputs:
         inputs['param_df'] = dk_to_df(inputs)
+    return inputs
 
-    # We need to pass the dir in config if we run it in clusters. PBS script fail to autolocate
-    gams_dir = get_gams_path(gams_dir=inputs['config']['GAMS_folder'].encode())
-    if not gams_dir:  # couldn't locate
-        logging.error('GAMS path cannot be located. Cannot parse gdx files')
-        return False
 
-    results = gdx_to_dataframe(gdx_to_list(gams_dir, resultfile, varname='all', verbose=True), fixindex=True,
-                               verbose=True)
+# Result symbols with an hourly index (complete or sparse) and with one value per rolling horizon iteration:
+RESULTS_KEYS = ['OutputMarginalPrice']  # 'status'
 
-    # Set datetime index:
+RESULTS_KEYS_SPARSE = ['OutputFlow', 'OutputAcceptanceRatioOfDemandOrders', 'OutputAcceptanceRatioOfSimpleOrders',
+                       'OutputClearingStatusOfFlexibleOrder',
+                       'OutputNetPositionOfBiddingArea', 'OutputTempNetPositionOfBiddingArea',
+                       'OutputStorageInput', 'OutputStorageOutput', 'OutputStorageLevel',
+                       'OutputStorageMarginalPrice', 'OutputMarginalPrice_2', 'OutputMarginalPrice_3',
+                       'OutputSystemCost', 'OutputClearedDemand', 'OutputClearedSimple', 'OutputClearedBlock',
+                       'OutputClearedFlexible']
+
+RESULTS_KEYS_ITERATION = ['OutputAcceptanceRatioOfBlockOrders', 'OutputClearingStatusOfBlockOrder',
+                          'OutputTotalWelfare', 'OutputDailyNetPositionOfBiddingArea', 'OutputWaterslack',
+                          'OutputRelaxationGap']
+
+# Results of the aggregate orders that are volumes, split between the members pro rata to their offered quantities
+# (the other ones, e.g. the acceptance ratios, are the same for all the members of an aggregate):
+RESULTS_KEYS_VOLUME = ['OutputClearedSimple', 'OutputClearedDemand']
+
+
+def result_indexes(inputs):
+    """
+    Datetime indexes used to format the results of a DARKO simulation
+
+    :param inputs:      DARKO inputs
+    :returns:           Dictionary with the hourly index with ('index_long') and without ('index') the look-ahead
+                        period and the index of the rolling horizon iterations ('index_sim')
+    """
     StartDate = inputs['config']['StartDate']
     StopDate = inputs['config']['StopDate']  # last day of the simulation with look-ahead period
     StopDate_long = dt.datetime(*StopDate) + dt.timedelta(days=inputs['config']['LookAhead'])
-    index = pd.date_range(start=dt.datetime(*StartDate), end=dt.datetime(*StopDate), freq='h')
-    index_long = pd.date_range(start=dt.datetime(*StartDate), end=StopDate_long, freq='h')
-
     frequency = str(inputs['config']['HorizonLength']) + 'd'
-    index_sim = pd.date_range(start=dt.datetime(*StartDate), end=dt.datetime(*StopDate), freq=frequency)
-
-    keys = ['OutputMarginalPrice']  # 'status'
+    return {'index': pd.date_range(start=dt.datetime(*StartDate), end=dt.datetime(*StopDate), freq='h'),
+            'index_long': pd.date_range(start=dt.datetime(*StartDate), end=StopDate_long, freq='h'),
+            'index_sim': pd.date_range(start=dt.datetime(*StartDate), end=dt.datetime(*StopDate), freq=frequency)}
 
-    keys_sparse = ['OutputFlow', 'OutputAcceptanceRatioOfDemandOrders', 'OutputAcceptanceRatioOfSimpleOrders',
-                   'OutputClearingStatusOfFlexibleOrder',
-                   'OutputNetPositionOfBiddingArea', 'OutputTempNetPositionOfBiddingArea',
-                   'OutputStorageInput', 'OutputStorageOutput', 'OutputStorageLevel', 'OutputStorageMarginalPrice',
-                   'OutputMarginalPrice_2', 'OutputMarginalPrice_3',
-                   'OutputSystemCost', 'OutputClearedDemand', 'OutputClearedSimple', 'OutputClearedBlock',
-                   'OutputClearedFlexible']
 
-    keys_iteration = ['OutputAcceptanceRatioOfBlockOrders', 'OutputClearingStatusOfBlockOrder', 'OutputTotalWelfare',
-                      'OutputDailyNetPositionOfBiddingArea', 'OutputWaterslack']
+def format_symbol(key, data, indexes):
+    """
+    Format one raw result (indexed by the hour or iteration number) into a datetime-indexed result
 
+    :param key:         Name of the result symbol
+    :param data:        Raw dataframe, as returned by gdx_to_dataframe (None if the symbol is missing or empty)
+    :param indexes:     Datetime indexes, as returned by result_indexes
+    :returns:           Formatted result
+    """
+    index, index_long, index_sim = indexes['index'], indexes['index_long'], indexes['index_sim']
     # Setting the proper index to the result dataframes:
-    from itertools import chain
-    for key in chain(keys, keys_sparse):
-        if key in results:
-            if len(results[key]) == len(
-                    index_long):  # Case of variables for which the look-ahead period recorded (e.g. the lost loads)
-                results[key].index = index_long
-            elif len(results[key]) == len(
-                    index):  # Case of variables for which the look-ahead is not recorded (standard case)
-                results[key].index = index
-            else:  # Variables whose index is not complete (sparse formulation)
-                results[key].index = index_long[results[key].index - 1]
-                if key in keys_sparse:
-                    results[key] = results[key].reindex(index).fillna(0)
-        else:
-            results[key] = pd.DataFrame(index=index)
-
+    if key in RESULTS_KEYS or key in RESULTS_KEYS_SPARSE:
+        if data is None:
+            return pd.DataFrame(index=index)
+        # The raw dataframe is left untouched (raw results can be re-used, e.g. as start of solve_native):
+        data = data.copy()
+        if len(data) == len(index_long):
+            # Case of variables for which the look-ahead period recorded (e.g. the lost loads)
+            data.index = index_long
+        elif len(data) == len(index):
+            # Case of variables for which the look-ahead is not recorded (standard case)
+            data.index = index
+        else:  # Variables whose index is not complete (sparse formulation)
+            data.index = index_long[data.index - 1]
+            if key in RESULTS_KEYS_SPARSE:
+                data = data.reindex(index).fillna(0)
     # Include water slack in the results (only one number)
-    for key in keys_iteration:
-        if key in results:
-            results[key] = results[key].reindex(range(1,len(index_sim)+1), fill_value=0)
-            results[key].index = index_sim
+    elif key in RESULTS_KEYS_ITERATION:
+        if data is None:
+            return 0
+        data = data.reindex(range(1, len(index_sim) + 1), fill_value=0)
+        data.index = index_sim
+
+    # Remove epsilons:
+    if key == 'OutputMarginalPrice':
+        data[data >= 1e300] = 0
+    return data
+
+
+def align_symbol(key, records, indexes):
+    """
+    Format one result directly from its raw gdx arrays, in a single pass: the integer hour (or iteration) codes are
+    mapped to positions in the shared datetime indexes and the values are scattered into the final array. The result
+    is identical to format_symbol applied to the output of symbol_to_dataframe.
+
+    :param key:         Name of the result symbol (in RESULTS_KEYS, RESULTS_KEYS_SPARSE or RESULTS_KEYS_ITERATION)
+    :param records:     Raw records, as returned by gdx_to_arrays/GdxReader.read (None if the symbol is missing)
+    :param indexes:     Datetime indexes, as returned by result_indexes
+    :returns:           Formatted result
+    """
+    if records is None or len(records['values']) == 0 or records['keys'].shape[1] == 0:
+        return format_symbol(key, None, indexes)
+    if key not in RESULTS_KEYS + RESULTS_KEYS_SPARSE + RESULTS_KEYS_ITERATION:
+        return format_symbol(key, symbol_to_dataframe(key, records, fixindex=True), indexes)
+    keys, values, uels = records['keys'], records['values'], records['uels']
+    dims = keys.shape[1]
+    row_codes, row_pos = np.unique(keys[:, -1], return_inverse=True)
+    try:
+        steps = uels[row_codes].astype(int)  # hour or iteration number of each distinct row
+    except (TypeError, ValueError):
+        return format_symbol(key, symbol_to_dataframe(key, records, fixindex=True), indexes)
+    steps = steps[row_pos.ravel()]
+
+    index, index_long = indexes['index'], indexes['index_long']
+    if key in RESULTS_KEYS_ITERATION:
+        target = indexes['index_sim']
+    elif len(row_codes) == len(index_long):
+        target = index_long
+    elif len(row_codes) == len(index) or key in RESULTS_KEYS_SPARSE:
+        target = index  # the sparse results are completed with zeros, the look-ahead period is dropped
+    else:  # sparse result that is not completed: only the recorded hours are kept
+        hours = np.unique(steps)
+        target = index_long[hours - 1]
+        steps = np.searchsorted(hours, steps) + 1
+    positions = steps - 1
+    if dims > 1:
+        col_codes, col_pos = np.unique(keys[:, :-1], axis=0, return_inverse=True)
+        col_pos = col_pos.ravel()
+    keep = (positions >= 0) & (positions < len(target))
+    if not keep.all():
+        positions, values = positions[keep], values[keep]
+        if dims > 1:
+            col_pos = col_pos[keep]
+
+    if dims == 1:
+        data = np.zeros(len(target))
+        data[positions] = values
+        columns = None
+    else:
+        data = np.zeros((len(target), len(col_codes)))
+        data[positions, col_pos] = values
+        if dims == 2:
+            columns = pd.Index(uels[col_codes[:, 0]])
         else:
-            results[key] = 0
+            columns = pd.MultiIndex.from_arrays([uels[col_codes[:, i]] for i in range(dims - 1)])
 
-    # # Clean power plant names:
-    # results['OutputPower'].columns = clean_strings(results['OutputPower'].columns.tolist())
     # Remove epsilons:
-    if 'OutputMarginalPrice' in results:
-        results['OutputMarginalPrice'][results['OutputMarginalPrice'] >= 1e300] = 0
+    if key == 'OutputMarginalPrice':
+        np.putmask(data, data >= 1e300, 0)
+    if columns is None:
+        return pd.Series(data, index=target)
+    return pd.DataFrame(data, index=target, columns=columns, copy=False)
+
+
+def format_raw_results(inputs, records):
+    """
+    Format the raw gdx arrays of a DARKO simulation (as returned by gdx_to_arrays). The results with an hourly or
+    iteration index are aligned in one pass with align_symbol, the other ones are converted with symbol_to_dataframe
+
+    :param inputs:      DARKO inputs
+    :param records:     Dictionary with the raw records of each symbol
+    :returns:           Tuple with the formatted results and the status dictionary
+    """
+    indexes = result_indexes(inputs)
+    aligned = RESULTS_KEYS + RESULTS_KEYS_SPARSE + RESULTS_KEYS_ITERATION
+    results = {}
+    for symbol in records:
+        if symbol not in aligned:
+            df = symbol_to_dataframe(symbol, records[symbol], fixindex=True)
+            if df is not None:
+                results[symbol] = df
+    for key in aligned:
+        results[key] = align_symbol(key, records.get(key), indexes)
+    status = format_status(results.pop('status'), results.pop('*'))
+    return results, status
+
+
+def disaggregate_symbol(key, data, aggregation):
+    """
+    Replace the columns of the aggregate orders of a result by the columns of their members (see
+    darko.preprocessing.aggregation)
+
+    :param key:             Name of the result symbol
+    :param data:            Formatted result
+    :param aggregation:     Shares of the members in the offered quantities of the aggregates (SimData['aggregation'])
+    :returns:               Disaggregated result
+    """
+    if not isinstance(data, pd.DataFrame) or data.columns.nlevels > 1:
+        return data
+    for shares in aggregation.values():
+        selected = shares.loc[:, shares.columns.get_level_values(0).isin(data.columns)]
+        if selected.shape[1] == 0:
+            continue
+        aggregates = selected.columns.get_level_values(0)
+        values = data.loc[:, aggregates].values
+        if key in RESULTS_KEYS_VOLUME:
+            values = values * selected.reindex(data.index, method='nearest').values
+        members = pd.DataFrame(values, index=data.index, columns=selected.columns.get_level_values(1))
+        data = pd.concat([data.drop(columns=pd.unique(aggregates)), members], axis=1)
+    return data
+
+
+def disaggregate_results(inputs, results):
+    """
+    Disaggregate all the results of a simulation built with aggregate orders (OrderAggregation in the config)
+
+    :param inputs:      DARKO inputs
+    :param results:     Formatted results
+    :returns:           Dictionary with the disaggregated results (the results are returned as is if the simulation
+                        has no aggregate orders)
+    """
+    if 'aggregation' not in inputs:
+        return results
+    return {key: disaggregate_symbol(key, data, inputs['aggregation']) for key, data in results.items()}
+
 
-    status = {}
-    if "model" in results['status']:
-        errors = results['status'][(results['status']['model'] != 1) & (results['status']['model'] != 8)]
+def format_status(status, universe):
+    """
+    Build the status dictionary from the raw status of the solves and log the errors
+
+    :param status:      Raw 'status' dataframe of the results
+    :param universe:    Raw '*' (universe) series of the results
+    :returns:           Status dictionary
+    """
+    out = {}
+    if "model" in status:
+        errors = status[(status['model'] != 1) & (status['model'] != 8)]
         if len(errors) > 0:
             logging.critical('Some simulation errors were encountered. Some results could not be computed, '
-                             'for example at \n \ time ' + str(errors.index[0]) + ', with the error message: "' +
+                             'for example at \n \\ time ' + str(errors.index[0]) + ', with the error message: "' +
                              GAMSstatus('model', errors[
                                  'model'].iloc[
-                                 0]) + '". \n \ The complete list is available in results["errors"] \n \ The '
+                                 0]) + '". \n \\ The complete list is available in results["errors"] \n \\ The '
                                        'optimization might be debugged by activating the Debug flag in the GAMS '
                                        'simulation file and running it')
             for i in errors.index:
                 errors.loc[i, 'Error Message'] = GAMSstatus('model', errors['model'][i])
-            status['errors'] = errors
-    status['*'] = results.pop('*')
-    status['status'] = results.pop('status')
+            out['errors'] = errors
+    out['*'] = universe
+    out['status'] = status
+    return out
 
-    out = (inputs, results)
 
-    if write_excel is True:
-        writer = pd.ExcelWriter(inputs['config']['SimulationDirectory'] + '/Results.xlsx', engine='xlsxwriter')
-        for df_name, df in results.items():
-            if isinstance(df, int):
-                logging.warning(df_name + ': Has no output, variable is probably not used within the model, if not '
-                                          'sure check the Results.gdx file')
-            else:
-                df_name = re.sub(r'\bOutput', '', df_name)
-                df.to_excel(writer, sheet_name=df_name)
-        writer.save()
+def format_results(inputs, results):
+    """
+    Format the raw results of a DARKO simulation (dictionary of dataframes indexed by the hour number, as returned by
+    gdx_to_dataframe) into datetime-indexed results and extract the solver status.
 
-    if return_status:
-        return out + (status,)
-    else:
-        return out
+    :param inputs:      DARKO inputs
+    :param results:     Dictionary with the raw results
+    :returns:           Tuple with the formatted results and the status dictionary
+    """
+    results = dict(results)
+    indexes = result_indexes(inputs)
+    from itertools import chain
+    for key in chain(RESULTS_KEYS, RESULTS_KEYS_SPARSE, RESULTS_KEYS_ITERATION):
+        results[key] = format_symbol(key, results.get(key), indexes)
+
+    status = format_status(results.pop('status'), results.pop('*'))
+    return results, status
+
+
+class SimResults(Mapping):
+    """
+    Read-only mapping with the results of a DARKO simulation, loaded on demand. The gdx file is opened once and
+    each symbol is read, formatted and cached on first access::
+
+        results = SimResults('Simulations/simulationTest', inputs)
+        prices = results['OutputMarginalPrice']
+        results.load(['OutputFlow', 'OutputClearedDemand'])
+
+    :param path:            Path to the simulation environment folder
+    :param inputs:          DARKO inputs (formatted with format_inputs)
+    :param gams_dir:        Gams working directory (located automatically if not provided)
+    :param disaggregate:    If true, the results of the aggregate orders are split between their members
+    """
+
+    def __init__(self, path, inputs, gams_dir=None, disaggregate=True):
+        if gams_dir is None:
+            gams_dir = get_gams_path(gams_dir=inputs['config']['GAMS_folder'].encode())
+        self.inputs = inputs
+        self._gdx = GdxReader(gams_dir, os.path.join(path, 'Results.gdx'))
+        self._indexes = result_indexes(inputs)
+        self._cache = {}
+        self._status = None
+        self._aggregation = inputs.get('aggregation') if disaggregate else None
+        # Non-empty symbols of the gdx file, followed by the results that are always provided:
+        self._keys = [name for name, (__, dims, records) in self._gdx.symbols.items()
+                      if records > 0 and dims > 0 and name not in ['*', 'status']]
+        self._keys += [key for key in RESULTS_KEYS + RESULTS_KEYS_SPARSE + RESULTS_KEYS_ITERATION
+                       if key not in self._keys]
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            if key not in self._keys:
+                raise KeyError(key)
+            records = self._read(key) if key in self._gdx.symbols else None
+            self._cache[key] = align_symbol(key, records, self._indexes)
+            if self._aggregation is not None:
+                self._cache[key] = disaggregate_symbol(key, self._cache[key], self._aggregation)
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _read(self, key):
+        if self._gdx.handle is None:
+            logging.critical('The results file ' + self._gdx.filename + ' has already been closed')
+            sys.exit(1)
+        return self._gdx.read(key)
+
+    def load(self, keys):
+        """
+        Load several results at once
+
+        :param keys:    List of result names (e.g. ['OutputMarginalPrice', 'OutputFlow'])
+        :returns:       Dictionary with the requested results
+        """
+        return {key: self[key] for key in keys}
+
+    @property
+    def status(self):
+        """
+        Status dictionary of the simulation (as returned by get_sim_results with return_status=True)
+        """
+        if self._status is None:
+            self._status = format_status(symbol_to_dataframe('status', self._read('status'), fixindex=True),
+                                         symbol_to_dataframe('*', self._read('*'), fixindex=True))
+        return self._status
+
+    def close(self):
+        """
+        Close the results file. The results that have already been loaded remain available
+        """
+        self._gdx.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __repr__(self):
+        return 'SimResults(' + self._gdx.filename + ', loaded: ' + ', '.join(self._cache) + ')'
+
+
+class ParamFrames(Mapping):
+    """
+    Read-only mapping with the DARKO input parameters as dataframes, as returned by dk_to_df. Each dataframe is built
+    on first access as a view over the parameter array (no copy of the values), so that the parameters which are not
+    used in the post-processing do not cost any time or memory. The 'sets' key contains the DARKO sets.
+
+    :param sets:        DARKO sets
+    :param parameters:  DARKO parameters ({'sets': [...], 'val': array})
+    :param dates:       Index used for the time dimension (datetime index or range of integers)
+    :param timeindex:   True if dates is a datetime index
+    """
+
+    def __init__(self, sets, parameters, dates, timeindex):
+        self.sets = sets
+        self.parameters = parameters
+        self.dates = dates
+        self.timeindex = timeindex
+        self._cache = {}
+
+    def __getitem__(self, key):
+        if key == 'sets':
+            return self.sets
+        if key not in self._cache:
+            self._cache[key] = self._to_frame(key)
+        return self._cache[key]
+
+    def __iter__(self):
+        yield 'sets'
+        for p in self.parameters:
+            yield p
+
+    def __len__(self):
+        return len(self.parameters) + 1
+
+    def _to_frame(self, p):
+        sets, dates = self.sets, self.dates
+        var = self.parameters[p]
+        dim = len(var['sets'])
+        if var['sets'][-1] == 'h' and self.timeindex and dim > 1:
+            var['firstrow'] = 5
+        else:
+            var['firstrow'] = 1
+        values = np.asarray(var['val'])
+        # The time steps are the last dimension: the first len(dates) elements are selected by slicing (view)
+        if var['sets'][-1] == 'h':
+            values = values[..., :len(dates)]
+            index = dates
+        else:
+            index = sets[var['sets'][-1]]
+        if dim == 1:
+            return pd.DataFrame(values.reshape(-1, 1), columns=[p], index=index, copy=False)
+        elif dim == 2:
+            # The transpose of a C-contiguous array is a view, stored as is in the dataframe block
+            return pd.DataFrame(values.transpose(), index=index, columns=sets[var['sets'][0]], copy=False)
+        elif dim == 3:
+            columns = pd.MultiIndex.from_product([sets[var['sets'][0]], sets[var['sets'][1]]])
+            values = values.reshape(len(columns), values.shape[-1])
+            return pd.DataFrame(values.transpose(), index=index, columns=columns, copy=False)
+        else:
+            logging.error(
+                'Only three dimensions currently supported. Parameter ' + p + ' has ' + str(dim) + ' dimensions.')
+            sys.exit(1)
 
 
 def dk_to_df(inputs):  # TODO: Adjust gams sets for h and z
     """
-    Function that converts the DARKO data format into a dictionary of dataframes
+    Function that converts the DARKO data format into a dictionary of dataframes. The dataframes are built lazily,
+    on first access (see ParamFrames)
 
     :param inputs: input file
     :return: dictionary of dataframes
@@ -223,50 +826,4 @@ def dk_to_df(inputs):  # TODO: Adjust gams sets for h and z
             'The provided index has a length of ' + str(len(dates)) + ' while the simulation was designed for ' + str(
                 len(sets['z'])) + ' time elements')
 
-    idx = range(len(dates))
-
-    out = {'sets': sets}
-
-    # Printing each parameter in a separate sheet and workbook:
-    for p in parameters:
-        var = parameters[p]
-        dim = len(var['sets'])
-        if var['sets'][-1] == 'h' and timeindex and dim > 1:
-            # if len(dates) != var['val'].shape[-1]: sys.exit('The date range in the Config variable (' + str(len(
-            # dates)) + ' time steps) does not match the length of the time index (' + str(var['val'].shape[-1]) + ')
-            # for variable ' + p)
-            var['firstrow'] = 5
-        else:
-            var['firstrow'] = 1
-        if dim == 1:
-            if var['sets'][0] == 'h':
-                out[p] = pd.DataFrame(var['val'][idx], columns=[p], index=dates)
-            else:
-                out[p] = pd.DataFrame(var['val'], columns=[p], index=sets[var['sets'][0]])
-        elif dim == 2:
-            values = var['val']
-            list_sets = [sets[var['sets'][0]], sets[var['sets'][1]]]
-            if var['sets'][1] == 'h':
-                out[p] = pd.DataFrame(values.transpose()[idx, :], index=dates, columns=list_sets[0])
-            else:
-                out[p] = pd.DataFrame(values.transpose(), index=list_sets[1], columns=list_sets[0])
-        elif dim == 3:
-            list_sets = [sets[var['sets'][0]], sets[var['sets'][1]], sets[var['sets'][2]]]
-            values = var['val']
-            values2 = np.zeros([len(list_sets[0]) * len(list_sets[1]), len(list_sets[2])])
-            cols = np.zeros([2, len(list_sets[0]) * len(list_sets[1])])
-            for i in range(len(list_sets[0])):
-                values2[i * len(list_sets[1]):(i + 1) * len(list_sets[1]), :] = values[i, :, :]
-                cols[0, i * len(list_sets[1]):(i + 1) * len(list_sets[1])] = i
-                cols[1, i * len(list_sets[1]):(i + 1) * len(list_sets[1])] = range(len(list_sets[1]))
-
-            columns = pd.MultiIndex([list_sets[0], list_sets[1]], cols)
-            if var['sets'][2] == 'h':
-                out[p] = pd.DataFrame(values2.transpose()[idx, :], index=dates, columns=columns)
-            else:
-                out[p] = pd.DataFrame(values2.transpose(), index=list_sets[2], columns=columns)
-        else:
-            logging.error(
-                'Only three dimensions currently supported. Parameter ' + p + ' has ' + str(dim) + ' dimensions.')
-            sys.exit(1)
-    return out
+    return ParamFrames(sets, parameters, dates, timeindex)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+xarray backend for the DARKO results.
+
+The results are converted into one xarray Dataset with named dimensions (unit, demand, node, line, hour, horizon)
+instead of a dictionary of dataframes with players as columns. The dataset is written once per run to a netCDF store
+next to Results.gdx (Results.nc) and re-opened lazily afterwards: the variables are only read from disk when they are
+accessed (by chunks if dask is installed)::
+
+    inputs, results = dk.get_sim_results(path, return_xarray=True)
+    results['OutputMarginalPrice'].sel(node='Z1', hour='2016-01-02')
+
+The store records the hash of Results.gdx and Inputs.p and is rebuilt when they change.
+
+@author: Matija Pavičević
+"""
+
+import logging
+import os
+
+import pandas as pd
+
+# Name of the dataset dimension associated to each DARKO set:
+SET_DIMENSIONS = [('u', 'unit'), ('d', 'demand'), ('n', 'node'), ('l', 'line')]
+
+
+def _label_dimension(labels, inputs, name):
+    """
+    Find the dimension matching a list of column labels: the first DARKO set containing all the labels
+    """
+    labels = set(labels)
+    for s, dim in SET_DIMENSIONS:
+        if labels <= set(inputs['sets'][s]):
+            return dim, inputs['sets'][s]
+    logging.debug('Could not associate the columns of ' + name + ' to a DARKO set')
+    return name + '_dim', None
+
+
+def results_to_dataset(inputs, results):
+    """
+    Convert the formatted DARKO results into an xarray Dataset
+
+    :param inputs:      DARKO inputs
+    :param results:     Formatted results (dictionary or SimResults mapping of dataframes)
+    :returns:           xarray Dataset with one variable per result
+    """
+    import xarray as xr
+    from .data_handler import RESULTS_KEYS_ITERATION, result_indexes
+
+    indexes = result_indexes(inputs)
+    # The hour dimension includes the look-ahead period (the results without look-ahead are filled with 0):
+    hour = indexes['index_long']
+
+    variables = {}
+    for name, data in results.items():
+        if not isinstance(data, (pd.DataFrame, pd.Series)):
+            continue
+        # Dimension of the index:
+        if name in RESULTS_KEYS_ITERATION:
+            row_dim, row_index = 'horizon', indexes['index_sim']
+        elif isinstance(data.index, pd.DatetimeIndex):
+            row_dim, row_index = 'hour', hour
+        else:
+            row_dim, row_index = name + '_index', data.index
+        data = data.reindex(row_index, fill_value=0)
+        if isinstance(data, pd.Series):
+            variables[name] = xr.DataArray(data.values, coords={row_dim: row_index}, dims=[row_dim])
+            continue
+        # Dimensions of the columns, reindexed on the complete DARKO sets:
+        col_dims, col_coords = [], []
+        for level in range(data.columns.nlevels):
+            labels = data.columns.get_level_values(level)
+            dim, full = _label_dimension(labels, inputs, name if level == 0 else name + '_' + str(level))
+            if dim in col_dims:  # e.g. lines between two nodes
+                dim = dim + '_' + str(level)
+            col_dims.append(dim)
+            col_coords.append(list(full) if full is not None else list(pd.unique(labels)))
+        if data.columns.nlevels == 1:
+            data = data.reindex(columns=col_coords[0], fill_value=0)
+            values = data.values
+        else:
+            full = pd.MultiIndex.from_product(col_coords)
+            values = data.reindex(columns=full, fill_value=0).values.reshape([len(data)] + [len(c) for c in col_coords])
+        coords = {row_dim: row_index}
+        coords.update(dict(zip(col_dims, col_coords)))
+        variables[name] = xr.DataArray(values, coords=coords, dims=[row_dim] + col_dims)
+    return xr.Dataset(variables)
+
+
+def write_dataset(dataset, filename, source=None):
+    """
+    Write the results dataset to a netCDF store
+
+    :param dataset:     xarray Dataset
+    :param filename:    Path to the store (e.g. Results.nc)
+    :param source:      Hash of the source files (see results_cache_key), stored as attribute
+    """
+    if source is not None:
+        dataset.attrs['source'] = source
+    tmpfile = filename + '.tmp'
+    dataset.to_netcdf(tmpfile)
+    os.replace(tmpfile, filename)
+    logging.info('Results dataset written to ' + filename)
+
+
+def open_dataset(filename, source=None):
+    """
+    Open a results store lazily (with dask chunks if dask is installed)
+
+    :param filename:    Path to the store
+    :param source:      Expected hash of the source files. The store is ignored if it does not match
+    :returns:           xarray Dataset, None if the store does not exist or is outdated
+    """
+    import xarray as xr
+    if not os.path.isfile(filename):
+        return None
+    try:
+        import dask
+        chunks = {}
+    except ImportError:
+        chunks = None
+    dataset = xr.open_dataset(filename, chunks=chunks)
+    if source is not None and dataset.attrs.get('source') != source:
+        dataset.close()
+        logging.info('The results dataset ' + filename + ' is outdated and will be rebuilt')
+        return None
+    return dataset
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Export of the DARKO results to files.
+
+Several formats are available and new ones can be added with register_exporter:
+
+    - 'parquet':    One parquet file per result symbol and month (Results_parquet/<symbol>/month=YYYY-MM.parquet)
+    - 'csv':        One gzipped csv file per result symbol (Results_csv/<symbol>.csv.gz), written by chunks
+    - 'excel':      Results.xlsx, written row by row with xlsxwriter in constant memory mode. Results with more rows
+                    (or columns) than allowed in an excel sheet are split over several sheets
+
+The symbols are exported in parallel (one task per symbol and format) in a thread pool::
+
+    export_results(results, 'Simulations/simulationTest', formats=['parquet', 'excel'])
+
+@author: Matija Pavičević
+"""
+
+import logging
+import os
+import re
+import time as tm
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_COLS = 16384
+
+# Registered exporters. Symbol exporters are called once per result: func(name, data, folder). Workbook exporters are
+# called once with all the results: func(results, folder)
+_SYMBOL_EXPORTERS = {}
+_WORKBOOK_EXPORTERS = {}
+
+
+def register_exporter(name, func, per_symbol=True):
+    """
+    Register a new export format
+
+    :param name:        Name of the format (used in the formats argument of export_results)
+    :param func:        Export function. func(name, data, folder) if per_symbol, func(results, folder) otherwise
+    :param per_symbol:  True if the format writes one file per result symbol (the symbols are then exported in
+                        parallel), False if all the results go to the same file
+    """
+    if per_symbol:
+        _SYMBOL_EXPORTERS[name] = func
+    else:
+        _WORKBOOK_EXPORTERS[name] = func
+
+
+def _as_frame(data):
+    if isinstance(data, pd.Series):
+        return data.to_frame(name=data.name if data.name is not None else 'value')
+    return data
+
+
+def export_parquet(name, data, folder):
+    """
+    Write one result to parquet files, partitioned by month if the result has a datetime index
+
+    :param name:    Name of the result symbol
+    :param data:    Result dataframe (or series)
+    :param folder:  Simulation folder
+    """
+    path = os.path.join(folder, 'Results_parquet', name)
+    os.makedirs(path, exist_ok=True)
+    data = _as_frame(data)
+    if data.columns.nlevels == 1 and not all(isinstance(col, str) for col in data.columns):
+        data = data.rename(columns=str)  # parquet only accepts string column names
+    if isinstance(data.index, pd.DatetimeIndex) and len(data) > 0:
+        for month, chunk in data.groupby(data.index.to_period('M')):
+            chunk.to_parquet(os.path.join(path, 'month=' + str(month) + '.parquet'))
+    else:
+        data.to_parquet(os.path.join(path, 'all.parquet'))
+
+
+def export_csv(name, data, folder, chunksize=10000):
+    """
+    Write one result to a gzipped csv file
+
+    :param name:        Name of the result symbol
+    :param data:        Result dataframe (or series)
+    :param folder:      Simulation folder
+    :param chunksize:   Number of rows written at a time
+    """
+    path = os.path.join(folder, 'Results_csv')
+    os.makedirs(path, exist_ok=True)
+    _as_frame(data).to_csv(os.path.join(path, name + '.csv.gz'), compression='gzip', chunksize=chunksize)
+
+
+def export_excel(results, folder):
+    """
+    Write all the results to Results.xlsx. The workbook is written row by row in constant memory mode and the
+    results that do not fit in an excel sheet are split over several sheets (<name>, <name>_2, ...)
+
+    :param results: Dictionary with the results
+    :param folder:  Simulation folder
+    """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(os.path.join(folder, 'Results.xlsx'), {'constant_memory': True,
+                                                                          'nan_inf_to_errors': True})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+    for name, data in results.items():
+        data = _as_frame(data)
+        sheet_name = re.sub(r'\bOutput', '', name)[:28]
+        nlevels = data.columns.nlevels
+        max_rows = EXCEL_MAX_ROWS - nlevels
+        max_cols = EXCEL_MAX_COLS - 1
+        datetime_index = isinstance(data.index, pd.DatetimeIndex)
+        part = 0
+        for col_start in range(0, max(len(data.columns), 1), max_cols):
+            columns = data.columns[col_start:col_start + max_cols]
+            values = data[columns].to_numpy() if len(columns) > 0 else None
+            for row_start in range(0, max(len(data), 1), max_rows):
+                part += 1
+                sheet = workbook.add_worksheet(sheet_name if part == 1 else sheet_name + '_' + str(part))
+                # Header (one row per column level):
+                for level in range(nlevels):
+                    labels = columns.get_level_values(level) if nlevels > 1 else columns
+                    sheet.write_row(level, 1, [str(label) for label in labels])
+                # Data, row by row:
+                for i in range(row_start, min(row_start + max_rows, len(data))):
+                    row = nlevels + i - row_start
+                    if datetime_index:
+                        sheet.write_datetime(row, 0, data.index[i].to_pydatetime(), date_format)
+                    else:
+                        sheet.write(row, 0, data.index[i])
+                    if values is not None:
+                        sheet.write_row(row, 1, values[i].tolist())
+        if part > 1:
+            logging.info('Result ' + name + ' was split over ' + str(part) + ' excel sheets')
+    workbook.close()
+
+
+register_exporter('parquet', export_parquet)
+register_exporter('csv', export_csv)
+register_exporter('excel', export_excel, per_symbol=False)
+
+
+def export_results(results, folder, formats=('excel',), workers=None):
+    """
+    Export the results of a DARKO simulation
+
+    :param results:     Dictionary (or SimResults mapping) with the results
+    :param folder:      Folder in which the files are written (usually the simulation folder)
+    :param formats:     List of export formats ('parquet', 'csv', 'excel' or any registered format)
+    :param workers:     Number of threads (default value of ThreadPoolExecutor if None)
+    """
+    unknown = [fmt for fmt in formats if fmt not in _SYMBOL_EXPORTERS and fmt not in _WORKBOOK_EXPORTERS]
+    if len(unknown) > 0:
+        logging.error('Unknown export format(s): ' + ', '.join(unknown) + '. Available formats: ' +
+                      ', '.join(list(_SYMBOL_EXPORTERS) + list(_WORKBOOK_EXPORTERS)))
+        return False
+
+    t0 = tm.time()
+    data = {}
+    for name, df in results.items():
+        if isinstance(df, (pd.DataFrame, pd.Series)):
+            data[name] = df
+        else:
+            logging.warning(name + ': Has no output, variable is probably not used within the model, if not '
+                                   'sure check the Results.gdx file')
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tasks = [pool.submit(_WORKBOOK_EXPORTERS[fmt], data, folder) for fmt in formats if fmt in _WORKBOOK_EXPORTERS]
+        tasks += [pool.submit(_SYMBOL_EXPORTERS[fmt], name, df, folder)
+                  for fmt in formats if fmt in _SYMBOL_EXPORTERS for name, df in data.items()]
+        for task in tasks:
+            task.result()  # re-raises the exceptions of the export functions
+    logging.info('Results exported to ' + folder + ' (' + ', '.join(formats) + ') in {0:.2f}s'.format(tm.time() - t0))
+    return True
@@ -13,6 +13,7 @@ import matplotlib.pyplot as plt
 
 from ..common import commons
 from .data_handler import dk_to_df
+from ..misc.registry import get_registry
 
 
 # Helper functions
@@ -46,8 +47,8 @@ def filter_by_zone(OutputData, inputs, z):
     :param z:               Selected zone (e.g. 'BE')
     :returns Power:         Dataframe with power generation by zone
     """
-    loc = inputs['units']['Zone']
-    Data = OutputData.loc[:, [u for u in OutputData.columns if loc[u] == z]]
+    units = get_registry(inputs).units
+    Data = OutputData.loc[:, [u for u in OutputData.columns if u in units and units.get(u, 'Zone') == z]]
     return Data
 
 
@@ -60,8 +61,8 @@ def filter_by_tech(OutputData, inputs, t):
     :param t:             Selected tech (e.g. 'HOBO')
     :returns Power:
     """
-    loc = inputs['units']['Technology']
-    Data = OutputData.loc[:, [u for u in OutputData.columns if loc[u] == t]]
+    units = get_registry(inputs).units
+    Data = OutputData.loc[:, [u for u in OutputData.columns if u in units and units.get(u, 'Technology') == t]]
     return Data
 
 
@@ -93,7 +94,8 @@ def get_net_position_plot_data(inputs, results, z):
     :return:
     """
 
-    MaxDemand = inputs['demands'].loc[inputs['demands']['Zone'] == z]['MaxDemand'].agg('sum')
+    demands = get_registry(inputs).demands
+    MaxDemand = demands.column('MaxDemand')[demands.select('Zone', z)].sum()
 
     data = pd.DataFrame()
     data_all = pd.DataFrame()
@@ -130,11 +132,12 @@ def get_marginal_price_plot_data(inputs, results, zones):
     :return:
     """
     mcp = results['OutputMarginalPrice'].loc[:, zones]
+    demands = get_registry(inputs).demands
     volume = pd.DataFrame()
     for z in zones:
-        tmp = results['OutputAcceptanceRatioOfDemandOrders'].loc[
-              :, inputs['demands'].loc[inputs['demands']['Zone'].isin([z])]['Unit']] * \
-              inputs['demands'].loc[inputs['demands']['Zone'].isin([z])]['MaxDemand'].sum()
+        pos = demands.select('Zone', z)
+        tmp = results['OutputAcceptanceRatioOfDemandOrders'].loc[:, demands.names[pos]] * \
+              demands.column('MaxDemand')[pos].sum()
         volume.loc[:, z] = tmp.sum(axis=1)
 
     idx_short = pd.DatetimeIndex(pd.date_range(start=dt.datetime(*inputs['config']['StartDate']),
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Aggregation of the equivalent simple and demand orders.
+
+The simple orders with the same zone, technology, ramping limits and hourly price series, and the demand orders with
+the same zone, sector and hourly price series, are cleared identically by the model. The ramping constraints
+(EQ_Unit_Ramp_Up/Down) limit the hourly change of the quantity offered by each unit, so the non-renewable simple
+orders must also have the same hourly availability factors. Each group is replaced by one aggregate order with the
+summed capacity and the capacity-weighted availability factor, so that only one acceptance ratio is optimized per
+group. The share of each member in the offered quantity of its aggregate is kept in SimData['aggregation'] and the
+cleared volumes are split pro rata in get_sim_results (all the members of an aggregate have the same acceptance
+ratio)::
+
+    plants, demands, tables, aggregation = aggregate_orders(plants, demands, tables)
+
+@author: Matija Pavičević
+"""
+
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+from ..common import commons
+
+# Columns of the players tables defining the equivalent orders (in addition to the hourly price series):
+KEYS_UNITS = ['Zone', 'OrderType', 'Technology', 'UnitRampUp', 'UnitRampDown']
+KEYS_DEMANDS = ['Zone', 'Sector']
+
+
+def _aggregate(players, capacity, availability, price, keys, name, eligible=None, profiles=None):
+    """
+    Aggregate the equivalent players of one table
+
+    :param players:         Players table (simple orders or demands), with a 'Unit' column
+    :param capacity:        Name of the capacity column (PowerCapacity or MaxDemand)
+    :param availability:    Hourly availability factors of the players (one column per player)
+    :param price:           Hourly prices of the players (one column per player)
+    :param keys:            Columns of the players table that must be equal within a group
+    :param name:            Name of the players table, used in the log messages
+    :param eligible:        Boolean series selecting the players that can be aggregated (all if None)
+    :param profiles:        Boolean series selecting the players that must also have the same availability factors to
+                            be aggregated (none if None)
+    :returns:               Tuple (players, availability, price, shares) with the aggregated tables and the shares of
+                            the members in the offered quantity of their aggregate (hour x (aggregate, member)). The
+                            aggregates take the place of their first member in the players table
+    """
+    names = players['Unit'].tolist()
+    series = price.reindex(columns=names, fill_value=0)
+    factors = availability.reindex(columns=names, fill_value=0)
+    candidates = players if eligible is None else players[eligible]
+    profiles = pd.Series(False, index=players.index) if profiles is None else profiles
+
+    def digest(i, unit):
+        values = series[unit].values.tobytes()
+        if profiles[i]:
+            values += factors[unit].values.tobytes()
+        return hashlib.sha1(values).hexdigest()
+
+    # Groups of players with the same keys and the same price series (and availability factors if required):
+    signature = candidates[keys].astype(str).agg('|'.join, axis=1) + '|' + \
+        pd.Series([digest(i, u) for i, u in candidates['Unit'].items()], index=candidates.index)
+    groups = [group for __, group in candidates.groupby(signature, sort=False) if len(group) > 1]
+    if len(groups) == 0:
+        return players, availability, price, pd.DataFrame(index=availability.index)
+
+    availability = availability.copy()
+    price = price.copy()
+    shares, replaced, removed = {}, {}, []
+    for group in groups:
+        members = group['Unit'].tolist()
+        aggregate = 'AGG_' + members[0]
+        cap = group[capacity].values.astype(float)
+        offered = availability.reindex(columns=members, fill_value=0).values * cap
+        total = offered.sum(axis=1, keepdims=True)
+        share = np.where(total > 0, offered / np.where(total > 0, total, 1), cap / cap.sum())
+        for i, member in enumerate(members):
+            shares[(aggregate, member)] = share[:, i]
+        row = group.iloc[0].copy()
+        row['Unit'] = aggregate
+        row[capacity] = cap.sum()
+        if 'Unnamed: 0' in row.index:
+            row['Unnamed: 0'] = aggregate
+        replaced[group.index[0]] = row
+        availability[aggregate] = total[:, 0] / cap.sum()
+        price[aggregate] = series[members[0]]
+        removed += members
+    logging.info(name + ': ' + str(len(removed)) + ' orders aggregated into ' + str(len(groups)) + ' aggregates')
+
+    rows = [replaced[i] if i in replaced else row for i, row in players.iterrows()
+            if i in replaced or row['Unit'] not in removed]
+    players = pd.DataFrame(rows, columns=players.columns)
+    players.index = range(len(players))
+    availability = availability.drop(columns=[u for u in removed if u in availability.columns])
+    price = price.drop(columns=[u for u in removed if u in price.columns])
+    shares = pd.DataFrame(shares, index=availability.index)
+    shares.columns.names = ['aggregate', 'member']
+    return players, availability, price, shares
+
+
+def aggregate_orders(plants, demands, tables):
+    """
+    Merge the equivalent simple orders and demand orders into aggregate orders with the summed capacity
+
+    :param plants:      Units table (after select_units). Only the simple orders are aggregated (not the storage units),
+                        the non-renewable ones only if their availability factors are identical
+    :param demands:     Demands table (after select_demands)
+    :param tables:      Dictionary with the hourly AvailabilityFactorSimpleOrder, PriceSimpleOrder,
+                        AvailabilityFactorDemandOrder and PriceDemandOrder tables (one column per player)
+    :returns:           Tuple (plants, demands, tables, aggregation). aggregation is a dictionary with the shares of
+                        the members of each aggregate in its offered quantity, for the units ('u') and the demands
+                        ('d'): dataframes indexed by the hour, with (aggregate, member) columns
+    """
+    tables = dict(tables)
+    simple = (plants['OrderType'] == 'Simple') & ~plants['Technology'].isin(commons['tech_storage'])
+    # The ramping constraints only apply to the non-renewable units:
+    ramping = ~plants['Technology'].isin(commons['tech_renewables'])
+    plants, tables['AvailabilityFactorSimpleOrder'], tables['PriceSimpleOrder'], shares_u = _aggregate(
+        plants, 'PowerCapacity', tables['AvailabilityFactorSimpleOrder'], tables['PriceSimpleOrder'], KEYS_UNITS,
+        'Simple orders', eligible=simple, profiles=ramping)
+    demands, tables['AvailabilityFactorDemandOrder'], tables['PriceDemandOrder'], shares_d = _aggregate(
+        demands, 'MaxDemand', tables['AvailabilityFactorDemandOrder'], tables['PriceDemandOrder'], KEYS_DEMANDS,
+        'Demand orders')
+    return plants, demands, tables, {'u': shares_u, 'd': shares_d}
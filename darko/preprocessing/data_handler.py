@@ -7,13 +7,16 @@ import pandas as pd
 
 from six.moves import reload_module
 
+from ..common import commons
+from ..misc.diagnostics import Diagnostics
+
 try:
     from future.builtins import int
 except ImportError:
     pass
 
 
-def NodeBasedTable(path, idx, zones, tablename='', default=None):
+def NodeBasedTable(path, idx, zones, tablename='', default=None, diagnostics=None, TempPath=None):
     """
     This function loads the tabular data stored in csv files relative to each
     zone of the simulation.
@@ -23,6 +26,8 @@ def NodeBasedTable(path, idx, zones, tablename='', default=None):
     :param zones:               List with the zone codes to be considered
     :param tablename:           String with the name of the table being processed
     :param default:             Default value to be applied if no data is found
+    :param diagnostics:         Diagnostics collector in which the events are recorded. If None, they are logged
+    :param TempPath:            Path to the cache folder of the csv files (see load_csv)
 
     :return:           Dataframe with the time series for each unit
     """
@@ -44,7 +49,10 @@ def NodeBasedTable(path, idx, zones, tablename='', default=None):
         SingleFile = False
     data = pd.DataFrame(index=idx)
     if len(paths) == 0:
-        logging.info('No data file found for the table ' + tablename + '. Using default value ' + str(default))
+        if diagnostics is None:
+            logging.info('No data file found for the table ' + tablename + '. Using default value ' + str(default))
+        else:
+            diagnostics.add(tablename, 'No data file found. Using default value ' + str(default), level=logging.INFO)
         if default is None:
             pass
         elif isinstance(default, (float, int)):
@@ -54,7 +62,7 @@ def NodeBasedTable(path, idx, zones, tablename='', default=None):
             sys.exit(1)
     elif SingleFile:
         # If it is only one file, there is a header with the zone code
-        tmp = load_csv(paths['all'], index_col=0, parse_dates=True)
+        tmp = load_csv(paths['all'], TempPath=TempPath, index_col=0, parse_dates=True)
         if not tmp.index.is_unique:
             logging.error('The index of data file ' + paths['all'] + ' is not unique. Please check the data')
             sys.exit(1)
@@ -86,7 +94,7 @@ def NodeBasedTable(path, idx, zones, tablename='', default=None):
         for z in paths:
             path = paths[z]
             # In case of separated files for each zone, there is no header
-            tmp = load_csv(path, index_col=0, parse_dates=True)
+            tmp = load_csv(path, TempPath=TempPath, index_col=0, parse_dates=True)
             # check that the loaded file is ok:
             if not tmp.index.is_unique:
                 logging.error('The index of data file ' + paths['all'] + ' is not unique. Please check the data')
@@ -96,7 +104,8 @@ def NodeBasedTable(path, idx, zones, tablename='', default=None):
     return data
 
 
-def UnitBasedTable(plants, path, idx, zones, fallbacks=['Unit'], tablename='', default=None, RestrictWarning=None):
+def UnitBasedTable(plants, path, idx, zones, fallbacks=['Unit'], tablename='', default=None, RestrictWarning=None,
+                   diagnostics=None, TempPath=None):
     """
     This function loads the tabular data stored in csv files and assigns the proper values to each unit of the plants
     dataframe. If the unit-specific value is not found in the data, the script can fallback on more generic data
@@ -114,9 +123,13 @@ def UnitBasedTable(plants, path, idx, zones, fallbacks=['Unit'], tablename='', d
     :param default:             Default value to be applied if no data is found
     :param RestrictWarning:     Only display the warnings if the unit belongs to the list of technologies provided in
                                 this parameter
+    :param diagnostics:         Diagnostics collector in which the per-unit events are recorded. If None, the events
+                                are summarized in the log at the end of the function
+    :param TempPath:            Path to the cache folder of the csv files (see load_csv)
 
     :return:                    Dataframe with the time series for each unit
     """
+    diag = Diagnostics() if diagnostics is None else diagnostics
 
     paths = {}
     if os.path.isfile(path):
@@ -128,14 +141,13 @@ def UnitBasedTable(plants, path, idx, zones, fallbacks=['Unit'], tablename='', d
             if os.path.isfile(path_c):
                 paths[str(z)] = path_c
             else:
-                logging.critical(
-                    'No data file found for the table ' + tablename + ' and zone ' + z + '. File ' + path_c +
-                    ' does not exist')
+                diag.add(tablename, 'No data file found for zone, file does not exist', path_c,
+                         level=logging.CRITICAL)
         #                sys.exit(1)
         SingleFile = False
     data = pd.DataFrame(index=idx)
     if len(paths) == 0:
-        logging.info('No data file found for the table ' + tablename + '. Using default value ' + str(default))
+        diag.add(tablename, 'No data file found. Using default value ' + str(default), level=logging.INFO)
         if default is None:
             out = pd.DataFrame(index=idx)
         elif isinstance(default, (float, int)):
@@ -147,7 +159,7 @@ def UnitBasedTable(plants, path, idx, zones, fallbacks=['Unit'], tablename='', d
         columns = []
         for z in paths:
             path = paths[z]
-            tmp = load_csv(path, index_col=0, parse_dates=True)
+            tmp = load_csv(path, TempPath=TempPath, index_col=0, parse_dates=True)
             # check that the loaded file is ok:
             if not tmp.index.is_unique:
                 logging.error('The index of data file ' + path + ' is not unique. Please check the data')
@@ -180,15 +192,13 @@ def UnitBasedTable(plants, path, idx, zones, fallbacks=['Unit'], tablename='', d
                     out[u] = data[header]
                     found = True
                     if i > 0 and warning:
-                        logging.warning(
-                            'No specific information was found for unit ' + u + ' in table ' + tablename +
-                            '. The generic information for ' + str(header) + ' has been used')
+                        diag.add(tablename, 'No specific information was found, the generic information for ' +
+                                 str(key) + ' has been used', u + ' -> ' + str(header))
                     break
             if not found:
                 if warning:
-                    logging.info(
-                        'No specific information was found for unit ' + u + ' in table ' + tablename +
-                        '. Using default value ' + str(default))
+                    diag.add(tablename, 'No specific information was found. Using default value ' + str(default), u,
+                             level=logging.INFO)
                 if not default is None:
                     out[u] = default
     if not out.columns.is_unique:
@@ -196,6 +206,8 @@ def UnitBasedTable(plants, path, idx, zones, fallbacks=['Unit'], tablename='', d
             'The column headers of table "' + tablename + '" are not unique!. The following headers are duplicated: ' +
             str(out.columns.get_duplicates()))
         sys.exit(1)
+    if diagnostics is None:
+        diag.summary()
     return out
 
 
@@ -218,22 +230,27 @@ def define_parameter(sets_in, sets, value=0):
     return {'sets': sets_in, 'val': values}
 
 
-def load_csv(filename, TempPath='.pickle', header=0, skiprows=None, skipfooter=0, index_col=None, parse_dates=False):
+def load_csv(filename, TempPath=None, header=0, skiprows=None, skipfooter=0, index_col=None, parse_dates=False):
     """
     Function that loads a csv sheet into a dataframe and saves a temporary pickle version of it.
     If the pickle is newer than the sheet, do no load the sheet again.
+    The pickle is written to a temporary file and then renamed, so that the cache folder can safely be shared by
+    several builds running at the same time.
 
     :param filename: path to csv file
-    :param TempPath: path to store the temporary data files
+    :param TempPath: path to store the temporary data files (commons['CacheFolder'] if not provided)
     """
 
     import hashlib
-    m = hashlib.new('md5', filename.encode('utf-8'))
+    import tempfile
+    if TempPath is None:
+        TempPath = commons['CacheFolder']
+    m = hashlib.new('md5', os.path.abspath(filename).encode('utf-8'))
     resultfile_hash = m.hexdigest()
-    filepath_pandas = TempPath + os.sep + resultfile_hash + '.p'
+    filepath_pandas = os.path.join(TempPath, resultfile_hash + '.p')
 
     if not os.path.isdir(TempPath):
-        os.mkdir(TempPath)
+        os.makedirs(TempPath, exist_ok=True)
     if not os.path.isfile(filepath_pandas):
         time_pd = 0
     else:
@@ -243,26 +260,189 @@ def load_csv(filename, TempPath='.pickle', header=0, skiprows=None, skipfooter=0
                            parse_dates=parse_dates)
         if parse_dates:
             data.index = data.index.tz_localize(None)
-        data.to_pickle(filepath_pandas)
+        fd, tmpfile = tempfile.mkstemp(suffix='.tmp', dir=TempPath)
+        os.close(fd)
+        data.to_pickle(tmpfile)
+        os.replace(tmpfile, filepath_pandas)
     else:
         data = pd.read_pickle(filepath_pandas)
     return data
 
 
-def load_config(ConfigFile, AbsPath=True):
+# Version of the compiled config cache. To be incremented whenever the config schema or the loaders change:
+CONFIG_CACHE_VERSION = 1
+
+# List of parameters for which an external file path must be specified:
+CONFIG_PATHS = ['QuantityDemandOrder', 'QuantitySimpleOrder', 'QuantityBlockOrder', 'QuantityFlexibleOrder',
+                'PriceDemandOrder', 'PriceSimpleOrder', 'PriceBlockOrder', 'PriceFlexibleOrder',
+                'PlayersDemandSide', 'PlayersSupplySide', 'Interconnections', 'NTC',
+                'NodeHourlyRampUp', 'NodeHourlyRampDown', 'NodeDailyRampUp', 'NodeDailyRampDown',
+                'LineHourlyRampUp', 'LineHourlyRampDown', 'LineDailyRampUp', 'LineDailyRampDown',
+                'StorageInFlows', 'StorageProfiles']
+
+
+def load_config(ConfigFile, AbsPath=True, cache=True):
     """
     Wrapper function around load_config_excel and load_config_yaml
+
+    The parsed config is stored in a compiled cache (pickle in commons['CacheFolder']) and re-used as long as the
+    config file has not been modified, which avoids opening the excel workbook at every call.
+
+    :param ConfigFile: String with (relative) path to the DARKO configuration file (.xlsx, .xls, .yml, .yaml, .json)
+    :param AbsPath:    If true, relative paths are automatically changed into absolute paths (recommended)
+    :param cache:      If False, the compiled config cache is neither read nor updated
     """
     if ConfigFile.endswith(('.xlsx', '.xls')):
-        config = load_config_excel(ConfigFile, AbsPath=True)
-    # elif ConfigFile.endswith(('.yml','.yaml')):
-    #     config = load_config_yaml(ConfigFile,AbsPath=True)
+        loader = load_config_excel
+    elif ConfigFile.endswith(('.yml', '.yaml', '.json')):
+        loader = load_config_yaml
     else:
-        logging.critical('The extension of the config file should be .xlsx or .yml')
+        logging.critical('The extension of the config file should be .xlsx, .yml or .json')
         sys.exit(1)
+    if not cache:
+        return loader(ConfigFile, AbsPath=AbsPath)
+
+    import hashlib
+    import pickle
+    import tempfile
+    TempPath = commons['CacheFolder']
+    key = os.path.abspath(ConfigFile) + '|' + str(AbsPath) + '|' + str(CONFIG_CACHE_VERSION)
+    cachefile = os.path.join(TempPath, 'config_' + hashlib.new('md5', key.encode('utf-8')).hexdigest() + '.p')
+    mtime = os.path.getmtime(ConfigFile)
+    if os.path.isfile(cachefile):
+        try:
+            with open(cachefile, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['mtime'] == mtime and cached['version'] == CONFIG_CACHE_VERSION:
+                logging.info("Using config file " + ConfigFile + " (compiled version from the cache)")
+                return cached['config']
+        except Exception:
+            logging.warning('Could not read the compiled config cache ' + cachefile + '. Re-parsing the config file')
+
+    config = loader(ConfigFile, AbsPath=AbsPath)
+    try:
+        if not os.path.isdir(TempPath):
+            os.makedirs(TempPath, exist_ok=True)
+        fd, tmpfile = tempfile.mkstemp(suffix='.tmp', dir=TempPath)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'version': CONFIG_CACHE_VERSION, 'mtime': mtime, 'config': config}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, cachefile)
+    except OSError:
+        logging.warning('Could not write the compiled config cache to ' + TempPath)
     return config
 
 
+def _config_abspath(config, ConfigFile):
+    """
+    Changing all relative paths to absolute paths. Relative paths must be defined
+    relative to the parent folder of the config file.
+
+    :param config:      DARKO config dictionary (modified in place)
+    :param ConfigFile:  Path to the config file
+    """
+    abspath = os.path.abspath(ConfigFile)
+    basefolder = os.path.abspath(os.path.join(os.path.dirname(abspath), os.pardir))
+    if not os.path.isabs(config['SimulationDirectory']):
+        config['SimulationDirectory'] = os.path.join(basefolder, config['SimulationDirectory'])
+    for param in CONFIG_PATHS:
+        if not os.path.isabs(config[param]):
+            config[param] = os.path.join(basefolder, config[param])
+    return config
+
+
+def _parse_date(date):
+    """
+    Convert a date from a yaml/json config file (ISO string, list or date object) into the tuple format used by
+    load_config_excel: (year, month, day, hour, minute, second)
+    """
+    import datetime as dt
+    if isinstance(date, str):
+        date = dt.datetime.fromisoformat(date)
+    if isinstance(date, dt.date):
+        if not isinstance(date, dt.datetime):
+            date = dt.datetime(date.year, date.month, date.day)
+        return date.year, date.month, date.day, date.hour, date.minute, date.second
+    date = tuple(int(x) for x in date)
+    return date + (0,) * (6 - len(date))
+
+
+def load_config_yaml(ConfigFile, AbsPath=True):
+    """
+    Function that loads the DARKO yaml (or json) config file and returns a dictionary with the values.
+    The file uses the same fields as the dictionary returned by load_config_excel. Dates can be provided as ISO
+    strings (e.g. 2020-01-01) or lists (e.g. [2020, 1, 1, 0, 0, 0]).
+
+    :param ConfigFile: String with (relative) path to the DARKO yaml or json configuration file
+    :param AbsPath:    If true, relative paths are automatically changed into absolute paths (recommended)
+    """
+    if ConfigFile.endswith('.json'):
+        import json
+        with open(ConfigFile, 'r') as f:
+            config = json.load(f)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            logging.critical('The PyYAML package is required to read .yml config files (pip install pyyaml)')
+            sys.exit(1)
+        with open(ConfigFile, 'r') as f:
+            config = yaml.safe_load(f)
+
+    for key in ['SimulationDirectory', 'StartDate', 'StopDate', 'HorizonLength', 'LookAhead'] + CONFIG_PATHS:
+        if key not in config:
+            logging.critical('The field ' + key + ' is missing in the config file ' + ConfigFile)
+            sys.exit(1)
+    for param in CONFIG_PATHS:
+        if config[param] is None:
+            config[param] = ''
+    config['StartDate'] = _parse_date(config['StartDate'])
+    config['StopDate'] = _parse_date(config['StopDate'])
+    config['HorizonLength'] = int(config['HorizonLength'])
+    config['LookAhead'] = int(config['LookAhead'])
+    config.setdefault('default', {})
+    config.setdefault('zones', [])
+    config.setdefault('modifiers', {})
+
+    if AbsPath:
+        _config_abspath(config, ConfigFile)
+
+    logging.info("Using config file " + ConfigFile + " to build the simulation environment")
+    logging.info("Using " + config['SimulationDirectory'] + " as simulation folder")
+    return config
+
+
+def export_config(ConfigFile, filename):
+    """
+    Convert a DARKO config file (e.g. an excel workbook) into a yaml or json config file. The relative paths are
+    kept relative, so that the exported file can be placed next to the original one.
+
+    :param ConfigFile: String with (relative) path to the DARKO configuration file
+    :param filename:   Path to the exported file (.yml, .yaml or .json)
+    """
+    config = load_config(ConfigFile, AbsPath=False, cache=False)
+    out = dict(config)
+    for key in ['StartDate', 'StopDate']:
+        out[key] = '{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}'.format(*[int(x) for x in config[key]])
+    if filename.endswith('.json'):
+        import json
+        with open(filename, 'w') as f:
+            json.dump(out, f, indent=2)
+    elif filename.endswith(('.yml', '.yaml')):
+        try:
+            import yaml
+        except ImportError:
+            logging.critical('The PyYAML package is required to write .yml config files (pip install pyyaml)')
+            sys.exit(1)
+        with open(filename, 'w') as f:
+            yaml.safe_dump(out, f, default_flow_style=False, sort_keys=False)
+    else:
+        logging.critical('The extension of the exported config file should be .yml or .json')
+        sys.exit(1)
+    logging.info('Config file ' + ConfigFile + ' exported to ' + filename)
+    return out
+
+
 def load_config_excel(ConfigFile, AbsPath=True):
     """
     Function that loads the DARKO excel config file and returns a dictionary
@@ -288,26 +468,11 @@ def load_config_excel(ConfigFile, AbsPath=True):
               'SimulationType': sheet.cell_value(46, 2),
               'ReserveCalculation': sheet.cell_value(47, 2)}
 
-    # List of parameters for which an external file path must be specified:
-    params = ['QuantityDemandOrder', 'QuantitySimpleOrder', 'QuantityBlockOrder', 'QuantityFlexibleOrder',
-              'PriceDemandOrder', 'PriceSimpleOrder', 'PriceBlockOrder', 'PriceFlexibleOrder',
-              'PlayersDemandSide', 'PlayersSupplySide', 'Interconnections', 'NTC',
-              'NodeHourlyRampUp', 'NodeHourlyRampDown', 'NodeDailyRampUp', 'NodeDailyRampDown',
-              'LineHourlyRampUp', 'LineHourlyRampDown', 'LineDailyRampUp', 'LineDailyRampDown',
-              'StorageInFlows', 'StorageProfiles']
-    for i, param in enumerate(params):
+    for i, param in enumerate(CONFIG_PATHS):
         config[param] = sheet.cell_value(61 + i, 2)
 
     if AbsPath:
-        # Changing all relative paths to absolute paths. Relative paths must be defined
-        # relative to the parent folder of the config file.
-        abspath = os.path.abspath(ConfigFile)
-        basefolder = os.path.abspath(os.path.join(os.path.dirname(abspath), os.pardir))
-        if not os.path.isabs(config['SimulationDirectory']):
-            config['SimulationDirectory'] = os.path.join(basefolder, config['SimulationDirectory'])
-        for param in params:
-            if not os.path.isabs(config[param]):
-                config[param] = os.path.join(basefolder, config[param])
+        _config_abspath(config, ConfigFile)
 
     config['default'] = {}
     config['default']['Availability - Flexible Order'] = sheet.cell_value(64, 5)
@@ -18,25 +18,58 @@ from .data_check import check_units, check_sto, check_demands, check_MinMaxFlows
     check_AvailabilityFactorsDemands, check_df
 # isStorage
 from .data_handler import load_csv, UnitBasedTable, NodeBasedTable, define_parameter
-from .utils import incidence_matrix, select_units, select_demands, interconnections
+from .utils import incidence_matrix, select_units, select_demands, interconnections, rolling_horizons, \
+    active_entities
 from .. import __version__
-from ..common import commons, set_log_name  # Load fuel types, technologies, timestep, etc:
+from ..common import commons, log_to_folder  # Load fuel types, technologies, timestep, etc:
+from ..misc.diagnostics import Diagnostics
 from ..misc.gdx_handler import write_variables
+from ..misc.registry import PlayerRegistry
 
 GMS_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'GAMS')
 
 
-def build_simulation(config):
+def build_simulation(config, write=True, base=None):
     """
     This function reads the DARKO config, loads the specified data,
     processes it when needed, and formats it in the proper DARKO format.
     The output of the function is a directory with all inputs and simulation files required to run a DARKO simulation
 
+    All the files of the build (including the log file) are written to the simulation directory, so that several
+    builds can run at the same time on the same host (see build_many).
+
     :param config:        Dictionary with all the configuration fields loaded from the excel file.
                           Output of the 'LoadConfig' function.
+    :param write:         If False, nothing is written to disk and only the SimData dictionary is returned
+                          (e.g. for the in-memory pipeline, see darko.pipeline)
+    :param base:          Path to an existing simulation folder (base scenario). If provided, only the parameters
+                          that differ from the base are written to InputsDelta.gdx and the base Inputs.gdx is loaded
+                          by GAMS for the other ones (see write_simulation_environment)
+    """
+    if not write:
+        return _build_simulation(config, write=False)
+    sim = config['SimulationDirectory']
+    if not os.path.exists(sim):
+        os.makedirs(sim, exist_ok=True)
+    with log_to_folder(sim, 'warn_preprocessing'):
+        return _build_simulation(config, base=base)
+
+
+def _build_simulation(config, write=True, base=None):
+    """
+    Body of build_simulation, executed while the log records are redirected to the simulation directory
+
+    :param config:        Dictionary with all the configuration fields loaded from the excel file.
+    :param write:         If False, the simulation environment is not written to disk
+    :param base:          Path to the base simulation folder for a delta build
     """
     darko_version = __version__
     logging.info('New build started. DARKO version: ' + darko_version)
+    # Per unit/table/line events are collected and summarized at the end of the build:
+    diag = Diagnostics()
+    # Output folder and cache folder of the parsed csv files:
+    sim = config['SimulationDirectory']
+    cache = config.get('CacheFolder', commons['CacheFolder'])
     # %%###############################################################################################################
     # ###################################   Main Inputs    ############################################################
     # #################################################################################################################
@@ -75,14 +108,12 @@ def build_simulation(config):
     '''Supply side'''
     plants = pd.DataFrame()
     if os.path.isfile(config['PlayersSupplySide']):
-        plants = load_csv(config['PlayersSupplySide'])
+        plants = load_csv(config['PlayersSupplySide'], TempPath=cache)
     elif '##' in config['PlayersSupplySide']:
-        for z in config['zones']:
-            path = config['PlayersSupplySide'].replace('##', str(z))
-            tmp = load_csv(path)
-            plants = plants.append(tmp, ignore_index=True)
+        plants = pd.concat([load_csv(config['PlayersSupplySide'].replace('##', str(z)), TempPath=cache)
+                          for z in config['zones']], ignore_index=True)
     # Remove invalid power plants:
-    plants = select_units(plants, config)
+    plants = select_units(plants, config, diagnostics=diag)
     # fill missing parameters with 0
     plants[['PriceBlockOrder', 'PriceFlexibleOrder', 'AccaptanceBlockOrdersMin', 'AvailabilityFactorFlexibleOrder']] = \
         plants[['PriceBlockOrder', 'PriceFlexibleOrder', 'AccaptanceBlockOrdersMin', 'AvailabilityFactorFlexibleOrder']
@@ -109,24 +140,22 @@ def build_simulation(config):
                                      idx_std, config['zones'],
                                      fallbacks=['Unit', 'Technology', 'Zone'],
                                      tablename='ReservoirLevels',
-                                     default=0)
+                                     default=0, diagnostics=diag, TempPath=cache)
     ReservoirScaledInflows = UnitBasedTable(plants_sto, config['StorageInFlows'],
                                             idx_std, config['zones'],
                                             fallbacks=['Unit', 'Technology', 'Zone'],
                                             tablename='ReservoirScaledInflows',
-                                            default=0)
+                                            default=0, diagnostics=diag, TempPath=cache)
 
     '''Demand side'''
     demands = pd.DataFrame()
     if os.path.isfile(config['PlayersDemandSide']):
-        demands = load_csv(config['PlayersDemandSide'])
+        demands = load_csv(config['PlayersDemandSide'], TempPath=cache)
     elif '##' in config['PlayersDemandSide']:
-        for z in config['zones']:
-            path = config['PlayersDemandSide'].replace('##', str(z))
-            tmp = load_csv(path)
-            demands = demands.append(tmp, ignore_index=True)
+        demands = pd.concat([load_csv(config['PlayersDemandSide'].replace('##', str(z)), TempPath=cache)
+                          for z in config['zones']], ignore_index=True)
     # remove invalid power plants:
-    demands = select_demands(demands, config)
+    demands = select_demands(demands, config, diagnostics=diag)
 
     # check demands list:
     check_demands(config, demands)
@@ -136,37 +165,37 @@ def build_simulation(config):
                                    idx_std, config['zones'],
                                    fallbacks=['Unit'],
                                    tablename='AvailabilityFactorsDemandOrder',
-                                   default=0)
+                                   default=0, diagnostics=diag, TempPath=cache)
     AFSimpleOrder = UnitBasedTable(plants.loc[plants['OrderType'] == 'Simple'], config['QuantitySimpleOrder'],
                                    idx_std, config['zones'],
                                    fallbacks=['Unit', 'Technology'],
                                    tablename='AvailabilityFactorsSimpleOrder',
-                                   default=0)
+                                   default=0, diagnostics=diag, TempPath=cache)
     AFBlockOrder = UnitBasedTable(plants.loc[plants['OrderType'] == 'Block'], config['QuantityBlockOrder'],
                                   idx_std, config['zones'],
                                   fallbacks=['Unit', 'Technology'],
                                   tablename='AvailabilityFactorsBlockOrder',
-                                  default=0)
+                                  default=0, diagnostics=diag, TempPath=cache)
 
     # Price:
     PriceDemandOrder = UnitBasedTable(demands, config['PriceDemandOrder'],
                                       idx_std, config['zones'],
                                       fallbacks=['Unit'],
                                       tablename='PriceDemandOrder',
-                                      default=0)
+                                      default=0, diagnostics=diag, TempPath=cache)
     PriceSimpleOrder = UnitBasedTable(plants.loc[plants['OrderType'] == 'Simple'], config['PriceSimpleOrder'],
                                       idx_std, config['zones'],
                                       fallbacks=['Unit', 'Technology'],
                                       tablename='PriceSimpleOrder',
-                                      default=0)
+                                      default=0, diagnostics=diag, TempPath=cache)
 
     # Daily node based ramping rates TODO: Make a function that loads only single values for each zone instead of this
     NodeDailyRampUp = NodeBasedTable(config['NodeDailyRampUp'], idx_std,
                                      config['zones'], tablename='NodeDailyRampUp',
-                                     default=config['default']['NodeDailyRampUp'])
+                                     default=config['default']['NodeDailyRampUp'], diagnostics=diag, TempPath=cache)
     NodeDailyRampDown = NodeBasedTable(config['NodeDailyRampDown'], idx_std,
                                        config['zones'], tablename='NodeDailyRampDown',
-                                       default=config['default']['NodeDailyRampDown'])
+                                       default=config['default']['NodeDailyRampDown'], diagnostics=diag, TempPath=cache)
     NodeDailyRamp = pd.DataFrame([NodeDailyRampUp.iloc[0], NodeDailyRampDown.iloc[0]],
                                  index=['NodeDailyRampUp', 'NodeDailyRampDown']).T
     MaxDemand = demands.groupby(['Zone'])['MaxDemand'].agg('sum')
@@ -177,32 +206,33 @@ def build_simulation(config):
     # Hourly node based ramping rates
     NodeHourlyRampUp = NodeBasedTable(config['NodeHourlyRampUp'], idx_std,
                                       config['zones'], tablename='NodeHourlyRampUp',
-                                      default=config['default']['NodeHourlyRampUp'])
+                                      default=config['default']['NodeHourlyRampUp'], diagnostics=diag, TempPath=cache)
     NodeHourlyRampDown = NodeBasedTable(config['NodeHourlyRampDown'], idx_std,
                                         config['zones'], tablename='NodeHourlyRampDown',
-                                        default=config['default']['NodeHourlyRampDown'])
+                                        default=config['default']['NodeHourlyRampDown'], diagnostics=diag,
+                                        TempPath=cache)
     # Adjust to the fraction of max capacity
     NodeHourlyRampUp = NodeHourlyRampUp * MaxDemand
     NodeHourlyRampDown = NodeHourlyRampDown * MaxDemand
 
     # Interconnections:
     if os.path.isfile(config['Interconnections']):
-        flows = load_csv(config['Interconnections'], index_col=0, parse_dates=True).fillna(0)
+        flows = load_csv(config['Interconnections'], TempPath=cache, index_col=0, parse_dates=True).fillna(0)
     else:
         logging.warning('No historical flows will be considered (no valid file provided)')
         flows = pd.DataFrame(index=idx_std)
     if os.path.isfile(config['NTC']):
-        ntc = load_csv(config['NTC'], index_col=0, parse_dates=True).fillna(0)
+        ntc = load_csv(config['NTC'], TempPath=cache, index_col=0, parse_dates=True).fillna(0)
     else:
         logging.warning('No NTC values will be considered (no valid file provided)')
         ntc = pd.DataFrame(index=idx_std)
 
     LineDailyRampUp = NodeBasedTable(config['LineDailyRampUp'], idx_std,
                                      list(ntc.columns), tablename='LineDailyRampUp',
-                                     default=config['default']['LineDailyRampUp'])
+                                     default=config['default']['LineDailyRampUp'], diagnostics=diag, TempPath=cache)
     LineDailyRampDown = NodeBasedTable(config['LineDailyRampDown'], idx_std,
                                        list(ntc.columns), tablename='LineDailyRampDown',
-                                       default=config['default']['LineDailyRampDown'])
+                                       default=config['default']['LineDailyRampDown'], diagnostics=diag, TempPath=cache)
     LineDailyRamp = pd.DataFrame([LineDailyRampUp.iloc[0], LineDailyRampDown.iloc[0]],
                                  index=['LineDailyRampUp', 'LineDailyRampDown']).T
     # Adjust to the fraction of max total demand
@@ -212,10 +242,11 @@ def build_simulation(config):
     # Interconnection ramping rates
     LineHourlyRampUp = NodeBasedTable(config['LineHourlyRampUp'], idx_std,
                                       list(ntc.columns), tablename='LineHourlyRampUp',
-                                      default=config['default']['LineHourlyRampUp'])
+                                      default=config['default']['LineHourlyRampUp'], diagnostics=diag, TempPath=cache)
     LineHourlyRampDown = NodeBasedTable(config['LineHourlyRampDown'], idx_std,
                                         list(ntc.columns), tablename='LineHourlyRampDown',
-                                        default=config['default']['LineHourlyRampDown'])
+                                        default=config['default']['LineHourlyRampDown'], diagnostics=diag,
+                                        TempPath=cache)
     # Adjust to the fraction of max capacity
     LineHourlyRampUp = LineHourlyRampUp * ntc.max()
     LineHourlyRampDown = LineHourlyRampDown * ntc.max()
@@ -226,7 +257,8 @@ def build_simulation(config):
     check_AvailabilityFactorsUnits(plants.loc[plants['OrderType'] == 'Block'], AFBlockOrder)
 
     # Interconnections:
-    [Interconnections_sim, Interconnections_RoW, Interconnections] = interconnections(config['zones'], ntc, flows)
+    [Interconnections_sim, Interconnections_RoW, Interconnections] = interconnections(config['zones'], ntc, flows,
+                                                                                      diagnostics=diag)
 
     if len(Interconnections_sim.columns) > 0:
         ntcs = Interconnections_sim.reindex(idx_std)
@@ -269,6 +301,16 @@ def build_simulation(config):
     check_df(ReservoirScaledInflows, StartDate=idx_std[0], StopDate=idx_std[-1],
              name='ReservoirScaledInflows')
 
+    # Aggregation of the equivalent simple and demand orders (same zone, technology, ramping limits and prices):
+    aggregation = None
+    if config.get('OrderAggregation', 0):
+        from .aggregation import aggregate_orders
+        tables = {'AvailabilityFactorSimpleOrder': AFSimpleOrder, 'PriceSimpleOrder': PriceSimpleOrder,
+                  'AvailabilityFactorDemandOrder': AFDemandOrder, 'PriceDemandOrder': PriceDemandOrder}
+        plants, demands, tables, aggregation = aggregate_orders(plants, demands, tables)
+        AFSimpleOrder, PriceSimpleOrder = tables['AvailabilityFactorSimpleOrder'], tables['PriceSimpleOrder']
+        AFDemandOrder, PriceDemandOrder = tables['AvailabilityFactorDemandOrder'], tables['PriceDemandOrder']
+
     # %%%
 
     # Extending the data to include the look-ahead period (with constant values assumed)
@@ -309,6 +351,9 @@ def build_simulation(config):
             'z': [str(x + 1) for x in range(Nhours_long - config['LookAhead'] * 24)],
             'sk': commons['Sectors']
             }
+    # Horizons of the rolling horizon loop:
+    sets['rh'] = [str(x + 1) for x in range(len(rolling_horizons(Nhours_long, config['HorizonLength'],
+                                                                    config['LookAhead'])))]
 
     # %%###############################################################################################################
     # ##########################################   Parameters    ######################################################
@@ -316,6 +361,7 @@ def build_simulation(config):
 
     Nunits = len(plants)
     Ndems = len(demands)
+    registry = PlayerRegistry(plants, demands, sets)
     parameters = {}
 
     # Each parameter is associated with certain sets, as defined in the following list:
@@ -360,7 +406,11 @@ def build_simulation(config):
                   'StorageInitial': ['s'],
                   'StorageMinimum': ['s'],
                   'StorageOutflow': ['s', 'h'],
-                  'StorageProfile': ['s', 'h']
+                  'StorageProfile': ['s', 'h'],
+                  'BlockOrderFixed': ['u', 'rh'],
+                  'ActiveUnit': ['u', 'rh'],
+                  'ActiveDemand': ['d', 'rh'],
+                  'ActiveLine': ['l', 'rh']
                   }
 
     # Define all the parameters and set a default value of zero:
@@ -420,24 +470,24 @@ def build_simulation(config):
             logging.critical(s + ': The reservoir level is sometimes higher than its capacity (>1) !')
             sys.exit(1)
         else:
-            logging.warning(
-                'Could not find reservoir level data for storage plant ' + s + '. Using the provided default initial '
-                                                                               'and final values')
+            diag.add('ReservoirLevels', 'Could not find reservoir level data for storage plants. Using the provided '
+                                        'default initial and final values', s)
             # parameters['StorageProfile']['val'][i, :] = np.linspace(config['default']['ReservoirLevelInitial'],
             #                                                         config['default']['ReservoirLevelFinal'],
             #                                                         len(idx_long))
             parameters['StorageProfile']['val'][i, :] = np.linspace(0,
                                                                     0,
                                                                     len(idx_long))
-        # The initial level is the same as the first value of the profile:
-        parameters['StorageInitial']['val'][i] = parameters['StorageProfile']['val'][i, 0] * \
-                                                 plants_sto.loc[plants_sto['Unit'] == s]['StorageCapacity']
+
+    # The initial level is the same as the first value of the profile:
+    parameters['StorageInitial']['val'] = parameters['StorageProfile']['val'][:, 0] * \
+                                          plants_sto['StorageCapacity'].values
 
     # Storage Inflows:
     for i, s in enumerate(sets['s']):
         if s in ReservoirScaledInflows:
             parameters['StorageInflow']['val'][i, :] = ReservoirScaledInflows[s][idx_long].values * \
-                                                       plants_sto.loc[plants_sto['Unit'] == s]['PowerCapacity'].values
+                                                       plants_sto['PowerCapacity'].values[i]
 
     # %%################################################################################################################
     # #################################################################################
@@ -456,7 +506,7 @@ def build_simulation(config):
     # Check values:
     check_MinMaxFlows(parameters['FlowMinimum']['val'], parameters['FlowMaximum']['val'])
 
-    parameters['LineNode'] = incidence_matrix(sets, 'l', parameters, 'LineNode')
+    parameters['LineNode'] = incidence_matrix(sets, 'l', parameters, 'LineNode', diagnostics=diag)
 
     # Maximum hourly ramp rates per node
     for i, n in enumerate(sets['n']):
@@ -465,36 +515,25 @@ def build_simulation(config):
         if n in NodeHourlyRampDown.columns:
             parameters['NodeHourlyRampDown']['val'][i, :] = NodeHourlyRampDown[n]
 
-    # Orders
-    for unit in range(Nunits):
-        idx = sets['o'].index(plants['OrderType'][unit])
-        parameters['OrderType']['val'][unit, idx] = True
-
-    # Sectors
-    for dem in range(Ndems):
-        idx = sets['sk'].index(demands['Sector'][dem])
-        parameters['Sector']['val'][dem, idx] = True
-
-    # Technologies
-    for unit in range(Nunits):
-        idx = sets['t'].index(plants['Technology'][unit])
-        parameters['Technology']['val'][unit, idx] = True
-
-    # Fuels
-    for unit in range(Nunits):
-        idx = sets['f'].index(plants['Fuel'][unit])
-        parameters['Fuel']['val'][unit, idx] = True
-
-    # Location Demand Side
-    for i in range(len(sets['n'])):
-        parameters['LocationDemandSide']['val'][:, i] = (demands['Zone'] == config['zones'][i]).values
-
-    # Location Supply Side
-    for i in range(len(sets['n'])):
-        parameters['LocationSupplySide']['val'][:, i] = (plants['Zone'] == config['zones'][i]).values
+    # Orders, sectors, technologies, fuels and locations (boolean parameters built from the registry codes):
+    parameters['OrderType']['val'] = registry.units.one_hot('OrderType')
+    parameters['Sector']['val'] = registry.demands.one_hot('Sector')
+    parameters['Technology']['val'] = registry.units.one_hot('Technology')
+    parameters['Fuel']['val'] = registry.units.one_hot('Fuel')
+    parameters['LocationDemandSide']['val'] = registry.demands.one_hot('Zone')
+    parameters['LocationSupplySide']['val'] = registry.units.one_hot('Zone')
+
+    # Units, demands and lines active in each horizon (no variables or equations for the inactive ones):
+    horizons = rolling_horizons(Nhours_long, config['HorizonLength'], config['LookAhead'])
+    for var, val in active_entities(parameters, sets, horizons).items():
+        parameters[var]['val'] = val
+        inactive = int((val == 0).sum())
+        if inactive > 0:
+            logging.info(var + ': ' + str(inactive) + ' inactive (entity, horizon) pairs are removed from the model')
 
     # Config variables:
-    sets['x_config'] = ['FirstDay', 'LastDay', 'RollingHorizon Length', 'RollingHorizon LookAhead']
+    sets['x_config'] = ['FirstDay', 'LastDay', 'RollingHorizon Length', 'RollingHorizon LookAhead', 'RelaxedMode',
+                        'RelaxedGapSample']
     sets['y_config'] = ['year', 'month', 'day', 'val']
     dd_begin = idx_long[4]
     dd_end = idx_long[-2]
@@ -503,7 +542,9 @@ def build_simulation(config):
         [dd_begin.year, dd_begin.month, dd_begin.day, 0],
         [dd_end.year, dd_end.month, dd_end.day, 0],
         [0, 0, config['HorizonLength'], 0],
-        [0, 0, config['LookAhead'], 0]
+        [0, 0, config['LookAhead'], 0],
+        [0, 0, 0, config.get('RelaxedMode', 0)],
+        [0, 0, 0, config.get('RelaxedGapSample', 0)]
     ])
     parameters['Config'] = {'sets': ['x_config', 'y_config'], 'val': values}
 
@@ -511,9 +552,6 @@ def build_simulation(config):
     # ####################################   Simulation Environment     ###############################################
     # #################################################################################################################
 
-    # Output folder:
-    sim = config['SimulationDirectory']
-
     # Clean SimData
     demands.set_index('Unnamed: 0', drop=True, inplace=True)
 
@@ -523,24 +561,75 @@ def build_simulation(config):
                'config': config,
                'units': plants,
                'demands': demands,
+               'registry': registry,
                'version': darko_version
                }
+    if aggregation is not None:
+        SimData['aggregation'] = aggregation
+
+    # Block orders fixed before the MIP (BlockOrderFixed), from the prices of the LP relaxation:
+    if config.get('BlockPreselection', 0) > 0:
+        from .preselection import preselect_block_orders
+        preselect_block_orders(SimData, margin=config['BlockPreselection'], diagnostics=diag)
+
+    if write:
+        write_simulation_environment(SimData, sim, gdx=config['WriteGDX'], pickle_file=config['WritePickle'],
+                                     base=base)
+
+    # Summary of the data issues encountered during the build and optional machine-readable report:
+    diag.summary()
+    if write and config.get('WriteDiagnostics', True):
+        diag.write(os.path.join(sim, 'Diagnostics.json'))
+    logging.info('Build finished')
 
-    gdx_out = "Inputs.gdx"
-    if config['WriteGDX']:
-        write_variables(config['GAMS_folder'], gdx_out, [sets, parameters])
+    return SimData
 
-    # if the sim variable was not defined:
-    if 'sim' not in locals():
-        logging.error('Please provide a path where to store the DispaSET inputs ' +
-                      '(in the "sim" variable)')
-        sys.exit(1)
 
+def write_simulation_environment(SimData, sim, gdx=True, pickle_file=True, base=None):
+    """
+    Write the files required to run a DARKO simulation with GAMS (Inputs.gdx, DARKO.gms, cplex.opt, ...) and
+    optionally the pickled version of the inputs to a simulation folder.
+
+    If a base simulation folder is provided and the sets are identical, only the parameters that differ from the
+    base are written to InputsDelta.gdx. The generated DARKO.gms then loads the base Inputs.gdx and InputsDelta.gms
+    re-loads the changed parameters from the delta file.
+
+    :param SimData:       Simulation data, as returned by build_simulation
+    :param sim:           Path to the simulation folder (created if it does not exist)
+    :param gdx:           If True, the sets and parameters are written to Inputs.gdx (or InputsDelta.gdx)
+    :param pickle_file:   If True, SimData is pickled to Inputs.p
+    :param base:          Path to the base simulation folder (with Inputs.gdx and Inputs.p), for a delta build
+    """
+    config = SimData['config']
     if not os.path.exists(sim):
-        os.makedirs(sim)
-
-    shutil.copyfile(os.path.join(GMS_FOLDER, 'DARKO.gms'),
-                    os.path.join(sim, 'DARKO.gms'))
+        os.makedirs(sim, exist_ok=True)
+
+    # Remove the delta files of a previous build, which would otherwise be included by DARKO.gms:
+    for filename in ['InputsDelta.gms', 'InputsDelta.gdx']:
+        if os.path.isfile(os.path.join(sim, filename)):
+            os.remove(os.path.join(sim, filename))
+
+    changed = None
+    if gdx and base is not None:
+        base_gdx = os.path.abspath(os.path.join(base, 'Inputs.gdx'))
+        if not os.path.isfile(base_gdx) or not os.path.isfile(os.path.join(base, 'Inputs.p')):
+            logging.critical('The base simulation folder ' + base + ' must contain the Inputs.gdx and Inputs.p files')
+            sys.exit(1)
+        changed = changed_parameters(pd.read_pickle(os.path.join(base, 'Inputs.p')), SimData)
+        if changed is None:
+            logging.warning('The sets differ from the base simulation ' + base + '. Writing the complete gdx file')
+
+    # The gdx file is written directly in the simulation folder (not in the current working directory):
+    if gdx and changed is None:
+        write_variables(config['GAMS_folder'], os.path.join(sim, 'Inputs.gdx'),
+                        [SimData['sets'], SimData['parameters']])
+        shutil.copyfile(os.path.join(GMS_FOLDER, 'DARKO.gms'),
+                        os.path.join(sim, 'DARKO.gms'))
+    elif gdx:
+        write_delta(SimData, sim, base_gdx, changed)
+    else:
+        shutil.copyfile(os.path.join(GMS_FOLDER, 'DARKO.gms'),
+                        os.path.join(sim, 'DARKO.gms'))
     gmsfile = open(os.path.join(sim, 'DARKO.gpr'), 'w')
     gmsfile.write(
         '[PROJECT] \n \n[RP:DARKO] \n1= \n[OPENWINDOW_1] \nFILE0=DARKO.gms \nFILE1=DARKO.gms \nMAXIM=1 \nTOP=50 '
@@ -548,14 +637,9 @@ def build_simulation(config):
     gmsfile.close()
     #    shutil.copyfile(os.path.join(GMS_FOLDER, 'writeresults.gms'),
     #                    os.path.join(sim, 'writeresults.gms'))
-    # Create cplex option file
-    cplex_options = {'epgap': 0.05,  # TODO: For the moment hardcoded, it has to be moved to a config file
-                     'numericalemphasis': 0,
-                     'scaind': 1,
-                     'lpmethod': 0,
-                     'relaxfixedinfeas': 0,
-                     'mipstart': 1,
-                     'epint': 0}
+    # Create cplex option file (read by DARKO.gms with optfile = 1). Only the MIP start is enabled, the other cplex
+    # options (optimality gap, tolerances, ...) keep their GAMS defaults:
+    cplex_options = {'mipstart': 1}
 
     lines_to_write = ['{} {}'.format(k, v) for k, v in cplex_options.items()]
     with open(os.path.join(sim, 'cplex.opt'), 'w') as f:
@@ -563,9 +647,6 @@ def build_simulation(config):
             f.write(line + '\n')
 
     logging.debug('Using gams file from ' + GMS_FOLDER)
-    if config['WriteGDX']:
-        shutil.copy(gdx_out, sim + '/')
-        os.remove(gdx_out)
     # Copy bat file to generate gdx file directly from excel:
     shutil.copy(os.path.join(GMS_FOLDER, 'makeGDX.bat'),
                 os.path.join(sim, 'makeGDX.bat'))
@@ -573,15 +654,112 @@ def build_simulation(config):
     #    if config['WriteExcel']:
     #        write_to_excel(sim, [sets, parameters])
 
-    if config['WritePickle']:
+    if pickle_file:
         try:
             import cPickle as pickle
         except ImportError:
             import pickle
         with open(os.path.join(sim, 'Inputs.p'), 'wb') as pfile:
             pickle.dump(SimData, pfile, protocol=pickle.HIGHEST_PROTOCOL)
-    logging.info('Build finished')
 
-    set_log_name(sim, 'warn_preprocessing')
 
-    return SimData
+def changed_parameters(base, SimData):
+    """
+    List of the parameters of SimData that differ from the base simulation data
+
+    :param base:        Simulation data of the base scenario
+    :param SimData:     Simulation data of the variant
+    :returns:           List of parameter names, None if the sets or the list of parameters differ (in which case
+                        the variant cannot be expressed as a delta of the base)
+    """
+    if list(base['sets']) != list(SimData['sets']) or set(base['parameters']) != set(SimData['parameters']):
+        return None
+    for s in SimData['sets']:
+        if list(base['sets'][s]) != list(SimData['sets'][s]):
+            return None
+    changed = []
+    for p, param in SimData['parameters'].items():
+        ref = base['parameters'][p]
+        val, val_ref = np.asarray(param['val']), np.asarray(ref['val'])
+        if param['sets'] != ref['sets'] or val.shape != val_ref.shape:
+            changed.append(p)
+            continue
+        try:
+            same = np.array_equal(val, val_ref, equal_nan=True)
+        except TypeError:  # non numerical values
+            same = np.array_equal(val, val_ref)
+        if not same:
+            changed.append(p)
+    return changed
+
+
+def write_delta(SimData, sim, base_gdx, changed):
+    """
+    Write a delta simulation environment: the changed parameters are written to InputsDelta.gdx, InputsDelta.gms
+    loads them (with replacement) after the base inputs and DARKO.gms points to the base Inputs.gdx. The Results.gdx
+    of the base simulation is used as MIP start if it exists when the variant is run
+
+    :param SimData:     Simulation data of the variant
+    :param sim:         Path to the simulation folder
+    :param base_gdx:    Absolute path to the Inputs.gdx file of the base simulation
+    :param changed:     List of the parameters to be written (output of changed_parameters)
+    """
+    if changed:
+        # The sets are written as well, to register the set elements in the same order as in the base:
+        write_variables(SimData['config']['GAMS_folder'], os.path.join(sim, 'InputsDelta.gdx'),
+                        [SimData['sets'], {p: SimData['parameters'][p] for p in changed}])
+    with open(os.path.join(sim, 'InputsDelta.gms'), 'w') as f:
+        f.write('* Parameters that differ from the base inputs: ' + base_gdx + '\n')
+        if changed:
+            f.write('$gdxin InputsDelta.gdx\n$onMultiR\n')
+            for p in changed:
+                f.write('$LOAD ' + p + '\n')
+            f.write('$offMulti\n$gdxin\n')
+    with open(os.path.join(GMS_FOLDER, 'DARKO.gms'), 'rb') as f:
+        gms = f.read()
+    with open(os.path.join(sim, 'DARKO.gms'), 'wb') as f:
+        gms = gms.replace(b'$set InputFileName Inputs.gdx', b'$set InputFileName ' + base_gdx.encode())
+        # The solution of the base scenario (if it has been run) is used as MIP start of each horizon:
+        base_results = os.path.join(os.path.dirname(base_gdx), 'Results.gdx')
+        f.write(gms.replace(b'$set WarmStart none', b'$set WarmStart ' + base_results.encode()))
+    logging.info(str(len(changed)) + ' parameters differ from the base inputs ' + base_gdx)
+
+
+def _build_worker(config, return_data, base=None):
+    """
+    Build a single simulation in a worker process of build_many
+    """
+    SimData = build_simulation(config, base=base)
+    if return_data:
+        return SimData
+    return config['SimulationDirectory']
+
+
+def build_many(configs, workers=None, return_data=False, base=None):
+    """
+    Build several independent simulation environments in parallel, each one in its own process.
+    Each config must point to a different simulation directory.
+
+    :param configs:       List of DARKO config dictionaries (outputs of the 'load_config' function)
+    :param workers:       Number of worker processes (number of cores of the machine if None)
+    :param return_data:   If True, the SimData dictionaries are sent back to the calling process (which can be
+                          expensive for large simulations). Otherwise, only the simulation directories are returned.
+    :param base:          Path to a base simulation folder. If provided, each variant only writes the parameters that
+                          differ from the base (see build_simulation)
+    :returns:             List with one element per config, in the same order
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    sims = [os.path.abspath(config['SimulationDirectory']) for config in configs]
+    duplicates = set([sim for sim in sims if sims.count(sim) > 1])
+    if len(duplicates) > 0:
+        logging.critical('Several configs point to the same simulation directory: ' + str(list(duplicates)) +
+                         '. The builds would overwrite each other')
+        sys.exit(1)
+
+    logging.info('Building ' + str(len(configs)) + ' simulations with ' + str(workers or os.cpu_count()) +
+                 ' workers')
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        out = list(pool.map(_build_worker, configs, [return_data] * len(configs), [base] * len(configs)))
+    logging.info('All builds finished')
+    return out
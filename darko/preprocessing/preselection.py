@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-selection of the block orders before the MIP.
+
+The LP relaxation of each horizon of the rolling horizon loop is solved with the native backend (the storage levels
+being carried from one horizon to the next) and provides the zonal prices. For each horizon, a block order is:
+
+    - fixed as accepted if its price is below the lowest zonal price of its active hours (in the money in all hours)
+    - fixed as rejected if its price is above the highest zonal price of its active hours (out of the money)
+    - left as a binary variable otherwise
+
+The price bounds are widened by a margin (fraction of the highest absolute price of the zone in the horizon) to
+account for the difference between the prices of the relaxation and those of the MIP. The decisions are written to
+the BlockOrderFixed(u, rh) parameter (1: accepted, -1: rejected, 0: free), applied by DARKO.gms and by the native
+backend::
+
+    counts = preselect_block_orders(SimData, margin=0.1)
+
+@author: Matija Pavičević
+"""
+
+import logging
+
+import numpy as np
+
+from .utils import rolling_horizons
+
+
+def preselect_block_orders(SimData, margin=0.1, diagnostics=None):
+    """
+    Fix the clearly in-the-money and out-of-the-money block orders of each horizon (BlockOrderFixed parameter)
+
+    :param SimData:         DARKO simulation data (modified in place)
+    :param margin:          Margin on the zonal price bounds, as a fraction of the highest absolute price of the zone
+    :param diagnostics:     Diagnostics collector in which the fixed block orders are recorded (optional)
+    :returns:               Dictionary with the number of (block order, horizon) pairs fixed as accepted, fixed as
+                            rejected and left as binaries
+    """
+    from ..native.model import HorizonModel, ModelData
+    from ..native.rolling import solve_relaxed
+
+    data = ModelData(SimData)
+    horizons = rolling_horizons(len(data.hours), int(SimData['config']['HorizonLength']),
+                                int(SimData['config']['LookAhead']))
+    fixed = np.zeros((len(data.sets['u']), len(horizons)))
+    blocks = np.flatnonzero(data.block > 0)
+    node = data.loc_supply[blocks].argmax(axis=1)
+    storage_initial = data.StorageInitial.copy()
+    for loop, (first, last, last_kept) in enumerate(horizons):
+        model = HorizonModel(data, first, last, storage_initial)
+        x, duals, status = solve_relaxed(model)
+        if x is None:
+            logging.warning('Block order pre-selection: the relaxation of horizon ' + str(loop + 1) + ' could not be '
+                            'solved (linprog status ' + str(status) + '), its block orders are left as binaries')
+            continue
+        storage_initial = model.value(x, 'StorageLevel')[:, last_kept - first]
+        if len(blocks) == 0:
+            continue
+        price = model.marginal(duals, 'EQ_PowerBalance_1')[node]                                  # (blocks, T)
+        spread = margin * np.abs(price).max(axis=1)
+        active = data.AvailabilityFactorBlockOrder[blocks][:, model.hours] > 0
+        low = np.where(active, price, np.inf).min(axis=1) - spread
+        high = np.where(active, price, -np.inf).max(axis=1) + spread
+        bid = data.PriceBlockOrder[blocks]
+        fixed[blocks, loop] = np.where(~active.any(axis=1), 0, np.where(bid <= low, 1, np.where(bid >= high, -1, 0)))
+
+    counts = {'accepted': int((fixed[blocks] == 1).sum()), 'rejected': int((fixed[blocks] == -1).sum()),
+              'binary': int((fixed[blocks] == 0).sum())}
+    SimData['parameters']['BlockOrderFixed']['val'] = fixed
+    if diagnostics is not None:
+        units = np.asarray(data.sets['u'], dtype=object)
+        for value, reason in [(1, 'Block order fixed as accepted by the pre-selection'),
+                              (-1, 'Block order fixed as rejected by the pre-selection')]:
+            for u, loop in zip(*np.nonzero(fixed == value)):
+                diagnostics.add('BlockOrderFixed', reason, units[u] + ' (horizon ' + str(loop + 1) + ')',
+                                level=logging.INFO)
+    logging.info('Block order pre-selection: {accepted} fixed as accepted, {rejected} fixed as rejected, {binary} left '
+                 'as binaries (block orders x horizons)'.format(**counts))
+    return counts
@@ -12,6 +12,7 @@ import sys
 import numpy as np
 import pandas as pd
 
+from ..misc.diagnostics import Diagnostics
 from ..misc.str_handler import clean_strings, shrink_to_64
 from ..common import commons
 
@@ -30,53 +31,61 @@ def warn_interconnection(data, var=''):
             data.columns[pos[1][0]]) + ' and time step ' + str(data.index[pos[0][0]]))
 
 
-def select_units(units, config):
+def select_units(units, config, diagnostics=None):
     """
     Function returning a new list of units by removing the ones that have unknown
     technology, zero capacity or unknown zone
 
     :param units:       Pandas dataframe with the original list of units
     :param config:      DARKO config dictionary
+    :param diagnostics: Diagnostics collector in which the removed units are recorded. If None, they are logged
     :return:            New list of units
     """
+    diag = Diagnostics() if diagnostics is None else diagnostics
     for unit in units.index:
-        # Default strings
-        str1 = 'Removed Unit ' + str(units.loc[unit, 'Unit'])
+        name = str(units.loc[unit, 'Unit'])
         if units.loc[unit, 'Technology'] not in commons['Technologies']:
-            logging.warning(str1 + ' since its technology is unknown')
+            diag.add('PlayersSupplySide', 'Removed units since their technology is unknown', name)
             units.drop(unit, inplace=True)
         elif units.loc[unit, 'PowerCapacity'] == 0:
-            logging.warning(str1 + ' since it has a null capacity')
+            diag.add('PlayersSupplySide', 'Removed units since they have a null capacity', name)
             units.drop(unit, inplace=True)
         elif units.loc[unit, 'Zone'] not in config['zones']:
-            logging.warning(str1 + ' since its zone (' + str(units.loc[unit, 'Zone']) + ') is not in the list of zones')
+            diag.add('PlayersSupplySide', 'Removed units since their zone is not in the list of zones',
+                     name + ' (' + str(units.loc[unit, 'Zone']) + ')')
             units.drop(unit, inplace=True)
     units.index = range(len(units))
+    if diagnostics is None:
+        diag.summary()
     return units
 
 
-def select_demands(demands, config):
+def select_demands(demands, config, diagnostics=None):
     """
     Function returning a new list of demands by removing the ones that have unknown zone or zero capacity
 
     :param demands:      Pandas dataframe with the original list of demands
     :param config:      DARKO config dictionary
+    :param diagnostics: Diagnostics collector in which the removed demands are recorded. If None, they are logged
     :return:            New list of demands
     """
+    diag = Diagnostics() if diagnostics is None else diagnostics
     for dem in demands.index:
-        # Default strings
-        str1 = 'Removed Demand ' + str(demands.loc[dem, 'Unit'])
+        name = str(demands.loc[dem, 'Unit'])
         if demands.loc[dem, 'MaxDemand'] == 0:
-            logging.warning(str1 + ' since it has a null capacity')
+            diag.add('PlayersDemandSide', 'Removed demands since they have a null capacity', name)
             demands.drop(dem, inplace=True)
         elif demands.loc[dem, 'Zone'] not in config['zones']:
-            logging.warning(str1 + ' since its zone (' + str(demands.loc[dem, 'Zone']) + ') is not in the list of zones')
+            diag.add('PlayersDemandSide', 'Removed demands since their zone is not in the list of zones',
+                     name + ' (' + str(demands.loc[dem, 'Zone']) + ')')
             demands.drop(dem, inplace=True)
     demands.index = range(len(demands))
+    if diagnostics is None:
+        diag.summary()
     return demands
 
 
-def incidence_matrix(sets, set_used, parameters, param_used):
+def incidence_matrix(sets, set_used, parameters, param_used, diagnostics=None):
     """
     This function generates the incidence matrix of the lines within the nodes.
     A particular case is considered for the node "Rest Of the World", which is no explicitly defined in DARKO
@@ -85,18 +94,22 @@ def incidence_matrix(sets, set_used, parameters, param_used):
     :param set_used:    considered sets
     :param parameters:  all parameters
     :param param_used:  parameters used
+    :param diagnostics: Diagnostics collector in which the unrecognized lines are recorded. If None, they are logged
     """
+    diag = Diagnostics() if diagnostics is None else diagnostics
     for i in range(len(sets[set_used])):
         [from_node, to_node] = sets[set_used][i].split('->')
         if (from_node.strip() in sets['n']) and (to_node.strip() in sets['n']):
             parameters[param_used]['val'][i, sets['n'].index(to_node.strip())] = 1
             parameters[param_used]['val'][i, sets['n'].index(from_node.strip())] = -1
         else:
-            logging.warning("The line " + str(sets[set_used][i]) + " contains unrecognized nodes")
+            diag.add(param_used, 'Lines containing unrecognized nodes', sets[set_used][i])
+    if diagnostics is None:
+        diag.summary()
     return parameters[param_used]
 
 
-def interconnections(Simulation_list, NTC_inter, Historical_flows):
+def interconnections(Simulation_list, NTC_inter, Historical_flows, diagnostics=None):
     """
     Function that checks for the possible interconnections of the zones included
     in the simulation. If the interconnections occurs between two of the zones
@@ -109,7 +122,10 @@ def interconnections(Simulation_list, NTC_inter, Historical_flows):
     :param Simulation_list:     List of simulated zones
     :param NTC_inter:           Day-ahead net transfer capacities (pd dataframe)
     :param Historical_flows:    Historical flows (pd dataframe)
+    :param diagnostics:         Diagnostics collector in which the detected lines are recorded. If None, they are
+                                logged
     """
+    diag = Diagnostics() if diagnostics is None else diagnostics
     index = NTC_inter.index.tz_localize(None).intersection(Historical_flows.index.tz_localize(None))
     if len(index) == 0:
         logging.error(
@@ -144,17 +160,15 @@ def interconnections(Simulation_list, NTC_inter, Historical_flows):
     for interconnection in simulation_connections:
         if interconnection in NTC_inter.columns:
             df_zones_simulated[interconnection] = NTC_inter[interconnection]
-            logging.info(
-                'Detected interconnection ' + interconnection + '. The historical NTCs will be imposed as maximum '
-                                                                'flow value')
+            diag.add('Interconnections', 'Detected interconnections between simulated zones. The historical NTCs '
+                                         'will be imposed as maximum flow value', interconnection, level=logging.INFO)
     interconnections1 = df_zones_simulated.columns
 
     # Display a warning if a zone is isolated:
     for z in Simulation_list:
         if not any([z in conn for conn in interconnections1]) and len(Simulation_list) > 1:
-            logging.warning(
-                'Zone ' + z + 'does not appear to be connected to any other zone in the NTC table. It should be '
-                              'simulated in isolation')
+            diag.add('Interconnections', 'Zones not connected to any other zone in the NTC table. They should be '
+                                         'simulated in isolation', z)
 
     df_RoW_temp = pd.DataFrame(index=index)
     connNames = []
@@ -173,16 +187,15 @@ def interconnections(Simulation_list, NTC_inter, Historical_flows):
         nameToCompare = compare_set.pop()
         exports = []
         imports = []
-        str1 = 'Detected interconnection '
-        str2 = ', happening between a simulated zone and the rest of the world. The historical flows will be imposed ' \
-               'to the model'
+        reason = 'Detected interconnections between a simulated zone and the rest of the world. The historical ' \
+                 'flows will be imposed to the model'
         for name in connNames:
             if nameToCompare[0:2] in name[0:2]:
                 exports.append(connNames.index(name))
-                logging.info(str1 + name + str2)
+                diag.add('Interconnections', reason, name, level=logging.INFO)
             elif nameToCompare[0:2] in name[6:8]:
                 imports.append(connNames.index(name))
-                logging.info(str1 + name + str2)
+                diag.add('Interconnections', reason, name, level=logging.INFO)
 
         def concat_imp_exp(variable, type):
             flows = pd.concat(df_RoW_temp[connNames[variable[i]]] for i in range(len(variable)))
@@ -198,9 +211,68 @@ def interconnections(Simulation_list, NTC_inter, Historical_flows):
 
     interconnections2 = df_zones_RoW.columns
     inter = list(interconnections1) + list(interconnections2)
+    if diagnostics is None:
+        diag.summary()
     return df_zones_simulated, df_zones_RoW, inter
 
 
+def rolling_horizons(n_hours, horizon_length, look_ahead):
+    """
+    Optimization horizons of the rolling horizon loop, as defined in DARKO.gms
+
+    :param n_hours:         Number of hours of the simulation, including the last look-ahead period (card(h))
+    :param horizon_length:  Length of each horizon, in days (RollingHorizon Length)
+    :param look_ahead:      Length of the look-ahead period, in days (RollingHorizon LookAhead)
+    :returns:               List of (FirstHour, LastHour, LastKeptHour) tuples (1-based hour numbers)
+    """
+    ndays = n_hours // 24
+    if look_ahead > ndays - 1:
+        logging.critical('The look ahead period is longer than the simulation length')
+        sys.exit(1)
+    horizons = []
+    for day in range(1, ndays - look_ahead + 1, horizon_length):
+        first = (day - 1) * 24 + 1
+        last = min(n_hours, first + (horizon_length + look_ahead) * 24 - 1)
+        horizons.append((first, last, last - look_ahead * 24))
+    if len(horizons) > 10000:
+        logging.critical('Number of loops is longer than the maximum allowed')
+        sys.exit(1)
+    return horizons
+
+
+def active_entities(parameters, sets, horizons):
+    """
+    Units, demands and lines that are active in each horizon of the rolling horizon loop. An entity is inactive in a
+    horizon if nothing can be cleared or transmitted in any of its hours (including the look-ahead period): zero
+    availability factors or capacity for the orders, zero maximum and minimum flows for the lines (e.g. seasonal
+    units or lines under outage). The storage units are always active.
+
+    :param parameters:      DARKO parameters (SimData['parameters'])
+    :param sets:            DARKO sets
+    :param horizons:        Optimization horizons, as returned by rolling_horizons
+    :returns:               Dictionary with the ActiveUnit (u, rh), ActiveDemand (d, rh) and ActiveLine (l, rh)
+                            arrays (1: active, 0: inactive)
+    """
+    def val(name):
+        return np.abs(np.asarray(parameters[name]['val'], dtype=float))
+
+    capacity = val('PowerCapacity')
+    supply = ((val('AvailabilityFactorSimpleOrder') + val('AvailabilityFactorBlockOrder')) * capacity[:, None] +
+              (val('AvailabilityFactorFlexibleOrder') * capacity)[:, None]) > 0
+    storage = np.isin(np.asarray(sets['u'], dtype=object), list(sets['s']))
+    demand = val('AvailabilityFactorDemandOrder') * val('MaxDemand')[:, None] > 0
+    flow = val('FlowMaximum') + val('FlowMinimum') > 0
+
+    active = {'ActiveUnit': np.zeros((len(sets['u']), len(horizons))),
+              'ActiveDemand': np.zeros((len(sets['d']), len(horizons))),
+              'ActiveLine': np.zeros((len(sets['l']), len(horizons)))}
+    for loop, (first, last, __) in enumerate(horizons):
+        active['ActiveUnit'][:, loop] = supply[:, first - 1:last].any(axis=1) | storage
+        active['ActiveDemand'][:, loop] = demand[:, first - 1:last].any(axis=1)
+        active['ActiveLine'][:, loop] = flow[:, first - 1:last].any(axis=1)
+    return active
+
+
 # Helper functions
 def _mylogspace(low, high, N):
     """
@@ -37,10 +37,11 @@ The advantage of the low level API is that it can easily be installed from pip::
 import os
 import shutil
 import logging
+import tempfile
 
-from .misc.gdx_handler import get_gams_path, import_local_lib, package_exists
+from .misc.gdx_handler import get_gams_path, get_gdx, import_local_lib, package_exists
 from .misc.gms_handler import solve_high_level, solve_low_level
-from .common import commons, set_log_name
+from .common import commons, log_to_folder
 
 
 def is_sim_folder_ok(sim_folder):
@@ -48,7 +49,7 @@ def is_sim_folder_ok(sim_folder):
     Function that checks if the provided path is a valid DARKO simulation folder.
     The following files are required:
 
-        - Inputs.gdx
+        - Inputs.gdx (or InputsDelta.gms and the base inputs for a scenario variant)
         - DARKO.gms
 
     :param sim_folder: path (absolute or relative) to the simulation folder
@@ -61,7 +62,16 @@ def is_sim_folder_ok(sim_folder):
     str2 = ' file within the specified DARKO simulation environment folder (' + sim_folder + ').'
     str3 = ' Check that the GDX output is activated in the option file and no error is stated during the pre-processing'
 
-    if not os.path.exists(os.path.join(sim_folder, u'Inputs.gdx')):
+    delta = os.path.join(sim_folder, u'InputsDelta.gms')
+    if os.path.exists(delta):
+        # Scenario variant: the base inputs are loaded from the base simulation folder
+        with open(delta) as f:
+            base_gdx = f.readline().split(': ', 1)[-1].strip()
+        if not os.path.exists(base_gdx):
+            logging.error('The base inputs ' + base_gdx + ' of the DARKO simulation environment folder (' +
+                          sim_folder + ') do not exist')
+            return False
+    elif not os.path.exists(os.path.join(sim_folder, u'Inputs.gdx')):
         logging.error(str1 + 'Inputs.gdx' + str2 + str3)
         return False
     if not os.path.exists(os.path.join(sim_folder, u'DARKO.gms')):
@@ -99,16 +109,51 @@ def solve_GAMS(sim_folder, gams_folder=None, gams_file='DARKO.gms', result_file=
     gams_folder = os.path.abspath(gams_folder)
 
     if is_sim_folder_ok(sim_folder):
-        # Temporary warning for Spyder users:
-        if any(['SPY_' in name for name in os.environ]):  # check if spyder
-            logging.info(
-                "\nIf the script seems stuck at this place \n(gams is optimizing but not output is displayed), "
-                "\nit is preferable to run DARKO in a \nseparate terminal (in Spyder: Preferences - Run - \nExecute "
-                "in an external system terminal)")
-        ret = solv_func(gams_folder, sim_folder, gams_file, result_file, output_lst=output_lst)
-        if os.path.isfile(os.path.join(sim_folder, 'debug.gdx')):
-            logging.warning('A debug file was created. There has probably been an optimization error')
-        set_log_name(sim_folder, 'warn_solve')
+        with log_to_folder(sim_folder, 'warn_solve'):
+            # Temporary warning for Spyder users:
+            if any(['SPY_' in name for name in os.environ]):  # check if spyder
+                logging.info(
+                    "\nIf the script seems stuck at this place \n(gams is optimizing but not output is displayed), "
+                    "\nit is preferable to run DARKO in a \nseparate terminal (in Spyder: Preferences - Run - "
+                    "\nExecute in an external system terminal)")
+            ret = solv_func(gams_folder, sim_folder, gams_file, result_file, output_lst=output_lst)
+            if os.path.isfile(os.path.join(sim_folder, 'debug.gdx')):
+                logging.warning('A debug file was created. There has probably been an optimization error')
         return ret
     else:
         return False
+
+
+def solve_simdata(SimData, sim_folder=None, gams_folder=None, keep_folder=False):
+    """
+    Function used to solve a DARKO simulation kept in memory (SimData dictionary returned by
+    build_simulation(config, write=False)) and return the raw results without going through a user-managed
+    simulation environment.
+
+    GAMS can only read its inputs from a gdx file: if no simulation folder is provided, the gdx and gms files are
+    written to a temporary scratch folder that is removed once the results have been read.
+
+    :param SimData:         DARKO simulation data (dictionary with sets, parameters, config, ...)
+    :param sim_folder:      Optional folder in which the simulation environment is written. Temporary if None
+    :param gams_folder:     path to the gams folder. If not provided, the script will try to find it automatically
+    :param keep_folder:     Set to True to keep the temporary scratch folder (e.g. for debugging)
+    :returns:               Dictionary with the raw results (dataframes indexed by hour number) or False
+    """
+    from .preprocessing.preprocessing import write_simulation_environment
+
+    scratch = sim_folder is None
+    if scratch:
+        sim_folder = tempfile.mkdtemp(prefix='darko_')
+    if gams_folder is None:
+        gams_folder = SimData['config'].get('GAMS_folder')
+    try:
+        write_simulation_environment(SimData, sim_folder, gdx=True, pickle_file=not scratch)
+        ret = solve_GAMS(sim_folder, gams_folder=gams_folder)
+        if not ret or not os.path.isfile(os.path.join(sim_folder, 'Results.gdx')):
+            logging.error('The simulation could not be solved, no result file was produced in ' + sim_folder)
+            return False
+        gams_dir = get_gams_path(gams_folder)
+        return get_gdx(gams_dir, os.path.join(sim_folder, 'Results.gdx'))
+    finally:
+        if scratch and not keep_folder:
+            shutil.rmtree(sim_folder, ignore_errors=True)
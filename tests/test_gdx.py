@@ -0,0 +1,56 @@
+import os
+import gdxcc
+import numpy as np
+from darko.misc.gdx_handler import get_gams_path, gdx_to_arrays, gdx_to_dataframe, gdx_to_list, write_variables
+
+
+def test_write_gdx(tmpdir):
+    gams_dir = get_gams_path()
+    sets = {'u': ['U1', 'U2', 'U3'], 'h': ['1', '2', '3', '4'], 'z': ['1', '2']}
+    val = np.zeros((3, 4))
+    val[0, 1] = 1.5
+    val[2, 0] = -2
+    val[2, 3] = np.nan  # not written
+    parameters = {'Param': {'sets': ['u', 'h'], 'val': val},
+                  'Bool': {'sets': ['u'], 'val': np.array([True, False, True])}}
+    gdx_file = os.path.join(str(tmpdir), 'Inputs.gdx')
+    write_variables(os.path.join(gams_dir, 'gams'), gdx_file, [sets, parameters])
+    out = gdx_to_list(gams_dir, gdx_file, varname='all', verbose=False)
+    assert [x[0] for x in out['z']] == ['1', '2']
+    assert sorted(out['Param']) == [['U1', '2', 1.5], ['U3', '1', -2.0]]
+    assert sorted(out['Bool']) == [['U1', 1.0], ['U3', 1.0]]
+
+
+def test_read_gdx(tmpdir):
+    gams_dir = get_gams_path()
+    sets = {'u': ['U1', 'U2'], 'n': ['Z1', 'Z2'], 'h': ['1', '2', '3']}
+    val = np.arange(12, dtype=float).reshape(2, 2, 3)
+    parameters = {'Param3D': {'sets': ['u', 'n', 'h'], 'val': val}}
+    gdx_file = os.path.join(str(tmpdir), 'Results.gdx')
+    write_variables(os.path.join(gams_dir, 'gams'), gdx_file, [sets, parameters])
+    out = gdx_to_dataframe(gdx_to_arrays(gams_dir, gdx_file), fixindex=True)
+    df = out['Param3D']
+    assert df.index.tolist() == [1, 2, 3]
+    assert df.columns.tolist() == [('U1', 'Z1'), ('U1', 'Z2'), ('U2', 'Z1'), ('U2', 'Z2')]
+    assert df[('U2', 'Z1')].tolist() == [6, 7, 8]
+    assert df[('U1', 'Z1')].tolist() == [0, 1, 2]  # zero value not written, filled with 0
+    assert out['u'].index.tolist() == ['U1', 'U2']
+
+
+def test_read_gdx_scalar(tmpdir):
+    gams_dir = get_gams_path()
+    gdx_file = os.path.join(str(tmpdir), 's.gdx')
+    gdxHandle = gdxcc.new_gdxHandle_tp()
+    gdxcc.gdxCreateD(gdxHandle, gams_dir, gdxcc.GMS_SSSIZE)
+    gdxcc.gdxOpenWrite(gdxHandle, gdx_file, '')
+    gdxcc.gdxDataWriteStrStart(gdxHandle, 'a', '', 0, gdxcc.GMS_DT_PAR, 0)
+    values = gdxcc.doubleArray(gdxcc.GMS_VAL_MAX)
+    values[gdxcc.GMS_VAL_LEVEL] = 3
+    gdxcc.gdxDataWriteStr(gdxHandle, [], values)
+    gdxcc.gdxDataWriteDone(gdxHandle)
+    gdxcc.gdxClose(gdxHandle)
+    # Scalars are skipped, with the list format as with the array format:
+    records = gdx_to_list(gams_dir, gdx_file, varname='all', verbose=False)
+    assert records['a'] == [[3.0]]
+    assert 'a' not in gdx_to_dataframe(records)
+    assert 'a' not in gdx_to_dataframe(gdx_to_arrays(gams_dir, gdx_file))
@@ -11,3 +11,135 @@ def test_read_results_dicts():
     inputs, results = dk.get_sim_results(path=SIM_DIR, return_status=False, write_excel=False)
     assert isinstance(inputs, dict)
     assert isinstance(results, dict)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_format_results_in_memory():
+    import pandas as pd
+    from darko.misc.gdx_handler import get_gams_path, get_gdx
+    inputs, results = dk.get_sim_results(path=SIM_DIR, return_status=False, write_excel=False)
+    SimData = dk.format_inputs(pd.read_pickle(os.path.join(SIM_DIR, 'Inputs.p')))
+    raw = get_gdx(get_gams_path(), os.path.join(SIM_DIR, 'Results.gdx'))
+    results_mem, status = dk.format_results(SimData, raw)
+    assert 'status' in status
+    pd.testing.assert_frame_equal(results['OutputMarginalPrice'], results_mem['OutputMarginalPrice'])
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_read_results_lazy():
+    import pandas as pd
+    inputs, results, status = dk.get_sim_results(path=SIM_DIR, return_status=True, write_excel=False)
+    inputs, lazy, lazy_status = dk.get_sim_results(path=SIM_DIR, return_status=True, write_excel=False, lazy=True)
+    assert sorted(lazy) == sorted(results)
+    loaded = lazy.load(['OutputMarginalPrice', 'OutputFlow'])
+    pd.testing.assert_frame_equal(loaded['OutputFlow'], results['OutputFlow'])
+    for key in results:
+        if isinstance(results[key], pd.DataFrame):
+            pd.testing.assert_frame_equal(lazy[key], results[key])
+        elif isinstance(results[key], pd.Series):
+            pd.testing.assert_series_equal(lazy[key], results[key])
+        else:
+            assert lazy[key] == results[key]
+    pd.testing.assert_frame_equal(lazy_status['status'], status['status'])
+    lazy.close()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_read_results_cache(tmpdir):
+    import pandas as pd
+    inputs, results = dk.get_sim_results(path=SIM_DIR, write_excel=False)
+    for i in range(2):  # first call writes the cache, second one reads it
+        inputs, cached = dk.get_sim_results(path=SIM_DIR, write_excel=False, cache=True, temp_path=str(tmpdir))
+        assert sorted(cached) == sorted(results)
+        pd.testing.assert_frame_equal(cached['OutputMarginalPrice'], results['OutputMarginalPrice'], check_freq=False)
+    assert os.path.isfile(os.path.join(str(tmpdir), 'cache.json'))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_export_results(tmpdir):
+    import pandas as pd
+    from darko.postprocessing.export import export_results
+    inputs, results = dk.get_sim_results(path=SIM_DIR, write_excel=False)
+    formats = ['csv', 'excel']
+    try:
+        import pyarrow
+        formats.append('parquet')
+    except ImportError:
+        pass
+    assert export_results(results, str(tmpdir), formats=formats)
+    assert os.path.isfile(os.path.join(str(tmpdir), 'Results.xlsx'))
+    price = pd.read_csv(os.path.join(str(tmpdir), 'Results_csv', 'OutputMarginalPrice.csv.gz'), index_col=0,
+                        parse_dates=True)
+    pd.testing.assert_frame_equal(price, results['OutputMarginalPrice'], check_freq=False, check_dtype=False)
+    import xlrd
+    sheet = xlrd.open_workbook(os.path.join(str(tmpdir), 'Results.xlsx')).sheet_by_name('MarginalPrice')
+    assert (sheet.nrows - 1, sheet.ncols - 1) == results['OutputMarginalPrice'].shape
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_read_results_xarray(tmpdir):
+    import shutil
+    xr = pytest.importorskip('xarray')
+    inputs, results = dk.get_sim_results(path=SIM_DIR, write_excel=False)
+    path = os.path.join(str(tmpdir), 'sim')
+    shutil.copytree(SIM_DIR, path)
+    for i in range(2):  # first call writes Results.nc, second one reads it
+        inputs, ds = dk.get_sim_results(path=path, return_xarray=True)
+        assert isinstance(ds, xr.Dataset)
+        price = results['OutputMarginalPrice']
+        assert ds['OutputMarginalPrice'].dims == ('hour', 'node')
+        assert (ds['OutputMarginalPrice'].sel(hour=price.index, node=list(price.columns)).values == price.values).all()
+        ds.close()
+    assert os.path.isfile(os.path.join(path, 'Results.nc'))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_param_df_views():
+    import numpy as np
+    import pandas as pd
+    inputs = pd.read_pickle(os.path.join(SIM_DIR, 'Inputs.p'))
+    param_df = dk.dk_to_df(inputs)
+    assert 'sets' in param_df and 'PriceDemandOrder' in param_df
+    for p in ['PriceDemandOrder', 'AvailabilityFactorDemandOrder']:
+        df = param_df[p]
+        assert list(df.columns) == list(inputs['sets'][inputs['parameters'][p]['sets'][0]])
+        assert np.shares_memory(df.values, inputs['parameters'][p]['val'])
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_format_raw_results():
+    import pandas as pd
+    from darko.misc.gdx_handler import get_gams_path, gdx_to_arrays, gdx_to_dataframe
+    from darko.postprocessing.data_handler import format_raw_results
+    inputs = dk.format_inputs(pd.read_pickle(os.path.join(SIM_DIR, 'Inputs.p')))
+    raw = gdx_to_arrays(get_gams_path(), os.path.join(SIM_DIR, 'Results.gdx'))
+    results, status = format_raw_results(inputs, raw)
+    expected, __ = dk.format_results(inputs, gdx_to_dataframe(raw, fixindex=True))
+    assert sorted(results) == sorted(expected)
+    for key, data in expected.items():
+        if isinstance(data, pd.DataFrame):
+            pd.testing.assert_frame_equal(results[key], data, check_freq=False)
+        elif isinstance(data, pd.Series):
+            pd.testing.assert_series_equal(results[key], data, check_freq=False)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher due to incompatible pickle file in tests.")
+def test_load_many(tmpdir):
+    import shutil
+    import pandas as pd
+    inputs, results = dk.get_sim_results(path=SIM_DIR, write_excel=False)
+    paths = {}
+    for name in ['base', 'variant']:
+        paths[name] = os.path.join(str(tmpdir), name)
+        shutil.copytree(SIM_DIR, paths[name])
+    out = dk.load_many(paths, ['OutputMarginalPrice', 'OutputTotalWelfare'], workers=2)
+    assert list(out['OutputMarginalPrice'].columns.get_level_values('scenario').unique()) == ['base', 'variant']
+    pd.testing.assert_frame_equal(out['OutputMarginalPrice']['variant'], results['OutputMarginalPrice'],
+                                  check_freq=False, check_names=False)
+    assert out['OutputTotalWelfare'].shape == (len(results['OutputTotalWelfare']), 2)
+    # Folders with the same name are named by their relative paths:
+    for name in ['a', 'b']:
+        shutil.copytree(SIM_DIR, os.path.join(str(tmpdir), 'sweep', name, 'sim'))
+    out = dk.load_many([os.path.join(str(tmpdir), 'sweep', name, 'sim') for name in ['a', 'b']],
+                       'OutputMarginalPrice', workers=1)
+    assert list(out['OutputMarginalPrice'].columns.get_level_values('scenario').unique()) == ['a/sim', 'b/sim']
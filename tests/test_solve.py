@@ -1,8 +1,20 @@
+import copy
 import os
+
+import numpy as np
+import pandas as pd
 import pytest
+
 import darko as dk
+from darko.misc.gdx_handler import get_gams_path, get_gdx
+from darko.native import HorizonModel, ModelData, affected_horizons, solve_horizon
+from darko.native.decomposition import ZonalDecomposition, solve_decomposed
+from darko.postprocessing.data_handler import disaggregate_symbol
+from darko.preprocessing.aggregation import aggregate_orders
+from darko.preprocessing.preselection import preselect_block_orders
 
 conf_file = os.path.abspath('./tests/ConfigTest.xlsx')
+dummy_sim = os.path.abspath('./tests/dummy_results')
 
 
 @pytest.fixture
@@ -13,11 +25,24 @@ def config():
     return config
 
 
+@pytest.fixture
+def simdata():
+    """Inputs of the dummy simulation, for the native backend (requires scipy >= 1.9)"""
+    pytest.importorskip('scipy', minversion='1.9')
+    return pd.read_pickle(os.path.join(dummy_sim, 'Inputs.p'))
+
+
 def test_build(config, tmpdir):
     # Using temp dir to ensure that each time a new directory is used
     config['SimulationDirectory'] = str(tmpdir)
     SimData = dk.build_simulation(config)
     assert isinstance(SimData, dict)  # how to test if sucessful build?
+    assert os.path.isfile(os.path.join(str(tmpdir), 'Diagnostics.json'))
+    registry = SimData['registry']
+    assert registry.units.names.tolist() == SimData['sets']['u']
+    for z in SimData['sets']['n']:
+        assert registry.units.names_where('Zone', z) == SimData['units'].loc[SimData['units']['Zone'] == z,
+                                                                             'Unit'].tolist()
 
 
 @pytest.mark.skipif('TRAVIS' in os.environ,
@@ -27,3 +52,152 @@ def test_solve_gams(config):
     # Test solve function
     r = dk.solve_GAMS(config['SimulationDirectory'])
     assert r
+
+
+def test_build_many(config, tmpdir):
+    # Two independent builds running concurrently, each in its own simulation directory
+    configs = []
+    for i in range(2):
+        conf = dict(config)
+        conf['SimulationDirectory'] = str(tmpdir.join('sim' + str(i)))
+        configs.append(conf)
+    sims = dk.build_many(configs, workers=2)
+    for sim in sims:
+        assert os.path.isfile(os.path.join(sim, 'Inputs.gdx'))
+        assert os.path.isfile(os.path.join(sim, 'warn_preprocessing.log'))
+
+
+@pytest.mark.parametrize('ext', ['.json', '.yml'])
+def test_config_export(tmpdir, ext):
+    if ext == '.yml':
+        pytest.importorskip('yaml')
+    exported = os.path.join(str(tmpdir), 'ConfigTest' + ext)
+    dk.export_config(conf_file, exported)
+    ref = dk.load_config(conf_file, AbsPath=False, cache=False)
+    config = dk.load_config(exported, AbsPath=False)
+    for key in ['SimulationDirectory', 'StartDate', 'StopDate', 'HorizonLength', 'zones', 'default', 'NTC']:
+        assert config[key] == ref[key]
+    # Second call is served from the compiled config cache:
+    assert dk.load_config(exported, AbsPath=False) == config
+
+
+def test_build_delta(tmpdir):
+    base = os.path.join(str(tmpdir), 'base')
+    config = dk.load_config_excel(conf_file)
+    config['SimulationDirectory'] = base
+    dk.build_simulation(config)
+    config = dk.load_config_excel(conf_file)
+    config['default']['NodeHourlyRampUp'] = 0.123
+    config['SimulationDirectory'] = os.path.join(str(tmpdir), 'variant')
+    dk.build_simulation(config, base=base)
+    variant = config['SimulationDirectory']
+    assert not os.path.isfile(os.path.join(variant, 'Inputs.gdx'))
+    with open(os.path.join(variant, 'InputsDelta.gms')) as f:
+        assert '$LOAD NodeHourlyRampUp\n' in f.readlines()
+    assert dk.solve.is_sim_folder_ok(variant)
+
+
+def test_solve_native(simdata):
+    raw = dk.solve_native(simdata)
+    assert (raw['status']['model'] == 1).all()
+    # Same prices as the GAMS solution of the dummy simulation:
+    ref = get_gdx(get_gams_path(), os.path.join(dummy_sim, 'Results.gdx'))
+    pd.testing.assert_frame_equal(raw['OutputMarginalPrice'], ref['OutputMarginalPrice'], check_dtype=False,
+                                  check_index_type=False)
+    # Warm start from the solution of a base scenario (here the same simulation):
+    warm = dk.solve_native(simdata, start=raw)
+    pd.testing.assert_frame_equal(warm['OutputMarginalPrice'], raw['OutputMarginalPrice'])
+    # Two-phase parallel mode: with the repair pass, the storage levels are carried as in the sequential loop
+    parallel = dk.solve_native(simdata, parallel=True, workers=2)
+    pd.testing.assert_frame_equal(parallel['OutputMarginalPrice'], raw['OutputMarginalPrice'])
+    results, status = dk.format_results(dk.format_inputs(simdata), raw)
+    assert results['OutputMarginalPrice'].shape == (168, len(simdata['sets']['n']))
+    # The raw results are not modified and can still be used as start:
+    assert 'status' in raw and raw['OutputMarginalPrice'].index.equals(ref['OutputMarginalPrice'].index)
+
+
+def test_solve_relaxed(simdata):
+    simdata['config'] = dict(simdata['config'], RelaxedMode=1, RelaxedGapSample=3)
+    raw = dk.solve_native(simdata)
+    # The LP relaxation is an upper bound of the welfare of the MIP (gap computed for horizons 1, 4 and 7):
+    assert list(raw['OutputRelaxationGap'].index) == [1, 4, 7]
+    assert (raw['OutputRelaxationGap'] >= -1e-9).all()
+
+
+def test_preselect_block_orders(simdata):
+    ref = dk.solve_native(simdata)
+    simdata['parameters']['BlockOrderFixed'] = {'sets': ['u', 'rh'], 'val': None}
+    counts = preselect_block_orders(simdata, margin=0.1)
+    assert counts['accepted'] + counts['rejected'] > 0
+    # The fixed block orders do not change the clearing of the MIP:
+    raw = dk.solve_native(simdata)
+    pd.testing.assert_frame_equal(raw['OutputMarginalPrice'], ref['OutputMarginalPrice'])
+
+
+def test_active_entities(simdata):
+    data = ModelData(simdata)
+    assert data.ActiveLine.shape == (len(simdata['sets']['l']), 7)
+    assert not data.ActiveLine[:, 0].all()  # lines without capacity in the first horizon
+    full = HorizonModel(data, 1, 48, data.StorageInitial)
+    model = HorizonModel(data, 1, 48, data.StorageInitial, loop=0)
+    assert len(model.reduced().cols) < len(model.c)
+    # Same welfare and prices without the columns of the inactive lines:
+    x, duals, status = solve_horizon(model)
+    x_full, duals_full, __ = solve_horizon(full)
+    assert np.isclose(model.value(x, 'TotalWelfare')[0], full.value(x_full, 'TotalWelfare')[0])
+    np.testing.assert_allclose(model.marginal(duals, 'EQ_PowerBalance_1'),
+                               full.marginal(duals_full, 'EQ_PowerBalance_1'))
+
+
+def test_aggregate_orders():
+    idx = pd.date_range('2016-01-01', periods=3, freq='h')
+    plants = pd.DataFrame({'Unit': ['A', 'B', 'C', 'E', 'W1', 'W2'], 'Zone': 'Z1', 'OrderType': 'Simple',
+                           'Technology': ['HOBO'] * 4 + ['SOTH'] * 2, 'UnitRampUp': .5, 'UnitRampDown': .5,
+                           'PowerCapacity': [10., 30., 5., 20., 10., 10.]})
+    demands = pd.DataFrame({'Unit': ['D1', 'D2'], 'Zone': 'Z1', 'Sector': ['REZ', 'IND'], 'MaxDemand': [5., 5.]})
+    tables = {'AvailabilityFactorSimpleOrder': pd.DataFrame({'A': 1., 'B': 1., 'C': 1., 'E': [1., 0., .5],
+                                                             'W1': [1., 0., .5], 'W2': [0., 1., 1.]}, idx),
+              'PriceSimpleOrder': pd.DataFrame({'A': 10., 'B': 10., 'C': 20., 'E': 10., 'W1': 0., 'W2': 0.}, idx),
+              'AvailabilityFactorDemandOrder': pd.DataFrame({'D1': 1., 'D2': 1.}, idx),
+              'PriceDemandOrder': pd.DataFrame({'D1': 50., 'D2': 50.}, idx)}
+    plants, demands, tables, aggregation = aggregate_orders(plants, demands, tables)
+    # A and B have the same prices and availability factors and are merged, C (other price), E (other availability
+    # factors, subject to the ramping constraints) and the demands (other sectors) are kept. The renewable units W1
+    # and W2 (no ramping constraints) are merged although their availability factors differ:
+    assert plants['Unit'].tolist() == ['AGG_A', 'C', 'E', 'AGG_W1']
+    assert plants['PowerCapacity'].tolist() == [40, 5, 20, 20]
+    assert len(demands) == 2 and aggregation['d'].shape[1] == 0
+    np.testing.assert_allclose(tables['AvailabilityFactorSimpleOrder']['AGG_A'], 1)
+    np.testing.assert_allclose(tables['AvailabilityFactorSimpleOrder']['AGG_W1'], [.5, .5, .75])
+    # The aggregate ramps at its limit (0.5 * 40 MW per hour). Split pro rata, each member ramps at its own limit:
+    cleared = pd.DataFrame({'AGG_A': [0., 20., 40.], 'C': 0., 'E': 0., 'AGG_W1': [10., 10., 15.]}, idx)
+    split = disaggregate_symbol('OutputClearedSimple', cleared, aggregation)
+    np.testing.assert_allclose(split[['A', 'B']].diff().values[1:], [[5, 15], [5, 15]])
+    np.testing.assert_allclose(split[['W1', 'W2']].values, [[10, 0], [0, 10], [5, 10]])
+    assert 'AGG_A' not in split and 'AGG_W1' not in split
+
+
+def test_solve_whatif(simdata):
+    base = dk.solve_native(simdata)
+    variant = copy.deepcopy(simdata)
+    variant['parameters']['PriceDemandOrder']['val'][0, 72:96] *= 0.5  # fourth day
+    # Horizons of one day with one day of look-ahead: the third and fourth horizons contain the fourth day
+    np.testing.assert_array_equal(affected_horizons(simdata, variant), [0, 0, 1, 1, 0, 0, 0])
+    raw = dk.solve_whatif(variant, simdata, base)
+    ref = dk.solve_native(variant)
+    pd.testing.assert_frame_equal(raw['OutputMarginalPrice'], ref['OutputMarginalPrice'])
+    pd.testing.assert_frame_equal(raw['OutputStorageLevel'], ref['OutputStorageLevel'])
+
+
+def test_solve_decomposed(simdata):
+    data = ModelData(simdata)
+    model = HorizonModel(data, 1, 48, data.StorageInitial)
+    x, duals, status = solve_horizon(model)
+    # The zonal objectives add up to the total welfare:
+    dec = ZonalDecomposition(model)
+    assert len(dec.subproblems) == len(simdata['sets']['n'])
+    assert np.isclose(dec.c @ x, -x[model.columns['TotalWelfare']][0])
+    # Not converged after 3 iterations: monolithic fallback, with the telemetry of the iterations
+    x2, duals2, status2, telemetry = solve_decomposed(model, max_iter=3, workers=1)
+    assert len(telemetry) == 3
+    np.testing.assert_allclose(model.marginal(duals2, 'EQ_PowerBalance_1'), model.marginal(duals, 'EQ_PowerBalance_1'))